@@ -0,0 +1,135 @@
+"""Quick-add parser: parity with the original cascade, and throughput.
+
+Runs every phrase of quick_add_corpus.txt (a synthetic set of Russian and
+English /add texts, malformed times, dates and durations included; regenerate
+it with make_quick_add_corpus.py, seed 2026) through quick_add.parse_quick_add
+and through the pre-rewrite parser in quick_add_reference.py, on a set of fixed
+"today" dates (every weekday, month and year ends, leap day), and requires
+identical results, exceptions included. --fuzz adds random token soups built
+from the same vocabulary plus odd casing and non-ASCII digits. Then times both.
+
+    python benchmarks/bench_quick_add.py [--rounds 5] [--fuzz 20000] [--corpus FILE]
+
+Exits with status 1 on any mismatch.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+import quick_add  # noqa: E402
+import quick_add_reference as reference  # noqa: E402
+
+TODAYS = [date(2026, 10, 12) + timedelta(days=k) for k in range(7)] + [
+    date(2026, 12, 31), date(2027, 1, 1), date(2028, 2, 28), date(2028, 2, 29), date(2026, 5, 31),
+]
+FUZZ_TOKENS = [
+    "в", "во", "на", "dur", "duration", "длительность", "через", "каждый", "каждую", "по", "день", "дня",
+    "неделю", "месяц", "год", "будням", "будни", "ежедневно", "Weekly", "сегодня", "ЗАВТРА", "tomorrow",
+    "послезавтра", "пн", "Пт", "воскресенье", "мая", "сент", "дек", "2", "15", "31", "2027", "26", "1,5",
+    "0.5", "nan", "1e2", "1_0", "мин", "ч", "часа", "hours", "days", "недели", "weeks", "д", "3д", "2нед",
+    "5w", "12:30", "7PM", "12am", "в9.30", "0930", "2400", "1:5", "٣:٤٥", "١٢٣٠", "@15m", "2H", "5mİn",
+    "1d", "2ч30м", "1.5ч", "45мин", "~~10м", "dur:1h30m", "duration:2часа", "90минут", "12.05", "1/2/25",
+    "31.02", "2026-13-45", "#tag", "#", "##x", "#Тег", "!1", "!3", "!4", "!", "купить", "Call", "mom", "—",
+]
+
+
+def load_corpus(path: str) -> list[str]:
+    with open(path, encoding="utf-8") as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
+
+
+def fuzz_phrases(n: int, seed: int = 7) -> list[str]:
+    rnd = random.Random(seed)
+    return [" ".join(rnd.choice(FUZZ_TOKENS) for _ in range(rnd.randint(1, 8))) for _ in range(n)]
+
+
+def outcome(fn, *args):
+    try:
+        return fn(*args)
+    except Exception as e:
+        return ("raised", type(e).__name__, str(e))
+
+
+def check_parity(phrases: list[str]) -> int:
+    real_date = reference.date
+    mismatches = 0
+    try:
+        for day in TODAYS:
+            class FixedDate(real_date):
+                @classmethod
+                def today(cls, _d=day):
+                    return real_date(_d.year, _d.month, _d.day)
+
+            reference.date = FixedDate
+            for text in phrases:
+                want = outcome(reference._parse_quick_add_text, text)
+                got = outcome(quick_add.parse_quick_add, text, day)
+                if want != got:
+                    mismatches += 1
+                    if mismatches <= 10:
+                        print(f"MISMATCH today={day} {text!r}\n  reference: {want}\n  quick_add: {got}")
+    finally:
+        reference.date = real_date
+    return mismatches
+
+
+def clear_caches() -> None:
+    for fn in (quick_add.parse_time_token, quick_add.parse_reminder_token, quick_add.parse_duration_token):
+        fn.cache_clear()
+
+
+def rate(fn, phrases: list[str], rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn(phrases)
+        best = min(best, time.perf_counter() - started)
+    return len(phrases) / best
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--corpus", default=os.path.join(HERE, "quick_add_corpus.txt"))
+    ap.add_argument("--fuzz", type=int, default=20000, help="random phrases added to the parity check")
+    ap.add_argument("--rounds", type=int, default=5)
+    args = ap.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    phrases = corpus + fuzz_phrases(args.fuzz)
+    mismatches = check_parity(phrases)
+    print(f"parity: {len(phrases)} phrases ({len(corpus)} corpus, {args.fuzz} fuzz) x {len(TODAYS)} dates, {mismatches} mismatches")
+
+    def run_reference(ps):
+        for p in ps:
+            outcome(reference._parse_quick_add_text, p)
+
+    def run_compiled(ps):
+        for p in ps:
+            outcome(quick_add.parse_quick_add, p)
+
+    clear_caches()
+    started = time.perf_counter()
+    run_compiled(corpus)
+    cold = len(corpus) / (time.perf_counter() - started)
+    ref = rate(run_reference, corpus, args.rounds)
+    new = rate(run_compiled, corpus, args.rounds)
+    bulk = rate(quick_add.parse_quick_add_many, corpus, args.rounds)
+    print(f"reference           {ref:10,.0f} phrases/s")
+    print(f"quick_add (cold)    {cold:10,.0f} phrases/s")
+    print(f"quick_add           {new:10,.0f} phrases/s   x{new / ref:.1f}")
+    print(f"parse_quick_add_many{bulk:10,.0f} phrases/s   x{bulk / ref:.1f}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Benchmark: concurrent reads and writes on SQLite, default vs. tuned pragmas.
+
+Reader threads run the task list query used by GET /api/tasks; writer threads
+update tasks the way PATCH /api/tasks/{id} and the reminder loop do. Reports
+throughput, read latency and "database is locked" errors for each mode.
+
+    python benchmarks/bench_sqlite_concurrency.py [--readers 8] [--writers 4] [--seconds 10]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench-app.db"))
+
+from sqlalchemy import and_, create_engine, insert, select, update  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.pool import QueuePool  # noqa: E402
+
+import main  # noqa: E402
+from sqlite_tuning import configure_sqlite, sqlite_pragmas  # noqa: E402
+
+USERS = 20
+TASKS_PER_USER = 500
+
+
+def make_engine(path: str, tuned: bool):
+    eng = create_engine(f"sqlite:///{path}", poolclass=QueuePool, pool_size=32, max_overflow=0)
+    if tuned:
+        configure_sqlite(eng, sqlite_pragmas())
+    main.metadata.create_all(eng)
+    rows = []
+    ts = int(time.time())
+    for u in range(USERS):
+        for i in range(TASKS_PER_USER):
+            rows.append({
+                "id": f"u{u}t{i}", "user_id": f"u{u}", "title": f"task {i}", "completed": False,
+                "created_at": ts, "updated_at": ts, "list_id": f"l{u}", "trashed": False, "pinned": False,
+                "priority": i % 4, "order_index": i * 1024, "tags_json": "[]", "subtasks_json": "[]",
+                "due_date": "2030-01-01" if i % 3 else None,
+            })
+    with eng.begin() as conn:
+        conn.execute(insert(main.tasks), rows)
+    return eng
+
+
+def run(eng, readers: int, writers: int, seconds: float) -> dict:
+    stop = threading.Event()
+    lock = threading.Lock()
+    stats = {"reads": 0, "writes": 0, "locked": 0, "read_ms": []}
+    keys = [(expr.desc() if desc else expr.asc()) for expr, desc in main.task_sort_keys("due")]
+
+    def reader(seed):
+        rnd = random.Random(seed)
+        while not stop.is_set():
+            uid = f"u{rnd.randrange(USERS)}"
+            t0 = time.perf_counter()
+            try:
+                with eng.connect() as conn:
+                    conn.execute(select(main.tasks).where(and_(main.tasks.c.user_id == uid, main.tasks.c.trashed.is_(False))).order_by(*keys)).all()
+            except OperationalError:
+                with lock:
+                    stats["locked"] += 1
+                continue
+            with lock:
+                stats["reads"] += 1
+                stats["read_ms"].append((time.perf_counter() - t0) * 1000)
+
+    def writer(seed):
+        rnd = random.Random(seed)
+        while not stop.is_set():
+            tid = f"u{rnd.randrange(USERS)}t{rnd.randrange(TASKS_PER_USER)}"
+            try:
+                with eng.begin() as conn:
+                    conn.execute(update(main.tasks).where(main.tasks.c.id == tid).values(updated_at=int(time.time()), tg_reminder_sent_at=int(time.time())))
+            except OperationalError:
+                with lock:
+                    stats["locked"] += 1
+                continue
+            with lock:
+                stats["writes"] += 1
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads += [threading.Thread(target=writer, args=(100 + i,)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    lat = sorted(stats["read_ms"]) or [0.0]
+    return {
+        "reads/s": stats["reads"] / seconds,
+        "writes/s": stats["writes"] / seconds,
+        "locked": stats["locked"],
+        "read p50 ms": lat[len(lat) // 2],
+        "read p99 ms": lat[min(len(lat) - 1, int(len(lat) * 0.99))],
+    }
+
+
+def main_() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--readers", type=int, default=8)
+    ap.add_argument("--writers", type=int, default=4)
+    ap.add_argument("--seconds", type=float, default=10.0)
+    args = ap.parse_args()
+    tmp = tempfile.mkdtemp()
+    results = {}
+    for name, tuned in (("default", False), ("tuned", True)):
+        eng = make_engine(os.path.join(tmp, f"{name}.db"), tuned)
+        results[name] = run(eng, args.readers, args.writers, args.seconds)
+        eng.dispose()
+    cols = list(results["default"])
+    print(f"{args.readers} readers, {args.writers} writers, {args.seconds:g}s, {USERS * TASKS_PER_USER} tasks")
+    print(f"{'':>8} " + " ".join(f"{c:>12}" for c in cols))
+    for name, r in results.items():
+        print(f"{name:>8} " + " ".join(f"{r[c]:>12.1f}" for c in cols))
+
+
+if __name__ == "__main__":
+    main_()
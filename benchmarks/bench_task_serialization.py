@@ -0,0 +1,85 @@
+"""Micro-benchmark: task list serialization, old path vs. json_response(task_dict).
+
+Old path = what GET /api/tasks did before: build a TaskOut per row, then let
+FastAPI validate the list again through response_model=List[TaskOut] and
+render it with JSONResponse.
+
+    python benchmarks/bench_task_serialization.py [rows ...]
+"""
+from __future__ import annotations
+
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+from pydantic import TypeAdapter  # noqa: E402
+
+import main  # noqa: E402
+
+
+def make_rows(n: int, seed: int = 1) -> list[dict]:
+    rnd = random.Random(seed)
+    ts = 1_700_000_000
+    rows = []
+    for i in range(n):
+        tags = rnd.sample(["work", "home", "errands", "reading", "later", "важное"], rnd.randint(0, 3))
+        subtasks = [{"id": f"s{i}_{k}", "title": f"step {k}", "completed": rnd.random() < 0.5} for k in range(rnd.choice([0, 0, 0, 2, 5]))]
+        due = rnd.random() < 0.6
+        rows.append({
+            "id": f"task{i:08d}", "user_id": "u1", "title": f"Task number {i} — купить молоко",
+            "completed": rnd.random() < 0.3, "created_at": ts + i, "updated_at": ts + i,
+            "completed_at": None, "list_id": "list1", "section_id": None,
+            "due_date": "2030-01-15" if due else None, "due_time": "09:30" if due and rnd.random() < 0.5 else None,
+            "reminder_minutes": 15 if due and rnd.random() < 0.3 else None, "repeat_rule": None,
+            "duration_minutes": None, "pinned": rnd.random() < 0.05, "order_index": (ts + i) * 1000,
+            "priority": rnd.randint(0, 3), "trashed": False, "trashed_at": None,
+            "notes": "some notes" if rnd.random() < 0.2 else None,
+            "tags_json": json.dumps(tags, ensure_ascii=False), "subtasks_json": json.dumps(subtasks),
+            "tg_reminder_sent_at": None,
+        })
+    return rows
+
+
+_adapter = TypeAdapter(List[main.TaskOut])
+
+
+def old_path(rows) -> bytes:
+    objs = [main.to_task_out(r) for r in rows]
+    content = _adapter.dump_python(_adapter.validate_python(objs), mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def new_path(rows) -> bytes:
+    return main.json_response([main.task_dict(r) for r in rows]).body
+
+
+def bench(fn, rows, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main_(sizes: list[int]) -> None:
+    print(f"orjson: {'yes' if main.orjson is not None else 'no'}")
+    print(f"{'rows':>8} {'old ms':>10} {'new ms':>10} {'speedup':>8}")
+    for n in sizes:
+        rows = make_rows(n)
+        assert json.loads(old_path(rows[:200])) == json.loads(new_path(rows[:200]))
+        repeat = 5 if n <= 10_000 else 3
+        old = bench(old_path, rows, repeat)
+        new = bench(new_path, rows, repeat)
+        print(f"{n:>8} {old * 1000:>10.1f} {new * 1000:>10.1f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main_([int(a) for a in sys.argv[1:]] or [1_000, 10_000, 50_000])
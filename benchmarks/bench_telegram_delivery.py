@@ -0,0 +1,161 @@
+"""Benchmark: reminder burst delivery against a local fake Bot API server.
+
+The fake server answers sendMessage after --latency seconds and enforces
+Telegram-style flood control: more than --rate messages/second overall, or two
+messages to one chat within --chat-interval, get a 429 with retry_after.
+Compares the old one-at-a-time send loop with the DeliveryQueue the bridge
+uses now, and reports throughput, 429s and time until the whole burst is out.
+
+    python benchmarks/bench_telegram_delivery.py [--messages 300] [--chats 300] [--rate 30] [--latency 0.08] [--workers 8]
+
+Telegram's default bot limit is ~30 msg/s, so a burst of N reminders can't
+finish faster than N/30 s; paid broadcasts raise that (try --rate 1000).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from telegram_bot_bridge import TelegramBotBridge  # noqa: E402
+from telegram_delivery import DeliveryQueue  # noqa: E402
+
+
+class FakeBotApi:
+    def __init__(self, rate: float, chat_interval: float, latency: float):
+        self.rate = rate
+        self.chat_interval = chat_interval
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.window: deque[float] = deque()
+        self.last_by_chat: dict[str, float] = {}
+        self.delivered = 0
+        self.rejected = 0
+
+    def admit(self, chat_id: str) -> float:
+        """0 if the message is accepted, else retry_after seconds."""
+        now = time.monotonic()
+        with self.lock:
+            while self.window and self.window[0] <= now - 1.0:
+                self.window.popleft()
+            last = self.last_by_chat.get(chat_id)
+            if len(self.window) >= self.rate or (last is not None and now - last < self.chat_interval):
+                self.rejected += 1
+                return 1.0
+            self.window.append(now)
+            self.last_by_chat[chat_id] = now
+            self.delivered += 1
+            return 0.0
+
+    def serve(self) -> ThreadingHTTPServer:
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                time.sleep(api.latency)
+                retry_after = api.admit(str(body.get("chat_id")))
+                if retry_after:
+                    code, out = 429, {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1", "parameters": {"retry_after": retry_after}}
+                else:
+                    code, out = 200, {"ok": True, "result": {"message_id": 1}}
+                raw = json.dumps(out).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def log_message(self, *args):
+                pass
+
+        ThreadingHTTPServer.request_queue_size = 256
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def make_bridge() -> TelegramBotBridge:
+    return TelegramBotBridge(engine=None, users=None, tasks=None, lists=None, now_ts_fn=lambda: int(time.time()), gen_id_fn=lambda: "x")
+
+
+def payloads(n: int, chats: int) -> list[dict]:
+    return [{"chat_id": str(1000 + i % chats), "text": f"🔔 reminder {i}", "parse_mode": "HTML"} for i in range(n)]
+
+
+def run_sequential(bridge: TelegramBotBridge, msgs: list[dict]) -> tuple[float, int]:
+    failed = 0
+    started = time.perf_counter()
+    for p in msgs:
+        try:
+            bridge._tg_api("sendMessage", p, timeout=20)
+        except Exception:
+            failed += 1  # the old loop logged and moved on
+    return time.perf_counter() - started, failed
+
+
+def run_queue(bridge: TelegramBotBridge, msgs: list[dict], workers: int, rate: float, chat_interval: float) -> tuple[float, dict]:
+    q = DeliveryQueue(lambda p: bridge._tg_api("sendMessage", p, timeout=20), workers=workers, global_rate=rate, chat_interval=chat_interval)
+    q.start()
+    started = time.perf_counter()
+    for p in msgs:
+        q.submit(p["chat_id"], p)
+    q.wait_idle()
+    elapsed = time.perf_counter() - started
+    q.stop()
+    return elapsed, q.snapshot()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=300)
+    ap.add_argument("--chats", type=int, default=300, help="distinct chats (fewer chats = more per-chat throttling)")
+    ap.add_argument("--rate", type=float, default=30.0, help="server-side global limit, msg/s")
+    ap.add_argument("--chat-interval", type=float, default=1.0)
+    ap.add_argument("--latency", type=float, default=0.08, help="server response time, seconds")
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--headroom", type=float, default=0.1, help="client runs this fraction below the server limits")
+    ap.add_argument("--sequential-sample", type=int, default=100, help="messages sent by the old loop (0 = skip)")
+    args = ap.parse_args()
+
+    api = FakeBotApi(args.rate, args.chat_interval, args.latency)
+    server = api.serve()
+    os.environ["TELEGRAM_BOT_TOKEN"] = "bench:token"
+    os.environ["TELEGRAM_API_BASE"] = f"http://127.0.0.1:{server.server_address[1]}"
+    bridge = make_bridge()
+
+    print(f"{args.messages} messages to {args.chats} chats, limit {args.rate:g} msg/s, {args.latency * 1000:.0f} ms latency")
+    if args.sequential_sample:
+        sample = payloads(min(args.sequential_sample, args.messages), args.chats)
+        elapsed, failed = run_sequential(bridge, sample)
+        rate = len(sample) / elapsed
+        print(f"sequential: {len(sample)} msgs in {elapsed:.2f}s ({rate:.1f} msg/s, {failed} failed); "
+              f"full burst would take ~{args.messages / rate:.1f}s")
+        time.sleep(args.chat_interval + 1.0)  # let the fake server's limits reset
+
+    before = api.rejected
+    per_chat = -(-args.messages // args.chats)
+    floor = max(args.messages / args.rate, (per_chat - 1) * args.chat_interval)
+    elapsed, stats = run_queue(
+        bridge, payloads(args.messages, args.chats), args.workers,
+        args.rate * (1 - args.headroom), args.chat_interval * (1 + args.headroom),
+    )
+    print(f"queue ({args.workers} workers): {stats['sent']} sent, {stats['failed']} failed in {elapsed:.2f}s "
+          f"({stats['sent'] / elapsed:.1f} msg/s), 429s {api.rejected - before}, retries {stats['retried']}; "
+          f"floor at these limits {floor:.1f}s")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Benchmark: Bot API call latency, new connection per call vs. keep-alive pool.
+
+Starts a local HTTPS server (self-signed cert made with the openssl CLI; use
+--plain to skip TLS) that answers like the Bot API, then times sequential
+answerCallbackQuery-style calls the way the bridge used to make them
+(urllib, one TCP+TLS handshake each) and through telegram_http.KeepAliveClient.
+--rtt adds a delay before every accepted connection and response to mimic
+the round trip to api.telegram.org.
+
+    python benchmarks/bench_telegram_http.py [--calls 200] [--rtt 0.03] [--plain]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from telegram_http import KeepAliveClient  # noqa: E402
+
+
+def make_cert(tmp: str) -> tuple[str, str]:
+    cert, key = os.path.join(tmp, "cert.pem"), os.path.join(tmp, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=127.0.0.1",
+         "-addext", "subjectAltName=IP:127.0.0.1", "-keyout", key, "-out", cert],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+
+def serve(rtt: float, tls: tuple[str, str] | None) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            time.sleep(rtt)
+            raw = json.dumps({"ok": True, "result": True}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+
+        def get_request(self):
+            sock, addr = super().get_request()
+            time.sleep(rtt)  # the TCP handshake round trip
+            return sock, addr
+
+    server = Server(("127.0.0.1", 0), Handler)
+    if tls:
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ctx.load_cert_chain(*tls)
+        server.socket = ctx.wrap_socket(server.socket, server_side=True, do_handshake_on_connect=False)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def timed(fn, calls: int) -> list[float]:
+    out = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - started) * 1000.0)
+    return out
+
+
+def report(label: str, ms: list[float]) -> None:
+    ms = sorted(ms)
+    print(f"{label:<12} avg {sum(ms) / len(ms):7.2f} ms   p50 {ms[len(ms) // 2]:7.2f} ms   p95 {ms[int(len(ms) * 0.95)]:7.2f} ms")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--calls", type=int, default=200)
+    ap.add_argument("--rtt", type=float, default=0.03, help="simulated round trip, seconds")
+    ap.add_argument("--plain", action="store_true", help="plain HTTP instead of TLS")
+    args = ap.parse_args()
+
+    tls = None if args.plain else make_cert(tempfile.mkdtemp())
+    server = serve(args.rtt, tls)
+    base = f"{'http' if args.plain else 'https'}://127.0.0.1:{server.server_address[1]}"
+    ctx = ssl.create_default_context(cafile=tls[0]) if tls else None
+    body = json.dumps({"callback_query_id": "1", "text": "ok"}).encode()
+    path = "/botbench:token/answerCallbackQuery"
+
+    def per_call():
+        req = urllib.request.Request(base + path, data=body, headers={"Content-Type": "application/json"}, method="POST")
+        with urllib.request.urlopen(req, timeout=10, context=ctx) as resp:
+            resp.read()
+
+    client = KeepAliveClient(base, pool_size=4, ssl_context=ctx)
+
+    print(f"{args.calls} sequential calls, simulated RTT {args.rtt * 1000:.0f} ms, {'plain HTTP' if args.plain else 'TLS'}")
+    report("urllib", timed(per_call, args.calls))
+    report("keep-alive", timed(lambda: client.post(path, body, timeout=10), args.calls))
+    print(f"keep-alive client: {client.snapshot()}")
+    client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
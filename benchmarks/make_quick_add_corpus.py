@@ -0,0 +1,61 @@
+"""Generate quick_add_corpus.txt, the phrase set used by bench_quick_add.py.
+
+The corpus is synthetic: task titles (Russian and English) recombined with
+date, time, reminder, duration, repeat, priority and tag tokens taken from
+the pools below, placed at the end, the start or the middle of the title,
+with occasional upper-casing. The pools deliberately include malformed
+values (31.02, 25:00, "на" without a number) so both parsers take their
+error paths. A fixed seed makes the file reproducible:
+
+    python benchmarks/make_quick_add_corpus.py [--seed 2026] [--count 6000] [--out FILE]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+RU_TITLES = """Купить молоко|Позвонить маме|Оплатить интернет|Записаться к врачу|Забрать посылку|Сдать отчёт|Подготовить презентацию|Написать Сергею|Встреча с командой|Полить цветы|Вынести мусор|Забрать детей из школы|Оплатить коммуналку|Продлить страховку|Заправить машину|Сходить в спортзал|Прочитать главу книги|Купить подарок на ДР|Записать ребёнка на секцию|Проверить почту|Ответить клиенту|Созвон с подрядчиком|Починить кран|Разобрать шкаф|Заказать продукты|Отнести костюм в химчистку|Погулять с собакой|Сделать домашку по английскому|Забронировать отель|Купить билеты на поезд|Обновить резюме|Позвонить в банк|Отправить документы бухгалтеру|Созвониться с Анной|Купить хлеб и яйца|Подать показания счётчиков|Заплатить за садик|Записаться на стрижку|Проверить давление в шинах|Сделать бэкап ноутбука|Написать пост в блог|Купить корм коту|Встретить маму на вокзале|Отправить открытку бабушке|Забрать анализы|Пройти техосмотр|Поменять масло|Выучить 20 слов|Пробежка 5 км|Медитация|Принять витамины|Планёрка|Код-ревью PR 42|Деплой на прод|Релиз 2.3|Обед с Петей|Стоматолог|Йога|Бассейн|Уборка на кухне""".split("|")
+EN_TITLES = """Buy milk|Call mom|Pay rent|Book dentist appointment|Pick up package|Submit report|Prepare slides|Email Sarah|Team sync|Water the plants|Take out trash|Pick up kids|Renew passport|Fill up the car|Go to the gym|Read a chapter|Buy birthday gift|Check inbox|Reply to client|Call the plumber|Fix the sink|Order groceries|Walk the dog|Book hotel|Buy train tickets|Update resume|Call the bank|Send invoice|Standup|Code review PR 118|Deploy to prod|Release v2.3|Lunch with Alex|Dentist|Yoga class|Swim|Clean the kitchen|Pay credit card bill|Backup laptop|Write blog post|Buy cat food|Meet mom at the station|Send postcard to grandma|Get blood test results|Car inspection|Change oil|Learn 20 words|Run 5k|Meditate|Take vitamins|1:1 with manager|Quarterly planning|Renew domain|Cancel gym membership|Call 911 drill""".split("|")
+DATES = ["сегодня","завтра","послезавтра","Завтра","СЕГОДНЯ","today","tomorrow","Tomorrow","через 3 дня","через 2 недели","через 5д","через 1 неделю","через 10 days","через 2w","через 3 нед","в пн","во вт","в среда","в пятницу","пт","суббота","вс","понедельник","12.05","1/2/2025","31.12","29.02","30.02.2025","2025-03-01","2026-12-31","5 мая","15 сент 2027","1 января","31 дек","7 июля 26","3 марта","10 окт","in 2 days","next monday","on friday","1.1.30","12-11-2026","13/13"]
+TIMES = ["в 19:00","в 9:30","7pm","в9.30","18:45","0930","10am","12:00pm","12am","в 8","в 23,15","at 5pm","в 25:00","9:5","10:60","в 1830","11pm","в 07:15"]
+REMINDERS = ["@15m","@1h","30min","2h","1d","@5M","@10MIN","@2d","@0m","напомни"]
+DURATIONS = ["на 30 мин","на 1,5 часа","2ч","1ч30м","45мин","~20м","dur:1h30m","duration 2 hours","на 2 дня","на 1 час","1.5ч","90минут","2часа","на 3h","dur 45мин","на","длительность: 20м","на полчаса","~~15м","на 0.5 ч"]
+REPEATS = ["каждый день","ежедневно","по будням","weekly","каждую неделю","every day","monthly","каждый месяц","ежегодно","каждый год","будни","daily","weekdays","по будни"]
+EXTRAS = ["!1","!2","!3","!4","!0","#работа","#home","#дом","#семья","#urgent","#work","#","##двойной","#Дом","#дом","и","с","для","по","в","на","к"]
+
+
+def generate(seed: int, count: int) -> list[str]:
+    rnd = random.Random(seed)
+    out: set[str] = set()
+    while len(out) < count:
+        parts = rnd.choice(RU_TITLES if rnd.random() < 0.6 else EN_TITLES).split()
+        for pool, p in ((DATES, .55), (TIMES, .45), (REMINDERS, .2), (DURATIONS, .2), (REPEATS, .15), (EXTRAS, .35), (EXTRAS, .15)):
+            if rnd.random() < p:
+                r = rnd.random()
+                pos = len(parts) if r < 0.75 else 0 if r < 0.92 else rnd.randint(0, len(parts))
+                parts.insert(pos, rnd.choice(pool))
+        if rnd.random() < 0.1:
+            parts = [w.upper() if rnd.random() < .3 else w for w in parts]
+        out.add(" ".join(parts))
+    lines = sorted(out)  # set order depends on PYTHONHASHSEED; sort before shuffling
+    rnd.shuffle(lines)
+    return lines
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seed", type=int, default=2026)
+    ap.add_argument("--count", type=int, default=6000)
+    ap.add_argument("--out", default=os.path.join(HERE, "quick_add_corpus.txt"))
+    args = ap.parse_args()
+    lines = generate(args.seed, args.count)
+    with open(args.out, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    print(f"{len(lines)} phrases -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Stand-in for Telegram that drives the webhook route with sample updates.
+
+By default runs in-process: starts a fake Bot API server that records calls,
+boots main.app in webhook mode against it (temporary SQLite DB), posts
+sample messages and callback queries to /api/telegram/webhook and checks
+that each produced a Bot API reply, that re-sent update_ids are skipped and
+that a wrong secret is refused. Reports per-update latency.
+
+    python benchmarks/telegram_webhook_standin.py [--updates 200] [--chats 20]
+
+Against a running server (its replies then go wherever its TELEGRAM_API_BASE
+points, so only status codes and latency are checked):
+
+    python benchmarks/telegram_webhook_standin.py --url https://host/api/telegram/webhook --secret S
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+SAMPLE_TEXTS = ["/start", "/help", "/id", "/tasks", "/today", "/add Купить молоко завтра 19:00", "/unknown"]
+
+
+def fake_bot_api() -> tuple[ThreadingHTTPServer, list[tuple[str, dict]]]:
+    calls: list[tuple[str, dict]] = []
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            method = self.path.rsplit("/", 1)[-1]
+            with lock:
+                calls.append((method, body))
+            result = {"id": 1, "username": "standin_bot"} if method == "getMe" else True
+            raw = json.dumps({"ok": True, "result": result}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, calls
+
+
+def sample_updates(n: int, chats: int, first_id: int = 5000) -> list[dict]:
+    out = []
+    for i in range(n):
+        chat = {"id": 700000 + i % chats, "type": "private"}
+        user = {"id": chat["id"], "is_bot": False, "first_name": "Standin", "username": f"standin{i % chats}"}
+        if i % 5 == 4:
+            out.append({"update_id": first_id + i, "callback_query": {
+                "id": f"cb{i}", "from": user, "data": "ct|v|tasks|1",
+                "message": {"message_id": 10 + i, "chat": chat, "date": int(time.time()), "text": "…"},
+            }})
+        else:
+            out.append({"update_id": first_id + i, "message": {
+                "message_id": 10 + i, "from": user, "chat": chat, "date": int(time.time()),
+                "text": SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)],
+            }})
+    return out
+
+
+def post_all(post, updates: list[dict], secret: str) -> list[float]:
+    lat = []
+    for upd in updates:
+        started = time.perf_counter()
+        status = post(upd, secret)
+        lat.append((time.perf_counter() - started) * 1000.0)
+        if status != 200:
+            raise SystemExit(f"update {upd['update_id']}: HTTP {status}")
+    return lat
+
+
+def report(lat: list[float]) -> None:
+    lat = sorted(lat)
+    print(f"{len(lat)} updates: avg {sum(lat) / len(lat):.1f} ms, p50 {lat[len(lat) // 2]:.1f} ms, p95 {lat[int(len(lat) * 0.95)]:.1f} ms")
+
+
+def run_remote(url: str, secret: str, updates: list[dict]) -> None:
+    def post(upd, sec):
+        req = urllib.request.Request(url, data=json.dumps(upd).encode(), method="POST", headers={
+            "Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": sec,
+        })
+        try:
+            with urllib.request.urlopen(req, timeout=30) as resp:
+                return resp.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    assert post(updates[0], secret + "x") == 401, "wrong secret was accepted"
+    report(post_all(post, updates, secret))
+
+
+def run_local(updates: list[dict]) -> None:
+    server, calls = fake_bot_api()
+    os.environ.update({
+        "DATABASE_URL": "sqlite:///" + os.path.join(tempfile.mkdtemp(), "standin.db"),
+        "TELEGRAM_BOT_TOKEN": "standin:token",
+        "TELEGRAM_API_BASE": f"http://127.0.0.1:{server.server_address[1]}",
+        "TELEGRAM_WEBHOOK_URL": "https://standin.example",
+        "TELEGRAM_CHAT_INTERVAL": "0",
+    })
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as client:
+        secret = main.tg_bridge.webhook_secret
+        path = main.TelegramBotBridge.WEBHOOK_PATH
+
+        def post(upd, sec):
+            return client.post(path, json=upd, headers={"X-Telegram-Bot-Api-Secret-Token": sec}).status_code
+
+        assert post(updates[0], "wrong") == 401, "wrong secret was accepted"
+        lat = post_all(post, updates, secret)
+        replies_before = len(calls)
+        post_all(post, updates[:10], secret)  # Telegram re-sending: must be no-ops
+        assert len(calls) == replies_before, "re-sent updates were handled twice"
+
+    registered = [b for m, b in calls if m == "setWebhook"]
+    assert registered and registered[0]["url"] == "https://standin.example" + path, registered
+    assert registered[0]["secret_token"] == secret
+    assert not any(m == "getUpdates" for m, _ in calls), "bridge polled while in webhook mode"
+    replies = [m for m, _ in calls if m in ("sendMessage", "editMessageText", "answerCallbackQuery")]
+    assert len(replies) >= len(updates), (len(replies), len(updates))
+    report(lat)
+    print(f"Bot API calls: setWebhook {len(registered)}, replies {len(replies)}")
+    server.shutdown()
+
+
+def run() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--updates", type=int, default=200)
+    ap.add_argument("--chats", type=int, default=20)
+    ap.add_argument("--url", help="webhook URL of a running server")
+    ap.add_argument("--secret", default="", help="its TELEGRAM_WEBHOOK_SECRET")
+    args = ap.parse_args()
+    updates = sample_updates(args.updates, args.chats)
+    if args.url:
+        run_remote(args.url, args.secret, updates)
+    else:
+        run_local(updates)
+
+
+if __name__ == "__main__":
+    run()
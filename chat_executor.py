@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import threading
+from collections import deque
+from typing import Callable, Hashable, Optional
+
+
+class KeyedExecutor:
+    """Thread pool that runs jobs for the same key one at a time, in submit order.
+
+    Jobs for different keys run in parallel on up to `workers` threads. A key
+    with a backlog gives up its worker after each job, so one busy chat can't
+    starve the others. stop() drops jobs that have not started; a later
+    start() begins with an empty queue.
+    """
+
+    def __init__(self, workers: int = 8, *, name: str = "ct-keyed", logger: Optional[Callable[[str], None]] = None):
+        self.workers = max(1, int(workers))
+        self.name = name
+        self.log = logger or (lambda _m: None)
+        self._cond = threading.Condition()
+        self._queues: dict[Hashable, deque] = {}
+        self._ready: deque = deque()
+        self._pending = 0
+        self._stop = False
+        self._generation = 0
+        self._threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stop = False
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, args=(self._generation,), name=f"{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = 5.0) -> int:
+        """Stop the workers and drop queued jobs; returns how many were dropped.
+
+        Running jobs get `timeout` seconds to finish; one still running after
+        that completes on its own but no longer counts as pending.
+        """
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout=timeout)
+        self._threads = []
+        with self._cond:
+            dropped = sum(len(q) for q in self._queues.values())
+            self._queues.clear()
+            self._ready.clear()
+            self._pending = 0
+            self._generation += 1
+            self._cond.notify_all()
+        return dropped
+
+    def submit(self, key: Hashable, fn: Callable[[], None]) -> None:
+        with self._cond:
+            q = self._queues.get(key)
+            if q is None:
+                # no queue = the key is neither waiting nor running
+                self._queues[key] = deque([fn])
+                self._ready.append(key)
+                self._cond.notify()
+            else:
+                q.append(fn)
+            self._pending += 1
+
+    def pending(self) -> int:
+        """Jobs submitted but not finished yet."""
+        with self._cond:
+            return self._pending
+
+    def wait_below(self, limit: int, timeout: Optional[float] = None) -> bool:
+        """Block until fewer than `limit` jobs are pending (back-pressure for producers)."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending < limit or self._stop, timeout)
+
+    def _worker(self, generation: int) -> None:
+        while True:
+            with self._cond:
+                while not self._ready and not self._stop and generation == self._generation:
+                    self._cond.wait()
+                if self._stop or generation != self._generation:
+                    return
+                key = self._ready.popleft()
+                fn = self._queues[key][0]
+            try:
+                fn()
+            except Exception as e:
+                self.log(f"{self.name} job for {key!r} failed: {e}")
+            with self._cond:
+                if generation != self._generation:
+                    return  # stop() already dropped this job's queue
+                q = self._queues[key]
+                q.popleft()
+                self._pending -= 1
+                if q:
+                    self._ready.append(key)
+                else:
+                    del self._queues[key]
+                self._cond.notify_all()
@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.engine import Engine
+
+DEFAULT_STATE = {"view_mode": "expanded", "last_mode": None, "last_page": None}
+
+
+class ChatStateStore:
+    """Per-chat bot state (view mode, last list page) with a bounded LRU in front of a table.
+
+    Rows are read lazily on first use and cached for `ttl` seconds (so changes
+    made by another worker show up; ttl=0 reads through on every get, except
+    for this process's own unflushed updates). Updates only touch the cache and mark the
+    chat dirty; a background thread upserts dirty chats every `flush_interval`
+    seconds in one batch, and stop() flushes the rest. At most `maxsize` chats
+    stay in memory; a dirty chat that gets evicted waits in the next batch.
+    Unwritten changes are capped at `max_dirty` chats too: while the database
+    is down the oldest ones are dropped (and counted) rather than piling up.
+    """
+
+    FIELDS = tuple(DEFAULT_STATE)
+
+    def __init__(
+        self,
+        engine: Engine,
+        table,
+        *,
+        maxsize: int = 10000,
+        ttl: float = 300.0,
+        flush_interval: float = 5.0,
+        max_dirty: Optional[int] = None,
+        logger: Optional[Callable[[str], None]] = None,
+    ):
+        self.engine = engine
+        self.table = table
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = float(ttl)
+        self.flush_interval = float(flush_interval)
+        self.max_dirty = max(1, int(max_dirty if max_dirty is not None else self.maxsize))
+        self.log = logger or (lambda _m: None)
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+        self._dirty: dict[str, dict] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"hits": 0, "loads": 0, "flushes": 0, "written": 0, "droppedDirty": 0}
+        cols = ("chat_id", *self.FIELDS, "updated_at")
+        self._upsert = text(
+            f"INSERT INTO {table.name} ({', '.join(cols)}) VALUES ({', '.join(':' + c for c in cols)}) "
+            "ON CONFLICT (chat_id) DO UPDATE SET " + ", ".join(f"{c} = excluded.{c}" for c in cols[1:])
+        )
+
+    # ---------- cache ----------
+    def _put(self, chat_id: str, state: dict) -> None:
+        """Insert into the LRU (caller holds the lock)."""
+        self._data[chat_id] = (time.monotonic() + self.ttl, state)
+        self._data.move_to_end(chat_id)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)  # dirty ones are still in self._dirty
+
+    def _trim_dirty(self) -> int:
+        """Drop the oldest unwritten changes beyond max_dirty (caller holds the lock)."""
+        over = len(self._dirty) - self.max_dirty
+        if over <= 0:
+            return 0
+        for chat_id in list(itertools.islice(self._dirty, over)):
+            del self._dirty[chat_id]
+        self.stats["droppedDirty"] += over
+        return over
+
+    def get(self, chat_id: str) -> dict:
+        """Current state of a chat (a copy); loads the row on a miss."""
+        chat_id = str(chat_id)
+        with self._lock:
+            hit = self._data.get(chat_id)
+            if hit is not None and (hit[0] > time.monotonic() or chat_id in self._dirty):
+                self._data.move_to_end(chat_id)
+                self.stats["hits"] += 1
+                return dict(hit[1])
+            pending = self._dirty.get(chat_id)
+            if pending is not None:
+                self._put(chat_id, pending)
+                return dict(pending)
+        state = self._load(chat_id)
+        with self._lock:
+            if chat_id in self._dirty:  # updated while we were reading
+                state = self._dirty[chat_id]
+            self._put(chat_id, state)
+            self.stats["loads"] += 1
+        return dict(state)
+
+    def _load(self, chat_id: str) -> dict:
+        t = self.table
+        with self.engine.connect() as conn:
+            row = conn.execute(select(*(t.c[k] for k in self.FIELDS)).where(t.c.chat_id == chat_id)).mappings().first()
+        state = dict(DEFAULT_STATE)
+        if row:
+            state.update({k: row[k] for k in self.FIELDS if row[k] is not None})
+        return state
+
+    def update(self, chat_id: str, **changes) -> None:
+        chat_id = str(chat_id)
+        unknown = set(changes) - set(self.FIELDS)
+        if unknown:
+            raise KeyError(f"unknown chat state fields: {sorted(unknown)}")
+        state = self.get(chat_id)
+        if all(state.get(k) == v for k, v in changes.items()):
+            return
+        state.update(changes)
+        with self._lock:
+            self._put(chat_id, state)
+            self._dirty.pop(chat_id, None)  # re-insert: dict order is age order
+            self._dirty[chat_id] = state
+            self._trim_dirty()
+
+    # ---------- write-back ----------
+    def flush(self) -> int:
+        """Upsert all dirty chats in one batch; returns how many were written."""
+        with self._lock:
+            batch, self._dirty = self._dirty, {}
+        if not batch:
+            return 0
+        now = int(time.time())
+        params = [{"chat_id": c, **{k: s.get(k) for k in self.FIELDS}, "updated_at": now} for c, s in batch.items()]
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(self._upsert, params)
+        except Exception:
+            with self._lock:
+                # the failed batch is older than anything updated meanwhile (newer updates win)
+                merged = {c: s for c, s in batch.items() if c not in self._dirty}
+                merged.update(self._dirty)
+                self._dirty = merged
+                dropped = self._trim_dirty()
+            if dropped:
+                self.log(f"chat state: dropped {dropped} unwritten changes (max_dirty={self.max_dirty})")
+            raise
+        with self._lock:
+            self.stats["flushes"] += 1
+            self.stats["written"] += len(params)
+        return len(params)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                with self._lock:
+                    pending, dropped = len(self._dirty), self.stats["droppedDirty"]
+                self.log(f"chat state flush failed ({pending} pending, {dropped} dropped so far): {e}")
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ct-chat-state", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=5)
+            self._thread = None
+        try:
+            self.flush()
+        except Exception as e:
+            self.log(f"final chat state flush failed: {e}")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "cached": len(self._data), "dirty": len(self._dirty), "maxsize": self.maxsize}
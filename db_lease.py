@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+from sqlalchemy import and_, insert, or_, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
+
+class DbLease:
+    """Leader election through a row lease in a shared table.
+
+    Every process runs one DbLease per lease `name`. The holder renews the row
+    every ttl/3 seconds; when it stops renewing (crash, shutdown, lost DB)
+    the row expires after `ttl` and the next process to try takes it over.
+    on_acquired/on_lost run on the lease thread when leadership changes; a
+    leader that can't renew steps down before its lease could have expired.
+
+    Expiry uses each process's wall clock, so hosts must be roughly in sync
+    (well within `ttl`).
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        table,
+        name: str,
+        *,
+        ttl: float = 30.0,
+        on_acquired: Optional[Callable[[], None]] = None,
+        on_lost: Optional[Callable[[], None]] = None,
+        logger: Optional[Callable[[str], None]] = None,
+    ):
+        self.engine = engine
+        self.table = table
+        self.name = name
+        self.ttl = max(3.0, float(ttl))
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.on_acquired = on_acquired or (lambda: None)
+        self.on_lost = on_lost or (lambda: None)
+        self.log = logger or (lambda _m: None)
+        self.is_leader = False
+        self._renewed_at = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"acquired": 0, "lost": 0, "errors": 0}
+
+    # ---------- lease row ----------
+    def try_acquire(self) -> bool:
+        """Take or renew the lease; True if this process holds it afterwards."""
+        now = int(time.time())
+        t = self.table
+        values = {"holder": self.holder, "expires_at": now + int(self.ttl), "renewed_at": now}
+        with self.engine.begin() as conn:
+            res = conn.execute(
+                update(t)
+                .where(and_(t.c.name == self.name, or_(t.c.holder == self.holder, t.c.expires_at < now)))
+                .values(**values)
+            )
+            if res.rowcount:
+                return True
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(insert(t).values(name=self.name, **values))
+            return True
+        except IntegrityError:
+            return False  # someone else holds it
+
+    def release(self) -> None:
+        """Expire our lease right away so another process can take over without waiting."""
+        t = self.table
+        with self.engine.begin() as conn:
+            conn.execute(update(t).where(and_(t.c.name == self.name, t.c.holder == self.holder)).values(expires_at=0))
+
+    # ---------- background loop ----------
+    def _set_leader(self, leader: bool) -> None:
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        self.stats["acquired" if leader else "lost"] += 1
+        self.log(f"{'acquired' if leader else 'lost'} lease {self.name!r} ({self.holder})")
+        try:
+            (self.on_acquired if leader else self.on_lost)()
+        except Exception as e:
+            self.log(f"lease {self.name!r} callback failed: {e}")
+
+    def _tick(self) -> None:
+        try:
+            held = self.try_acquire()
+            if held:
+                self._renewed_at = time.monotonic()
+            self._set_leader(held)
+        except Exception as e:
+            self.stats["errors"] += 1
+            self.log(f"lease {self.name!r} renew failed: {e}")
+            # Can't reach the DB: give up leadership before another process may take it.
+            if self.is_leader and time.monotonic() - self._renewed_at > self.ttl * 2 / 3:
+                self._set_leader(False)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._tick()
+            self._stop.wait(self.ttl / 3)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"ct-lease-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+        if self.is_leader:
+            self._set_leader(False)
+            try:
+                self.release()
+            except Exception as e:
+                self.log(f"lease {self.name!r} release failed: {e}")
+
+    def snapshot(self) -> dict:
+        return {"name": self.name, "holder": self.holder, "leader": self.is_leader, "ttl": self.ttl, **self.stats}
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Callable, Optional
+
+from sqlalchemy import case, delete, insert, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
+
+class DbRateLimiter:
+    """Send slots shared by every process through rows of a table.
+
+    Each key (the whole bot, one chat) has a row holding the time its next
+    slot starts. reserve() moves that time forward by `interval` in one
+    transaction and tells the caller how long to wait for the slot it took,
+    so N workers together stay within one limit instead of N times it.
+    hold() pushes a key's next slot out (after a 429). Times are wall-clock
+    milliseconds, so hosts must be roughly in sync, as for DbLease.
+    """
+
+    PRUNE_EVERY = 600.0
+    PRUNE_AFTER = 3600.0
+
+    def __init__(self, engine: Engine, table, *, logger: Optional[Callable[[str], None]] = None):
+        self.engine = engine
+        self.table = table
+        self.log = logger or (lambda _m: None)
+        self._lock = threading.Lock()
+        self._pruned_at = time.monotonic()
+        self.stats = {"reserved": 0, "waited": 0, "held": 0}
+
+    def reserve(self, key: str, interval: float) -> float:
+        """Take the next slot of `key`; returns seconds until it starts."""
+        t = self.table
+        now = int(time.time() * 1000)
+        step = max(1, int(interval * 1000))
+        bump = update(t).where(t.c.key == key).values(
+            next_at=case((t.c.next_at > now, t.c.next_at + step), else_=now + step)
+        )
+        for _ in range(2):
+            with self.engine.begin() as conn:
+                if conn.execute(bump).rowcount:
+                    next_at = int(conn.execute(select(t.c.next_at).where(t.c.key == key)).scalar())
+                    break
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(insert(t).values(key=key, next_at=now + step))
+                next_at = now + step
+                break
+            except IntegrityError:
+                continue  # another process inserted it first; bump that row
+        else:
+            raise RuntimeError(f"could not reserve a slot for {key!r}")
+        self._maybe_prune()
+        wait = max(0.0, (next_at - step - now) / 1000.0)
+        with self._lock:
+            self.stats["reserved"] += 1
+            if wait > 0:
+                self.stats["waited"] += 1
+        return wait
+
+    def hold(self, key: str, seconds: float) -> None:
+        """Keep `key` from getting a slot for the next `seconds` (after a 429, or a late send)."""
+        t = self.table
+        until = int((time.time() + seconds) * 1000)
+        with self.engine.begin() as conn:
+            updated = conn.execute(update(t).where(t.c.key == key).values(
+                next_at=case((t.c.next_at > until, t.c.next_at), else_=until)
+            )).rowcount
+        if not updated:
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(insert(t).values(key=key, next_at=until))
+            except IntegrityError:
+                pass  # raced with a reserve(); its slot is close enough
+        with self._lock:
+            self.stats["held"] += 1
+
+    def _maybe_prune(self) -> None:
+        """Drop rows of keys idle for an hour (one row per chat would pile up otherwise)."""
+        with self._lock:
+            if time.monotonic() - self._pruned_at < self.PRUNE_EVERY:
+                return
+            self._pruned_at = time.monotonic()
+        cutoff = int((time.time() - self.PRUNE_AFTER) * 1000)
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(delete(self.table).where(self.table.c.next_at < cutoff))
+        except Exception as e:
+            self.log(f"rate limit prune failed: {e}")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats)
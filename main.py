@@ -1,29 +1,92 @@
 from __future__ import annotations
-import os, json
+import os, json, asyncio, threading, time, base64, random, itertools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, date, timedelta
 from typing import Optional, List, Literal
 
-from fastapi import FastAPI, HTTPException, Depends, status, Response, Cookie, Request
+from fastapi import FastAPI, HTTPException, Depends, status, Response, Cookie, Request, Query, BackgroundTasks
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 from jose import jwt, JWTError
 import bcrypt
 import hashlib
+import hmac
 from sqlalchemy import (
     create_engine, MetaData, Table, Column,
     String, Boolean, BigInteger, Integer, Text,
-    select, insert, update, delete, and_, case, text, or_
+    select, insert, update, delete, and_, case, text, or_, func, bindparam
 )
 from sqlalchemy.engine import Engine
 from sqlalchemy import inspect
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.exc import OperationalError, IntegrityError
 
-from telegram_bot_bridge import TelegramBotBridge
+try:
+    import orjson
+except ImportError:  # optional, only speeds up large task responses
+    orjson = None
+
+from telegram_bot_bridge import TelegramBotBridge, reminder_fire_ts
+from ttl_cache import TTLCache
+from pool_metrics import PoolMetrics
+from sqlite_tuning import sqlite_pragmas, configure_sqlite, WalCheckpointer
+from db_lease import DbLease
 
 def normalize_database_url(url: str) -> str:
     return "postgresql://" + url[len("postgres://"):] if url.startswith("postgres://") else url
 
+# Connection pool settings (defaults are SQLAlchemy's own). DB_POOL_SIZE and
+# DB_MAX_OVERFLOW are the budget of the whole process. With DB_ASYNC=1 there are
+# two engines side by side (see below); the sync one, left with schema setup, the
+# Telegram bot and the sync endpoints, gets DB_SYNC_POOL_SIZE/DB_SYNC_MAX_OVERFLOW
+# of it and the async one the rest, so the worst case stays pool size + overflow.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1"))
+DB_ASYNC = os.getenv("DB_ASYNC", "0").strip().lower() in ("1", "true", "yes", "on")
+
+def pool_sizes(kind: str) -> tuple[int, int]:
+    """(pool_size, max_overflow) of the sync or async engine."""
+    if not DB_ASYNC:
+        return DB_POOL_SIZE, DB_MAX_OVERFLOW
+    sync_size = max(1, min(int(os.getenv("DB_SYNC_POOL_SIZE", "2")), DB_POOL_SIZE - 1))
+    sync_overflow = max(0, min(int(os.getenv("DB_SYNC_MAX_OVERFLOW", "3")), DB_MAX_OVERFLOW))
+    if kind == "sync":
+        return sync_size, sync_overflow
+    return max(1, DB_POOL_SIZE - sync_size), DB_MAX_OVERFLOW - sync_overflow
+
+db_pool_metrics = {"sync": PoolMetrics(), "async": PoolMetrics()}
+
+def pool_options(db_url: str, kind: str) -> dict:
+    """create_engine() pool arguments for the sync or async engine."""
+    if db_url.startswith("sqlite") and (":memory:" in db_url or db_url.rstrip("/") in ("sqlite:", "sqlite+aiosqlite:")):
+        return {}  # in-memory SQLite needs its default single-connection pool
+    base = AsyncAdaptedQueuePool if kind == "async" else QueuePool
+    size, overflow = pool_sizes(kind)
+    return {
+        "poolclass": db_pool_metrics[kind].pool_class(base),
+        "pool_size": size,
+        "max_overflow": overflow,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+
+# SQLite tuning (only used without DATABASE_URL / with a sqlite:// URL).
+# SQLITE_TUNED=0 falls back to SQLite's defaults (rollback journal, no busy timeout).
+SQLITE_TUNED = os.getenv("SQLITE_TUNED", "1").strip().lower() not in ("0", "false", "no", "off")
+SQLITE_PRAGMAS = sqlite_pragmas(
+    synchronous=os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    busy_timeout_ms=int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    cache_size_kb=int(os.getenv("SQLITE_CACHE_SIZE_KB", "20000")),
+    mmap_size=int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+) if SQLITE_TUNED else []
+SQLITE_CHECKPOINT_INTERVAL = float(os.getenv("SQLITE_CHECKPOINT_INTERVAL", "300"))
+
 def get_engine() -> Engine:
     db_url = os.getenv("DATABASE_URL", "").strip()
     if db_url:
@@ -32,11 +95,55 @@ def get_engine() -> Engine:
             db_url = db_url.replace("postgresql://", "postgresql+psycopg2://", 1)
     else:
         db_url = "sqlite:///./tasks.db"
-    return create_engine(db_url, future=True, pool_pre_ping=True)
+    eng = create_engine(db_url, future=True, pool_pre_ping=True, **pool_options(db_url, "sync"))
+    db_pool_metrics["sync"].attach(eng)
+    configure_sqlite(eng, SQLITE_PRAGMAS)
+    return eng
 
 engine = get_engine()
 metadata = MetaData()
 
+# Opt-in async mode (DB_ASYNC): the async endpoints below run their database work
+# on an async engine (asyncpg / aiosqlite) instead of a worker thread. Schema setup,
+# the Telegram bot and the remaining sync endpoints (folder/list/section writes,
+# stats, settings) keep using `engine`, so both pools are open at once; pool_sizes()
+# splits the connection budget between them.
+
+def get_async_engine(sync_engine: Engine):
+    """Async twin of `sync_engine` (same database, asyncpg or aiosqlite driver)."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = sync_engine.url
+    if url.get_backend_name() == "postgresql":
+        sslmode = url.query.get("sslmode")
+        url = url.set(drivername="postgresql+asyncpg").difference_update_query(["sslmode"])
+        if sslmode and sslmode != "disable":
+            url = url.update_query_dict({"ssl": sslmode})
+    elif url.get_backend_name() == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+    eng = create_async_engine(url, pool_pre_ping=True, **pool_options(url.render_as_string(hide_password=True), "async"))
+    db_pool_metrics["async"].attach(eng.sync_engine)
+    configure_sqlite(eng.sync_engine, SQLITE_PRAGMAS)
+    return eng
+
+async_engine = get_async_engine(engine) if DB_ASYNC else None
+
+async def db_run(fn, *args, write: bool = False):
+    """Run fn(conn, *args) with a connection and return its result.
+
+    With DB_ASYNC the sync-style fn runs through AsyncConnection.run_sync (no
+    worker thread); otherwise it runs on the threadpool with the sync engine.
+    write=True wraps the call in a transaction that commits on success.
+    """
+    if async_engine is not None:
+        async with (async_engine.begin() if write else async_engine.connect()) as conn:
+            return await conn.run_sync(fn, *args)
+
+    def call():
+        with (engine.begin() if write else engine.connect()) as conn:
+            return fn(conn, *args)
+    return await run_in_threadpool(call)
+
 # --- Auth / Users ---
 
 bearer = HTTPBearer(auto_error=False)
@@ -100,13 +207,124 @@ def verify_password(pw: str, pw_hash: str) -> bool:
     raw = pw.encode("utf-8")[:72]
     return _check(raw)
 
+
+# Password hashing runs on its own small executor so a login burst cannot occupy
+# the shared request thread pool. bcrypt releases the GIL while hashing, so
+# threads are enough. When workers + queue are all taken, requests get an
+# immediate 503 instead of waiting.
+PASSWORD_WORKERS = max(1, int(os.getenv("PASSWORD_WORKERS", "2")))
+PASSWORD_QUEUE_MAX = max(0, int(os.getenv("PASSWORD_QUEUE_MAX", "32")))
+_pw_executor = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="ct-password")
+_pw_slots = threading.BoundedSemaphore(PASSWORD_WORKERS + PASSWORD_QUEUE_MAX)
+_PW_BUCKETS_MS = (50, 100, 200, 400, 800, 1600, 3200)
+_pw_lock = threading.Lock()
+_pw_stats = {
+    "inFlight": 0, "running": 0, "completed": 0, "rejected": 0,
+    "latencyMsTotal": 0.0, "latencyMsMax": 0.0, "waitMsTotal": 0.0, "waitMsMax": 0.0,
+    "latencyBuckets": [0] * (len(_PW_BUCKETS_MS) + 1),
+}
+
+def _pw_record(wait_ms: float, run_ms: float) -> None:
+    with _pw_lock:
+        st = _pw_stats
+        st["completed"] += 1
+        st["latencyMsTotal"] += run_ms
+        st["latencyMsMax"] = max(st["latencyMsMax"], run_ms)
+        st["waitMsTotal"] += wait_ms
+        st["waitMsMax"] = max(st["waitMsMax"], wait_ms)
+        i = next((k for k, b in enumerate(_PW_BUCKETS_MS) if run_ms <= b), len(_PW_BUCKETS_MS))
+        st["latencyBuckets"][i] += 1
+
+async def run_password_job(fn, *args):
+    """Run hash_password / verify_password on the password executor (503 when saturated)."""
+    if not _pw_slots.acquire(blocking=False):
+        with _pw_lock:
+            _pw_stats["rejected"] += 1
+        raise HTTPException(status_code=503, detail="Сервер перегружен, попробуйте позже", headers={"Retry-After": "1"})
+    queued_at = time.perf_counter()
+
+    def job():
+        started = time.perf_counter()
+        with _pw_lock:
+            _pw_stats["running"] += 1
+        try:
+            return fn(*args)
+        finally:
+            done = time.perf_counter()
+            with _pw_lock:
+                _pw_stats["running"] -= 1
+            _pw_record((started - queued_at) * 1000.0, (done - started) * 1000.0)
+
+    with _pw_lock:
+        _pw_stats["inFlight"] += 1
+    try:
+        return await asyncio.wrap_future(_pw_executor.submit(job))
+    finally:
+        with _pw_lock:
+            _pw_stats["inFlight"] -= 1
+        _pw_slots.release()
+
+def password_metrics() -> dict:
+    with _pw_lock:
+        st = dict(_pw_stats)
+        buckets = list(st["latencyBuckets"])
+    n = st["completed"] or 1
+    labels = [f"le_{b}" for b in _PW_BUCKETS_MS] + ["inf"]
+    return {
+        "workers": PASSWORD_WORKERS,
+        "queueMax": PASSWORD_QUEUE_MAX,
+        "inFlight": st["inFlight"],
+        "running": st["running"],
+        "queued": max(0, st["inFlight"] - st["running"]),
+        "completed": st["completed"],
+        "rejected": st["rejected"],
+        "latencyMs": {"avg": round(st["latencyMsTotal"] / n, 2), "max": round(st["latencyMsMax"], 2), "buckets": dict(zip(labels, buckets))},
+        "waitMs": {"avg": round(st["waitMsTotal"] / n, 2), "max": round(st["waitMsMax"], 2)},
+    }
+
 def create_token(user_id: str) -> str:
     exp = now_ts() + JWT_TTL_SECONDS
     return jwt.encode({"sub": user_id, "exp": exp}, JWT_SECRET, algorithm=JWT_ALG)
 
 
 
-def require_user(
+# Verified sessions: token -> (stamp, users row). Saves the JWT decode and the
+# users lookup for bursts of requests; entries never outlive the token's own
+# expiry. Other workers don't see invalidate_user_sessions, so the TTL is how long
+# they may serve an old users row (password change, Telegram unlink): keep it short.
+_session_cache = TTLCache(
+    maxsize=int(os.getenv("SESSION_CACHE_MAX", "10000")),
+    ttl=int(os.getenv("SESSION_CACHE_TTL", "5")),
+)
+# user_id -> (stamp, monotonic time) of their last invalidation; sessions cached with
+# an older stamp are void. Not an LRU: an evicted revocation would bring the revoked
+# sessions back. Entries are dropped only once they are older than any cached session.
+_session_revoked: "OrderedDict[str, tuple[int, float]]" = OrderedDict()
+_session_revoked_lock = threading.Lock()
+_session_stamps = itertools.count(1)
+
+def invalidate_user_sessions(user_id: str) -> None:
+    """Forget cached sessions of a user (call after a change to their credentials or Telegram link)."""
+    now = time.monotonic()
+    with _session_revoked_lock:
+        _session_revoked.pop(user_id, None)
+        _session_revoked[user_id] = (next(_session_stamps), now)
+        while _session_revoked:
+            _, (_, at) = next(iter(_session_revoked.items()))
+            if now - at <= _session_cache.ttl:
+                break
+            _session_revoked.popitem(last=False)
+
+def _session_revoked_stamp(user_id: str) -> int:
+    with _session_revoked_lock:
+        hit = _session_revoked.get(user_id)
+    return hit[0] if hit else 0
+
+
+def _user_by_id(conn, user_id: str):
+    return conn.execute(select(users).where(users.c.id == user_id)).mappings().first()
+
+async def require_user(
     request: Request,
     creds: HTTPAuthorizationCredentials | None = Depends(bearer),
     ct_token: str | None = Cookie(default=None, alias=AUTH_COOKIE),
@@ -133,6 +351,13 @@ def require_user(
     if not token:
         return guest()
 
+    cached = _session_cache.get(token)
+    if cached is not None:
+        stamp, u = cached
+        if stamp > _session_revoked_stamp(u["id"]):
+            return u
+        _session_cache.pop(token)
+
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
         uid = payload.get("sub")
@@ -141,10 +366,13 @@ def require_user(
     except JWTError:
         return guest()
 
-    with engine.connect() as conn:
-        u = conn.execute(select(users).where(users.c.id == uid)).mappings().first()
+    stamp = next(_session_stamps)  # taken before the read: an invalidation racing it wins
+    u = await db_run(_user_by_id, uid)
     if not u:
         return guest()
+    ttl = min(_session_cache.ttl, int(payload.get("exp") or 0) - now_ts())
+    if ttl > 0:
+        _session_cache.set(token, (stamp, u), ttl=ttl)
     return u
 
 
@@ -218,31 +446,91 @@ tasks = Table(
     Column("tags_json", Text, nullable=False, server_default="[]"),
     Column("subtasks_json", Text, nullable=False, server_default="[]"),
     Column("tg_reminder_sent_at", BigInteger, nullable=True),
+    # Epoch second the reminder is due (derived from due_date/due_time/reminder_minutes).
+    Column("reminder_fire_at", BigInteger, nullable=True),
     Column("trashed", Boolean, nullable=False, server_default="false"),
     Column("trashed_at", BigInteger, nullable=True),
 )
 
+# Normalized copy of tasks.tags_json (one row per task/tag) for indexed tag filters and counts.
+task_tags = Table(
+    "task_tags", metadata,
+    Column("task_id", String, primary_key=True),
+    Column("tag", String, primary_key=True),
+    Column("user_id", String, nullable=True),
+)
+
+# Delta sync: per-user monotonic data version plus a compacted change journal
+# (one row per changed entity, holding the version of its latest change).
+sync_versions = Table(
+    "sync_versions", metadata,
+    Column("user_id", String, primary_key=True),
+    Column("version", BigInteger, nullable=False, server_default="0"),
+    # Tombstones at or below this version were pruned; older clients must resync fully.
+    Column("floor_version", BigInteger, nullable=False, server_default="0"),
+)
+
+change_log = Table(
+    "change_log", metadata,
+    Column("user_id", String, primary_key=True),
+    Column("entity", String, primary_key=True),
+    Column("entity_id", String, primary_key=True),
+    Column("version", BigInteger, nullable=False),
+    Column("op", String, nullable=False),
+    Column("changed_at", BigInteger, nullable=False),
+)
+
+SYNC_ENTITIES = ("folders", "lists", "sections", "tasks")
+
+# Applied schema migrations (one row per MIGRATIONS step).
+schema_version = Table(
+    "schema_version", metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", BigInteger, nullable=False),
+)
+
+# Leader leases for background work that must run in one process only (see db_lease.py).
+leases = Table(
+    "leases", metadata,
+    Column("name", String, primary_key=True),
+    Column("holder", String, nullable=False),
+    Column("expires_at", BigInteger, nullable=False),
+    Column("renewed_at", BigInteger, nullable=False),
+)
+
+# Telegram bot per-chat state (view mode, last list and page); see chat_state.py.
+telegram_chat_state = Table(
+    "telegram_chat_state", metadata,
+    Column("chat_id", String, primary_key=True),
+    Column("view_mode", String, nullable=True),
+    Column("last_mode", String, nullable=True),
+    Column("last_page", Integer, nullable=True),
+    Column("updated_at", BigInteger, nullable=False),
+)
+
+# Telegram updates taken by the polling leader: a row per dispatched update, marked
+# done when its handler finishes. The newest row is the resume offset, the oldest
+# unfinished one the completed watermark (see TelegramBotBridge._updates_loop).
+telegram_updates = Table(
+    "telegram_updates", metadata,
+    Column("update_id", BigInteger, primary_key=True, autoincrement=False),
+    Column("payload", Text, nullable=False),
+    Column("done", Boolean, nullable=False, server_default="false"),
+    Column("received_at", BigInteger, nullable=False),
+)
+
+# Shared Telegram send slots (bot-wide and per chat) for webhook mode, where every
+# worker sends; see db_rate_limit.py.
+telegram_rate = Table(
+    "telegram_rate", metadata,
+    Column("key", String, primary_key=True),
+    Column("next_at", BigInteger, nullable=False),
+)
+
 def now_ts() -> int:
     return int(datetime.now(tz=timezone.utc).timestamp())
 
-def next_sort_order(table: Table, conn=None, user_id: str | None = None) -> int:
-    """Return next sort_order (increments by 10). If table has user_id, compute per-user."""
-    close = False
-    if conn is None:
-        conn = engine.connect()
-        close = True
-    try:
-        stmt = select(table.c.sort_order)
-        if user_id is not None and "user_id" in table.c:
-            stmt = stmt.where(table.c.user_id == user_id)
-        r = conn.execute(stmt.order_by(table.c.sort_order.desc())).first()
-    finally:
-        if close:
-            conn.close()
-    cur = int(r[0]) if r and r[0] is not None else 0
-    # Keep room for inserts between items.
-    return cur + 10
-
 def gen_id() -> str:
     return f"{now_ts()}_{os.urandom(4).hex()}"
 
@@ -307,6 +595,8 @@ def validate_duration_minutes(v: Optional[int]) -> Optional[int]:
     return n
 
 def parse_tags_json(s: str) -> List[str]:
+    if not s or s == "[]":
+        return []
     try:
         v = json.loads(s or "[]")
         if isinstance(v, list):
@@ -327,7 +617,57 @@ def dumps_tags(tags: List[str]) -> str:
     return json.dumps(out, ensure_ascii=False)
 
 
-def parse_subtasks_json(s: str) -> List[dict]:
+def sync_task_tags(conn, user_id: str, task_id: str, tags_json: str) -> None:
+    """Replace task_tags rows of a task with the tags stored in its tags_json."""
+    sync_task_tags_many(conn, user_id, {task_id: tags_json})
+
+def sync_task_tags_many(conn, user_id: str, tags_by_task: dict[str, str]) -> None:
+    """sync_task_tags for many tasks at once (task id -> tags_json)."""
+    if not tags_by_task:
+        return
+    conn.execute(delete(task_tags).where(task_tags.c.task_id.in_(list(tags_by_task))))
+    rows = [{"task_id": tid, "tag": t, "user_id": user_id}
+            for tid, tj in tags_by_task.items() for t in dict.fromkeys(parse_tags_json(tj))]
+    if rows:
+        conn.execute(insert(task_tags), rows)
+
+
+def record_change(conn, user_id: str, entity: str, ids, op: str = "upsert") -> Optional[int]:
+    """Journal a change of `ids` (entity in SYNC_ENTITIES, op "upsert" or "delete").
+
+    Bumps the user's data version inside the caller's transaction and returns it.
+    The sync_versions row lock serializes writers of one user, so versions become
+    visible in commit order.
+    """
+    ids = [i for i in dict.fromkeys(ids) if i]
+    if not ids:
+        return None
+    version = conn.execute(
+        text(
+            "INSERT INTO sync_versions (user_id, version, floor_version) VALUES (:u, 1, 0) "
+            "ON CONFLICT (user_id) DO UPDATE SET version = sync_versions.version + 1 "
+            "RETURNING version"
+        ),
+        {"u": user_id},
+    ).scalar_one()
+    ts = now_ts()
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        conn.execute(delete(change_log).where(and_(change_log.c.user_id == user_id, change_log.c.entity == entity, change_log.c.entity_id.in_(chunk))))
+        conn.execute(insert(change_log), [
+            {"user_id": user_id, "entity": entity, "entity_id": eid, "version": version, "op": op, "changed_at": ts}
+            for eid in chunk
+        ])
+    return int(version)
+
+
+def legacy_subtask_id(task_id: str, index: int) -> str:
+    """Stable id for a stored subtask that has none (rows written by old versions)."""
+    return f"{task_id}.{index}"
+
+def parse_subtasks_json(s: str, task_id: str = "") -> List[dict]:
+    if not s or s == "[]":
+        return []
     try:
         v = json.loads(s or "[]")
     except Exception:
@@ -335,13 +675,13 @@ def parse_subtasks_json(s: str) -> List[dict]:
     if not isinstance(v, list):
         return []
     out: List[dict] = []
-    for it in v:
+    for i, it in enumerate(v):
         if not isinstance(it, dict):
             continue
         title = str(it.get("title") or "").strip()
         if not title:
             continue
-        sid = str(it.get("id") or gen_id())
+        sid = str(it.get("id") or legacy_subtask_id(task_id, i))
         out.append({"id": sid, "title": title[:240], "completed": bool(it.get("completed"))})
     return out
 
@@ -384,17 +724,15 @@ def ensure_columns(table_name: str, required: dict[str, str]) -> None:
             if col not in cols:
                 conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {ddl}"))
 
-def init_db():
+def upgrade_legacy_columns():
     """
-    Create tables if missing and apply lightweight migrations for older schemas.
+    Apply lightweight migrations for schemas created by older versions.
 
     Important (Railway/Postgres):
     - metadata.create_all() does NOT add missing columns to existing tables.
     - If you deployed an older version before, Postgres may have an old `tasks` table.
       We upgrade it in-place (ADD COLUMN) to avoid 500 errors.
     """
-    metadata.create_all(engine)
-
     insp = inspect(engine)
 
     # lists migrations
@@ -472,7 +810,76 @@ def init_db():
             except Exception:
                 pass
 
-init_db()
+
+# Managed secondary indexes: (name, table, columns, partial WHERE or None).
+# Every index maps to one hot per-user query shape. Names carry a version suffix:
+# to change an index, add the new name here, move the old one to RETIRED_INDEXES
+# and append a MIGRATIONS step that calls ensure_indexes().
+MANAGED_INDEXES: list[tuple[str, str, str, Optional[str]]] = [
+    # list_tasks (filter + due sort), get_counts today/next7, get_stats totals
+    ("ix_tasks_user_state_due_v1", "tasks", "user_id, trashed, completed, due_date, due_time", None),
+    # list_tasks(list_id, sort=manual), reorder_tasks, get_counts byList
+    ("ix_tasks_user_list_section_order_v1", "tasks", "user_id, list_id, section_id, order_index", None),
+    # get_stats completed-per-day, list_tasks(sort=completed / completed_from..to)
+    ("ix_tasks_user_completed_at_v1", "tasks", "user_id, completed, completed_at", None),
+    # list_tasks(filter=trash, sort=trashed), empty_trash
+    ("ix_tasks_user_trashed_at_v1", "tasks", "user_id, trashed, trashed_at", None),
+    # get_stats first task, list_tasks(sort=created)
+    ("ix_tasks_user_created_v1", "tasks", "user_id, created_at", None),
+    # Telegram reminder scheduler: pending reminders by fire time
+    ("ix_tasks_reminder_fire_v1", "tasks", "reminder_fire_at",
+     "tg_reminder_sent_at IS NULL AND reminder_fire_at IS NOT NULL"),
+    # Telegram bot: chat -> user on every update and callback
+    ("ix_users_telegram_chat_v1", "users", "telegram_chat_id", "telegram_chat_id IS NOT NULL"),
+    # inbox_list_id / ensure_user_defaults, get_lists
+    ("ix_lists_user_system_key_v1", "lists", "user_id, system_key", None),
+    ("ix_lists_user_sort_v1", "lists", "user_id, sort_order", None),
+    ("ix_folders_user_sort_v1", "folders", "user_id, sort_order", None),
+    ("ix_sections_user_list_sort_v1", "sections", "user_id, list_id, sort_order", None),
+    # list_tasks(tag=...) join and list_tags GROUP BY (tag match is case-insensitive)
+    ("ix_task_tags_user_tag_v1", "task_tags", "user_id, lower(tag)", None),
+    # /api/sync: changes after a version; tombstone pruning
+    ("ix_change_log_user_version_v1", "change_log", "user_id, version", None),
+]
+
+# Superseded index names; dropped by ensure_indexes().
+RETIRED_INDEXES: list[str] = [
+    "ix_tasks_reminder_pending_v1",  # replaced by ix_tasks_reminder_fire_v1
+]
+
+
+def ensure_indexes() -> None:
+    """Create managed indexes and drop retired ones (best-effort, Postgres + SQLite).
+
+    Each statement runs in its own transaction so one failure (e.g. missing column on
+    a very old schema) does not abort the rest on Postgres.
+    """
+    for name in RETIRED_INDEXES:
+        with engine.begin() as conn:
+            try:
+                conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+            except Exception:
+                pass
+    for name, table_name, cols, where in MANAGED_INDEXES:
+        ddl = f"CREATE INDEX IF NOT EXISTS {name} ON {table_name} ({cols})"
+        if where:
+            ddl += f" WHERE {where}"
+        with engine.begin() as conn:
+            try:
+                conn.execute(text(ddl))
+            except Exception:
+                pass
+
+# --- Rank keys (manual ordering) ---
+#
+# Folders, lists and sections order by sort_order, tasks (manual sort) by
+# order_index. Ranks are sparse integers: moving an item takes the midpoint of
+# its new neighbours, so only that row is written. When a gap runs out the
+# whole scope is renumbered RANK_STEP apart (inline if there is no room at all,
+# otherwise in the background once gaps get small).
+
+RANK_STEP = 1024
+RANK_MIN_GAP = 4
 
 # No-auth mode: shared workspace identifier (all data belongs to this id).
 PUBLIC_UID = os.getenv("PUBLIC_UID", "public")
@@ -481,29 +888,33 @@ PUBLIC_UID = os.getenv("PUBLIC_UID", "public")
 def ensure_user_defaults(conn, user_id: str) -> None:
     """Create default lists for a user if missing."""
     defaults = [
-        ("inbox", "Входящие", "📥", 10),
-        ("welcome", "Добро пожаловать", "👋", 20),
-        ("work", "Работа", "💼", 30),
-        ("personal", "Личный", "🏠", 40),
+        ("inbox", "Входящие", "📥", 1),
+        ("welcome", "Добро пожаловать", "👋", 2),
+        ("work", "Работа", "💼", 3),
+        ("personal", "Личный", "🏠", 4),
     ]
+    created = []
     for key, title, emoji, order in defaults:
         exists = conn.execute(
             select(lists.c.id).where(and_(lists.c.user_id == user_id, lists.c.system_key == key))
         ).first()
         if exists:
             continue
+        lid = gen_id()
+        created.append(lid)
         conn.execute(
             insert(lists).values(
-                id=gen_id(),
+                id=lid,
                 user_id=user_id,
                 system_key=key,
                 title=title,
                 emoji=emoji,
-                sort_order=order,
+                sort_order=order * RANK_STEP,
                 created_at=now_ts(),
                 folder_id=None,
             )
         )
+    record_change(conn, user_id, "lists", created)
 
 def is_first_user(conn) -> bool:
     try:
@@ -513,26 +924,161 @@ def is_first_user(conn) -> bool:
         return True
 
 
-# Guest workspace: attach legacy rows (user_id IS NULL) to PUBLIC_UID and ensure default lists exist.
-with engine.begin() as conn:
-    try:
+def attach_legacy_rows_to_guest() -> None:
+    """Guest workspace: attach legacy rows (user_id IS NULL) to PUBLIC_UID and ensure default lists exist.
+
+    Errors propagate: the migration runner must not record a step that failed.
+    """
+    ensure_columns("sections", {"user_id": "user_id TEXT"})  # predates per-user sections
+    with engine.begin() as conn:
         conn.execute(update(lists).where(lists.c.user_id.is_(None)).values(user_id=PUBLIC_UID))
         conn.execute(update(folders).where(folders.c.user_id.is_(None)).values(user_id=PUBLIC_UID))
         conn.execute(update(tasks).where(tasks.c.user_id.is_(None)).values(user_id=PUBLIC_UID))
-        try:
-            conn.execute(update(sections).where(sections.c.user_id.is_(None)).values(user_id=PUBLIC_UID))
-        except Exception:
-            pass
-    except Exception:
-        pass
-    try:
+        conn.execute(update(sections).where(sections.c.user_id.is_(None)).values(user_id=PUBLIC_UID))
         ensure_user_defaults(conn, PUBLIC_UID)
+
+
+def backfill_task_tags() -> None:
+    """Populate task_tags for tasks that have tags_json but no normalized rows yet."""
+    has_rows = select(task_tags.c.task_id).where(task_tags.c.task_id == tasks.c.id).exists()
+    stmt = (
+        select(tasks.c.id, tasks.c.user_id, tasks.c.tags_json)
+        .where(and_(tasks.c.tags_json.is_not(None), tasks.c.tags_json != "[]", ~has_rows))
+    )
+    with engine.begin() as conn:
+        for tid, uid, tj in conn.execute(stmt).all():
+            sync_task_tags(conn, uid, tid, tj)
+
+def backfill_reminder_fire_at() -> None:
+    """Add tasks.reminder_fire_at and compute it for existing reminders."""
+    ensure_columns("tasks", {"reminder_fire_at": "reminder_fire_at BIGINT"})
+    stmt = select(tasks.c.id, tasks.c.due_date, tasks.c.due_time, tasks.c.reminder_minutes).where(
+        and_(tasks.c.due_date.is_not(None), tasks.c.reminder_minutes.is_not(None), tasks.c.reminder_fire_at.is_(None))
+    )
+    with engine.begin() as conn:
+        params = []
+        for tid, due_date, due_time, minutes in conn.execute(stmt).all():
+            fire_at = reminder_fire_ts(due_date, due_time, minutes)
+            if fire_at is not None:
+                params.append({"tid": tid, "fire_at": fire_at})
+        if params:
+            conn.execute(
+                update(tasks).where(tasks.c.id == bindparam("tid")).values(reminder_fire_at=bindparam("fire_at")),
+                params,
+            )
+
+def backfill_subtask_ids() -> None:
+    """Store ids for subtasks saved without one (the ids reads already derive for them)."""
+    stmt = select(tasks.c.id, tasks.c.subtasks_json).where(and_(tasks.c.subtasks_json.is_not(None), tasks.c.subtasks_json != "[]"))
+    with engine.begin() as conn:
+        params = []
+        for tid, sj in conn.execute(stmt).all():
+            try:
+                raw = json.loads(sj)
+            except Exception:
+                continue
+            if isinstance(raw, list) and any(isinstance(it, dict) and not it.get("id") for it in raw):
+                params.append({"tid": tid, "sj": json.dumps(parse_subtasks_json(sj, tid), ensure_ascii=False)})
+        if params:
+            conn.execute(
+                update(tasks).where(tasks.c.id == bindparam("tid")).values(subtasks_json=bindparam("sj")),
+                params,
+            )
+
+# Ordered schema migrations: (version, name, step). Each step runs once per
+# database and is recorded in schema_version; a fully migrated database only
+# costs one version query at boot. Append new steps, never edit applied ones;
+# steps must be idempotent because a crash between a step and its record
+# re-runs it. New tables go through create_all in their own step.
+MIGRATIONS: list[tuple[int, str, object]] = [
+    (1, "create tables", lambda: metadata.create_all(engine)),
+    (2, "legacy columns", upgrade_legacy_columns),
+    (3, "managed indexes v1", ensure_indexes),
+    (4, "guest workspace backfill", attach_legacy_rows_to_guest),
+    (5, "task_tags backfill", backfill_task_tags),
+    (6, "tasks.reminder_fire_at", backfill_reminder_fire_at),
+    (7, "reminder_fire_at index", ensure_indexes),
+    (8, "leases table", lambda: leases.create(engine, checkfirst=True)),
+    (9, "users.telegram_chat_id index", ensure_indexes),
+    (10, "telegram_chat_state table", lambda: telegram_chat_state.create(engine, checkfirst=True)),
+    (11, "subtask ids backfill", backfill_subtask_ids),
+    (12, "telegram_updates table", lambda: telegram_updates.create(engine, checkfirst=True)),
+    # step 4 used to swallow its errors and get recorded anyway; run it again for those databases
+    (13, "guest workspace backfill, retry", attach_legacy_rows_to_guest),
+    (14, "telegram_chat_state last page", lambda: ensure_columns("telegram_chat_state", {
+        "last_mode": "last_mode TEXT",
+        "last_page": "last_page INTEGER",
+    })),
+    (15, "telegram_rate table", lambda: telegram_rate.create(engine, checkfirst=True)),
+]
+
+# Arbitrary key for the Postgres advisory lock that serializes migrating workers.
+MIGRATION_LOCK_KEY = 0x74746D67
+
+def current_schema_version(conn) -> int:
+    return int(conn.execute(select(func.max(schema_version.c.version))).scalar() or 0)
+
+def init_db() -> None:
+    """Bring the database schema up to the last MIGRATIONS step."""
+    target = MIGRATIONS[-1][0]
+    try:
+        with engine.connect() as conn:
+            if current_schema_version(conn) >= target:
+                return
     except Exception:
-        pass
+        pass  # no schema_version table yet
+
+    if engine.dialect.name != "postgresql":
+        # No advisory lock here: workers booting together on a fresh SQLite file can
+        # collide ("already exists", duplicate version row). Steps are idempotent, so
+        # back off and re-read the version until whoever got ahead has finished.
+        for attempt in range(10):
+            try:
+                return apply_migrations()
+            except (OperationalError, IntegrityError):
+                if attempt == 9:
+                    raise
+                time.sleep(0.2 + random.random() * 0.3)
+
+    with engine.connect() as lock_conn:
+        # Other workers booting at the same time wait here, then see the new version.
+        lock_conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": MIGRATION_LOCK_KEY})
+        lock_conn.commit()
+        try:
+            apply_migrations()
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": MIGRATION_LOCK_KEY})
+            lock_conn.commit()
+
+def apply_migrations() -> None:
+    schema_version.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        done = current_schema_version(conn)
+    for version, name, step in MIGRATIONS:
+        if version <= done:
+            continue
+        started = time.perf_counter()
+        step()  # a failing step raises out of here and stays unrecorded, so the next boot retries it
+        with engine.begin() as conn:
+            conn.execute(insert(schema_version).values(version=version, name=name, applied_at=now_ts()))
+        print(f"[db] migration {version} ({name}) applied in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+init_db()
 
 app = FastAPI(title="TickTick-like ToDo (v4-fixed)")
-tg_bridge = TelegramBotBridge(engine=engine, users=users, tasks=tasks, lists=lists, now_ts_fn=now_ts, gen_id_fn=gen_id, logger=lambda m: print(f"[tg] {m}"))
-app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=False, allow_methods=["*"], allow_headers=["*"])
+def _on_bot_tasks_changed(user_id: str) -> None:
+    invalidate_counts(user_id)
+
+def _on_bot_user_changed(user_id: str) -> None:
+    invalidate_user_sessions(user_id)
+
+def reminders_touched(rows) -> None:
+    """Wake the bot's reminder scheduler if a written task row has a pending reminder."""
+    if any(r and r["reminder_fire_at"] is not None and r["tg_reminder_sent_at"] is None for r in rows):
+        tg_bridge.reminders_changed()
+
+tg_bridge = TelegramBotBridge(engine=engine, users=users, tasks=tasks, lists=lists, task_tags=task_tags, sync_versions=sync_versions, chat_state=telegram_chat_state, updates_log=telegram_updates, rate_limits=telegram_rate, now_ts_fn=now_ts, gen_id_fn=gen_id, on_tasks_changed=_on_bot_tasks_changed, on_user_changed=_on_bot_user_changed, journal_fn=record_change, task_rank_fn=lambda conn, uid, lid: next_rank(conn, "tasks", uid, lid), logger=lambda m: print(f"[tg] {m}"))
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=False, allow_methods=["*"], allow_headers=["*"], expose_headers=["X-Next-Cursor"])
 
 Filter = Literal["all", "active", "completed", "trash"]
 Sort = Literal["due", "created", "manual", "completed", "trashed"]
@@ -614,11 +1160,27 @@ class TaskUpdate(BaseModel):
     subtasks: Optional[List[SubtaskItem]] = None
     trashed: Optional[bool] = None
 
+class TaskBatchOp(TaskUpdate):
+    """A TaskUpdate applied to every task in `ids`."""
+    ids: List[str]
+
+class TaskBatch(BaseModel):
+    ops: List[TaskBatchOp]
+
 class ReorderPayload(BaseModel):
     listId: str
     sectionId: Optional[str] = None
     orderedIds: List[str]
 
+class MovePayload(BaseModel):
+    """Place an item right after `afterId` and/or right before `beforeId` (neither = move to end)."""
+    afterId: Optional[str] = None
+    beforeId: Optional[str] = None
+
+class TaskMove(MovePayload):
+    listId: Optional[str] = None
+    sectionId: Optional[str] = None
+
 class TaskOut(BaseModel):
     id: str; title: str; completed: bool
     createdAt: int; updatedAt: int; completedAt: Optional[int] = None
@@ -639,25 +1201,75 @@ class TaskOut(BaseModel):
 def to_folder_out(r): return FolderOut(id=r["id"], title=r["title"], emoji=r["emoji"], sortOrder=int(r["sort_order"]))
 def to_list_out(r): return ListOut(id=r["id"], title=r["title"], emoji=r["emoji"], sortOrder=int(r["sort_order"]), folderId=r.get("folder_id"), systemKey=r.get("system_key"))
 def to_section_out(r): return SectionOut(id=r["id"], listId=r["list_id"], title=r["title"], sortOrder=int(r["sort_order"]))
-def to_task_out(r): 
-    return TaskOut(
-        id=r["id"], title=r["title"], completed=bool(r["completed"]),
-        createdAt=int(r["created_at"]), updatedAt=int(r["updated_at"]),
-        completedAt=(int(r["completed_at"]) if r["completed_at"] is not None else None),
-        listId=r["list_id"], sectionId=r.get("section_id"), dueDate=r["due_date"],
-        dueTime=r.get("due_time"),
-        reminderMinutes=(int(r.get("reminder_minutes")) if r.get("reminder_minutes") is not None else None),
-        repeatRule=(r.get("repeat_rule") or None),
-        durationMinutes=(int(r.get("duration_minutes")) if r.get("duration_minutes") is not None else None),
-        pinned=bool(r.get("pinned") or False),
-        orderIndex=(int(r["order_index"]) if r.get("order_index") is not None else None),
-        tags=parse_tags_json(r.get("tags_json") or "[]"),
-        priority=int(r.get("priority") or 0),
-        notes=r.get("notes"),
-        subtasks=parse_subtasks_json(r.get("subtasks_json") or "[]"),
-        trashed=bool(r.get("trashed") or False),
-        trashedAt=(int(r.get("trashed_at")) if r.get("trashed_at") is not None else None),
-    )
+def task_dict(r) -> dict:
+    """TaskOut-shaped plain dict for a tasks row (already valid, no model validation needed)."""
+    return {
+        "id": r["id"], "title": r["title"], "completed": bool(r["completed"]),
+        "createdAt": int(r["created_at"]), "updatedAt": int(r["updated_at"]),
+        "completedAt": (int(r["completed_at"]) if r["completed_at"] is not None else None),
+        "listId": r["list_id"], "sectionId": r.get("section_id"), "dueDate": r["due_date"],
+        "dueTime": r.get("due_time"),
+        "reminderMinutes": (int(r.get("reminder_minutes")) if r.get("reminder_minutes") is not None else None),
+        "repeatRule": (r.get("repeat_rule") or None),
+        "durationMinutes": (int(r.get("duration_minutes")) if r.get("duration_minutes") is not None else None),
+        "pinned": bool(r.get("pinned") or False),
+        "orderIndex": (int(r["order_index"]) if r.get("order_index") is not None else None),
+        "tags": parse_tags_json(r.get("tags_json")),
+        "priority": int(r.get("priority") or 0),
+        "notes": r.get("notes"),
+        "subtasks": parse_subtasks_json(r.get("subtasks_json"), r["id"]),
+        "trashed": bool(r.get("trashed") or False),
+        "trashedAt": (int(r.get("trashed_at")) if r.get("trashed_at") is not None else None),
+    }
+
+def to_task_out(r):
+    return TaskOut(**task_dict(r))
+
+def dumps_json(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def json_response(data, headers: Optional[dict] = None) -> Response:
+    """Pre-serialized JSON response; bypasses response_model validation, so `data` must already match it."""
+    return Response(content=dumps_json(data), media_type="application/json", headers=headers)
+
+def _opt_int(v): return int(v) if v is not None else None
+
+# fields= projection for GET /api/tasks: output field -> (source columns, converter).
+TASK_FIELDS: dict[str, tuple[tuple[str, ...], object]] = {
+    "id": (("id",), lambda r: r["id"]),
+    "title": (("title",), lambda r: r["title"]),
+    "completed": (("completed",), lambda r: bool(r["completed"])),
+    "createdAt": (("created_at",), lambda r: int(r["created_at"])),
+    "updatedAt": (("updated_at",), lambda r: int(r["updated_at"])),
+    "completedAt": (("completed_at",), lambda r: _opt_int(r["completed_at"])),
+    "listId": (("list_id",), lambda r: r["list_id"]),
+    "sectionId": (("section_id",), lambda r: r["section_id"]),
+    "dueDate": (("due_date",), lambda r: r["due_date"]),
+    "dueTime": (("due_time",), lambda r: r["due_time"]),
+    "reminderMinutes": (("reminder_minutes",), lambda r: _opt_int(r["reminder_minutes"])),
+    "repeatRule": (("repeat_rule",), lambda r: r["repeat_rule"] or None),
+    "durationMinutes": (("duration_minutes",), lambda r: _opt_int(r["duration_minutes"])),
+    "pinned": (("pinned",), lambda r: bool(r["pinned"] or False)),
+    "orderIndex": (("order_index",), lambda r: _opt_int(r["order_index"])),
+    "tags": (("tags_json",), lambda r: parse_tags_json(r["tags_json"] or "[]")),
+    "priority": (("priority",), lambda r: int(r["priority"] or 0)),
+    "notes": (("notes",), lambda r: r["notes"]),
+    "subtasks": (("id", "subtasks_json"), lambda r: parse_subtasks_json(r["subtasks_json"] or "[]", r["id"])),
+    "trashed": (("trashed",), lambda r: bool(r["trashed"] or False)),
+    "trashedAt": (("trashed_at",), lambda r: _opt_int(r["trashed_at"])),
+}
+
+def parse_task_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Parse `fields=a,b,c` into a list of TaskOut names (id always included); None = all."""
+    if fields is None:
+        return None
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in names if f not in TASK_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return ["id"] + [f for f in dict.fromkeys(names) if f != "id"]
 
 def inbox_list_id(conn, user_id: str) -> str:
     row = conn.execute(
@@ -696,6 +1308,200 @@ def ensure_section_exists(conn, user_id: str, section_id: str, list_id: Optional
         raise HTTPException(status_code=400, detail="Section does not belong to list")
     return row
 
+def data_version(conn, user_id: str) -> int:
+    """Current delta-sync version of a user (bumped by record_change on every write)."""
+    v = conn.execute(select(sync_versions.c.version).where(sync_versions.c.user_id == user_id)).scalar()
+    return int(v or 0)
+
+async def conditional_get(request: Request, response: Response, user: dict, *, dated: bool = False) -> Optional[Response]:
+    """ETag handling for read endpoints.
+
+    The tag combines the user's data version with the user id, the request URL
+    and (for date-relative payloads like counts) today's date. Returns a 304
+    response when If-None-Match matches; otherwise sets ETag on `response`.
+    The version is kept in request.state.data_version for handlers that cache by it.
+    """
+    version = await db_run(data_version, user["id"])
+    request.state.data_version = version
+    scope = f"{user['id']}|{request.url.path}?{request.url.query}|{today_str() if dated else ''}"
+    tag = f'W/"{version}-{hashlib.sha1(scope.encode("utf-8")).hexdigest()[:16]}"'
+    headers = {"ETag": tag, "Cache-Control": "private, no-cache"}
+    inm = request.headers.get("if-none-match") or ""
+    if tag in [t.strip() for t in inm.split(",")] or inm.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+# --- Rank keys (manual ordering) ---
+# RANK_STEP / RANK_MIN_GAP are defined next to the schema (defaults are seeded with them).
+
+def rank_scope(entity: str, user_id: str, list_id: Optional[str] = None, section_id: Optional[str] = None):
+    """(table, rank column, scope conditions) for an orderable entity."""
+    if entity == "tasks":
+        conds = [tasks.c.user_id == user_id, tasks.c.list_id == list_id,
+                 tasks.c.section_id == section_id if section_id else tasks.c.section_id.is_(None)]
+        return tasks, tasks.c.order_index, conds
+    table = {"folders": folders, "lists": lists, "sections": sections}[entity]
+    return table, table.c.sort_order, [table.c.user_id == user_id]
+
+def _rank_order(table, rank_col) -> list:
+    nulls_last = case((rank_col.is_(None), 1), else_=0)
+    tie = table.c.created_at.desc() if table is tasks else table.c.created_at.asc()
+    return [nulls_last.asc(), rank_col.asc(), tie, table.c.id.asc()]
+
+def write_ranks(conn, table, rank_col, ranks: dict[str, int]) -> None:
+    """Set many ranks with one UPDATE ... CASE per 500 ids."""
+    items = list(ranks.items())
+    for i in range(0, len(items), 500):
+        chunk = dict(items[i:i + 500])
+        conn.execute(
+            update(table)
+            .where(table.c.id.in_(list(chunk)))
+            .values({rank_col.name: case(chunk, value=table.c.id)})
+        )
+
+def rebalance_ranks(conn, entity: str, user_id: str, list_id: Optional[str] = None, section_id: Optional[str] = None) -> None:
+    """Renumber a scope RANK_STEP apart, keeping its current order."""
+    table, rank_col, scope = rank_scope(entity, user_id, list_id, section_id)
+    rows = conn.execute(select(table.c.id, rank_col).where(and_(*scope)).order_by(*_rank_order(table, rank_col))).all()
+    ranks = {}
+    for i, (rid, cur) in enumerate(rows):
+        if cur != (i + 1) * RANK_STEP:
+            ranks[rid] = (i + 1) * RANK_STEP
+    write_ranks(conn, table, rank_col, ranks)
+    record_change(conn, user_id, entity, list(ranks))
+
+def rebalance_ranks_task(entity: str, user_id: str, list_id: Optional[str] = None, section_id: Optional[str] = None) -> None:
+    """Background variant of rebalance_ranks (own transaction, errors only logged)."""
+    try:
+        with engine.begin() as conn:
+            rebalance_ranks(conn, entity, user_id, list_id, section_id)
+    except Exception as e:
+        print(f"[rank] rebalance {entity} for {user_id} failed: {e}")
+
+def _increasing_subsequence(values: list) -> set[int]:
+    """Indexes of a longest strictly increasing subsequence (None values never qualify)."""
+    tails: list[int] = []
+    prev: dict[int, int] = {}
+    for i, v in enumerate(values):
+        if v is None:
+            continue
+        lo, hi = 0, len(tails)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if values[tails[mid]] < v:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo:
+            prev[i] = tails[lo - 1]
+        if lo == len(tails):
+            tails.append(i)
+        else:
+            tails[lo] = i
+    keep: set[int] = set()
+    k = tails[-1] if tails else None
+    while k is not None:
+        keep.add(k)
+        k = prev.get(k)
+    return keep
+
+def plan_ranks(seq: list[tuple[str, Optional[int]]]) -> Optional[dict[str, int]]:
+    """New ranks for the items of `seq` (id, rank) that are out of order.
+
+    Items on a longest increasing run keep their rank; the rest are spread
+    between their kept neighbours. Returns None when some gap is too narrow.
+    """
+    keep = _increasing_subsequence([r for _, r in seq])
+    if not keep:
+        return None
+    out: dict[str, int] = {}
+    i = 0
+    while i < len(seq):
+        if i in keep:
+            i += 1
+            continue
+        j = i
+        while j < len(seq) and j not in keep:
+            j += 1
+        run = [sid for sid, _ in seq[i:j]]
+        lo = seq[i - 1][1] if i > 0 else None
+        hi = seq[j][1] if j < len(seq) else None
+        k = len(run)
+        if lo is None:
+            new = [hi - RANK_STEP * (k - n) for n in range(k)]
+        elif hi is None:
+            new = [lo + RANK_STEP * (n + 1) for n in range(k)]
+        elif hi - lo > k:
+            new = [lo + (hi - lo) * (n + 1) // (k + 1) for n in range(k)]
+        else:
+            return None
+        out.update(zip(run, new))
+        i = j
+    return out
+
+def apply_order(conn, entity: str, user_id: str, ordered: list[str], list_id: Optional[str] = None, section_id: Optional[str] = None) -> list[str]:
+    """Make `ordered` (ids within one scope) sort in that order, touching as few rows as possible."""
+    table, rank_col, scope = rank_scope(entity, user_id, list_id, section_id)
+    ordered = list(dict.fromkeys(ordered))
+    cur = dict(conn.execute(select(table.c.id, rank_col).where(and_(table.c.id.in_(ordered), *scope))).all())
+    seq = [(i, cur[i]) for i in ordered if i in cur]
+    plan = plan_ranks(seq)
+    if plan is None:
+        rebalance_ranks(conn, entity, user_id, list_id, section_id)
+        cur = dict(conn.execute(select(table.c.id, rank_col).where(and_(table.c.id.in_(ordered), *scope))).all())
+        seq = [(i, cur[i]) for i in ordered if i in cur]
+        plan = plan_ranks(seq)
+    if plan is None:
+        # Still no room (huge block moved into one gap): append the block after everything else.
+        top = conn.execute(select(func.max(rank_col)).where(and_(*scope))).scalar() or 0
+        plan = {sid: int(top) + RANK_STEP * (n + 1) for n, (sid, _) in enumerate(seq)}
+    write_ranks(conn, table, rank_col, plan)
+    return list(plan)
+
+def rank_for_move(conn, entity: str, user_id: str, item_id: str, after_id: Optional[str], before_id: Optional[str],
+                  list_id: Optional[str] = None, section_id: Optional[str] = None) -> tuple[int, bool]:
+    """Rank that puts item_id between after_id and before_id; second value = scope needs rebalancing."""
+    table, rank_col, scope = rank_scope(entity, user_id, list_id, section_id)
+    others = and_(*scope, table.c.id != item_id)
+
+    def neighbour(nid):
+        row = conn.execute(select(rank_col).where(and_(others, table.c.id == nid))).first()
+        if not row:
+            raise HTTPException(status_code=400, detail="Neighbour item not found")
+        return row[0]
+
+    for attempt in range(2):
+        lo = neighbour(after_id) if after_id else None
+        hi = neighbour(before_id) if before_id else None
+        if (after_id and lo is None) or (before_id and hi is None):
+            rank = None  # neighbour has no rank yet (legacy row)
+        else:
+            if after_id and not before_id:
+                hi = conn.execute(select(func.min(rank_col)).where(and_(others, rank_col > lo))).scalar()
+            elif before_id and not after_id:
+                lo = conn.execute(select(func.max(rank_col)).where(and_(others, rank_col < hi))).scalar()
+            elif not after_id and not before_id:
+                lo = conn.execute(select(func.max(rank_col)).where(others)).scalar()
+            if lo is None and hi is None:
+                return RANK_STEP, False
+            if lo is None:
+                return int(hi) - RANK_STEP, False
+            if hi is None:
+                return int(lo) + RANK_STEP, False
+            rank = (int(lo) + int(hi)) // 2 if int(hi) - int(lo) > 1 else None
+            if rank is not None:
+                return rank, int(hi) - int(lo) < RANK_MIN_GAP
+        if attempt == 0:
+            rebalance_ranks(conn, entity, user_id, list_id, section_id)
+    raise HTTPException(status_code=409, detail="Could not place item, retry")
+
+def next_rank(conn, entity: str, user_id: str, list_id: Optional[str] = None, section_id: Optional[str] = None) -> int:
+    """Rank that appends a new item to the end of its scope (max + RANK_STEP)."""
+    table, rank_col, scope = rank_scope(entity, user_id, list_id, section_id)
+    top = conn.execute(select(func.max(rank_col)).where(and_(*scope))).scalar()
+    return int(top or 0) + RANK_STEP
+
 # --- Auth API ---
 
 class AuthRegister(BaseModel):
@@ -718,59 +1524,64 @@ class AuthOut(BaseModel):
 def to_user_out(r) -> UserOut:
     return UserOut(id=r["id"], email=r["email"], createdAt=int(r["created_at"]))
 
+def _insert_user(conn, uid: str, email: str, pw_hash: str):
+    # email unique check
+    if conn.execute(select(users.c.id).where(users.c.email == email)).first():
+        raise HTTPException(status_code=400, detail="Пользователь с таким email уже существует")
+
+    first = is_first_user(conn)
+    conn.execute(insert(users).values(id=uid, email=email, password_hash=pw_hash, created_at=now_ts()))
+
+    # If this is the first user, attach legacy data (rows with user_id NULL) to them.
+    if first:
+        try:
+            conn.execute(update(lists).where(lists.c.user_id.is_(None)).values(user_id=uid))
+            conn.execute(update(folders).where(folders.c.user_id.is_(None)).values(user_id=uid))
+            conn.execute(update(tasks).where(tasks.c.user_id.is_(None)).values(user_id=uid))
+        except Exception:
+            pass
+
+        # Backfill system_key for old fixed ids
+        try:
+            mapping = {"inbox": "inbox", "welcome": "welcome", "work": "work", "personal": "personal"}
+            for lid, sk in mapping.items():
+                conn.execute(
+                    update(lists)
+                    .where(and_(lists.c.user_id == uid, lists.c.id == lid, lists.c.system_key.is_(None)))
+                    .values(system_key=sk)
+                )
+        except Exception:
+            pass
+
+    ensure_user_defaults(conn, uid)
+    return conn.execute(select(users).where(users.c.id == uid)).mappings().first()
+
 @app.post("/api/auth/register", response_model=AuthOut)
-def register(payload: AuthRegister, response: Response):
+async def register(payload: AuthRegister, response: Response):
     email = payload.email.strip().lower()
     pw = payload.password
     if "@" not in email or "." not in email:
         raise HTTPException(status_code=400, detail="Введите корректный email")
     uid = gen_id()
-    with engine.begin() as conn:
-        # email unique check
-        if conn.execute(select(users.c.id).where(users.c.email == email)).first():
-            raise HTTPException(status_code=400, detail="Пользователь с таким email уже существует")
-
-        first = is_first_user(conn)
-        conn.execute(insert(users).values(id=uid, email=email, password_hash=hash_password(pw), created_at=now_ts()))
-
-        # If this is the first user, attach legacy data (rows with user_id NULL) to them.
-        if first:
-            try:
-                conn.execute(update(lists).where(lists.c.user_id.is_(None)).values(user_id=uid))
-                conn.execute(update(folders).where(folders.c.user_id.is_(None)).values(user_id=uid))
-                conn.execute(update(tasks).where(tasks.c.user_id.is_(None)).values(user_id=uid))
-            except Exception:
-                pass
-
-            # Backfill system_key for old fixed ids
-            try:
-                mapping = {"inbox": "inbox", "welcome": "welcome", "work": "work", "personal": "personal"}
-                for lid, sk in mapping.items():
-                    conn.execute(
-                        update(lists)
-                        .where(and_(lists.c.user_id == uid, lists.c.id == lid, lists.c.system_key.is_(None)))
-                        .values(system_key=sk)
-                    )
-            except Exception:
-                pass
-
-        ensure_user_defaults(conn, uid)
-        u = conn.execute(select(users).where(users.c.id == uid)).mappings().first()
+    pw_hash = await run_password_job(hash_password, pw)
+    u = await db_run(_insert_user, uid, email, pw_hash, write=True)
     token = create_token(uid)
     _set_auth_cookie(response, token)
     return AuthOut(token=token, user=to_user_out(u))
 
+def _user_by_email(conn, email: str):
+    return conn.execute(select(users).where(users.c.email == email)).mappings().first()
+
 @app.post("/api/auth/login", response_model=AuthOut)
-def login(payload: AuthLogin, response: Response):
+async def login(payload: AuthLogin, response: Response):
     email = payload.email.strip().lower()
     pw = payload.password
-    with engine.begin() as conn:
-        u = conn.execute(select(users).where(users.c.email == email)).mappings().first()
-        if not u:
-            raise HTTPException(status_code=400, detail="Неверный email или пароль")
-        if not verify_password(pw, u["password_hash"]):
-            raise HTTPException(status_code=400, detail="Неверный email или пароль")
-        ensure_user_defaults(conn, u["id"])
+    u = await db_run(_user_by_email, email)
+    if not u:
+        raise HTTPException(status_code=400, detail="Неверный email или пароль")
+    if not await run_password_job(verify_password, pw, u["password_hash"]):
+        raise HTTPException(status_code=400, detail="Неверный email или пароль")
+    await db_run(ensure_user_defaults, u["id"], write=True)
     token = create_token(u["id"])
     _set_auth_cookie(response, token)
     return AuthOut(token=token, user=to_user_out(u))
@@ -787,11 +1598,37 @@ def me(user=Depends(require_user)):
 @app.get("/api/health")
 def health(): return {"ok": True, "today": today_str()}
 
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "").strip()
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "").strip().lower() in ("1", "true", "yes")
+
+def require_metrics_access(request: Request) -> None:
+    """Internal metrics need x-metrics-token == METRICS_TOKEN; without a token they
+    are hidden unless METRICS_PUBLIC=1 opts in (e.g. for local development)."""
+    if METRICS_TOKEN:
+        given = request.headers.get("x-metrics-token") or ""
+        if hmac.compare_digest(given.encode("utf-8"), METRICS_TOKEN.encode("utf-8")):
+            return
+    elif METRICS_PUBLIC:
+        return
+    raise HTTPException(status_code=404, detail="Not Found")
+
+@app.get("/api/internal/metrics")
+def internal_metrics(_=Depends(require_metrics_access)):
+    db = {
+        "config": {"poolSize": DB_POOL_SIZE, "maxOverflow": DB_MAX_OVERFLOW, "timeout": DB_POOL_TIMEOUT, "recycle": DB_POOL_RECYCLE},
+        "sync": {**db_pool_metrics["sync"].snapshot(), "size": list(pool_sizes("sync"))},
+    }
+    if async_engine is not None:
+        db["async"] = {**db_pool_metrics["async"].snapshot(), "size": list(pool_sizes("async"))}
+    return {"password": password_metrics(), "db": db, "telegram": {"delivery": tg_bridge.delivery.snapshot(), "http": tg_bridge.http.snapshot(), "lease": bot_lease.snapshot(), "updates": tg_bridge.updates_snapshot(), "chatState": tg_bridge.chat_state.snapshot()}}
+
 @app.get("/api/folders", response_model=List[FolderOut])
-def get_folders(user=Depends(require_user)):
+async def get_folders(request: Request, response: Response, user=Depends(require_user)):
+    not_modified = await conditional_get(request, response, user)
+    if not_modified:
+        return not_modified
     stmt = select(folders).where(folders.c.user_id == user["id"]).order_by(folders.c.sort_order.asc(), folders.c.created_at.asc())
-    with engine.connect() as conn:
-        rows = conn.execute(stmt).mappings().all()
+    rows = await db_run(lambda conn: conn.execute(stmt).mappings().all())
     return [to_folder_out(r) for r in rows]
 
 @app.post("/api/folders", response_model=FolderOut)
@@ -800,8 +1637,9 @@ def create_folder(payload: FolderCreate, user=Depends(require_user)):
     if not title: raise HTTPException(status_code=400, detail="Title is empty")
     fid = gen_id(); emoji = payload.emoji.strip() or "📁"
     with engine.begin() as conn:
-        conn.execute(insert(folders).values(id=fid,user_id=user["id"],title=title,emoji=emoji,sort_order=next_sort_order(folders, conn, user["id"]),created_at=now_ts()))
+        conn.execute(insert(folders).values(id=fid,user_id=user["id"],title=title,emoji=emoji,sort_order=next_rank(conn, "folders", user["id"]),created_at=now_ts()))
         row = conn.execute(select(folders).where(folders.c.id==fid)).mappings().first()
+        record_change(conn, user["id"], "folders", [fid])
     return to_folder_out(row)
 
 @app.patch("/api/folders/{folder_id}", response_model=FolderOut)
@@ -824,16 +1662,19 @@ def update_folder(folder_id: str, payload: FolderUpdate, user=Depends(require_us
         row = conn.execute(stmt).mappings().first()
         if not row:
             raise HTTPException(status_code=404, detail="Folder not found")
+        record_change(conn, user["id"], "folders", [folder_id])
     return to_folder_out(row)
 
 @app.delete("/api/folders/{folder_id}")
 def delete_folder(folder_id: str, user=Depends(require_user)):
     """Delete folder; lists stay, but get detached from the folder."""
     with engine.begin() as conn:
-        conn.execute(update(lists).where(and_(lists.c.folder_id==folder_id, lists.c.user_id==user["id"])).values(folder_id=None))
+        detached = conn.execute(update(lists).where(and_(lists.c.folder_id==folder_id, lists.c.user_id==user["id"])).values(folder_id=None).returning(lists.c.id)).scalars().all()
         res = conn.execute(delete(folders).where(and_(folders.c.id==folder_id, folders.c.user_id==user["id"])))
         if res.rowcount == 0:
             raise HTTPException(status_code=404, detail="Folder not found")
+        record_change(conn, user["id"], "lists", detached)
+        record_change(conn, user["id"], "folders", [folder_id], op="delete")
     return {"deleted": True}
 
 @app.post("/api/folders/reorder")
@@ -841,17 +1682,30 @@ def reorder_folders(payload: ReorderSimple, user=Depends(require_user)):
     ordered = [x for x in payload.orderedIds if isinstance(x, str) and x.strip()]
     if not ordered:
         raise HTTPException(status_code=400, detail="orderedIds required")
-    base = 10
     with engine.begin() as conn:
-        for i, fid in enumerate(ordered):
-            conn.execute(update(folders).where(and_(folders.c.id==fid, folders.c.user_id==user["id"])).values(sort_order=base + i * 10))
+        changed = apply_order(conn, "folders", user["id"], ordered)
+        record_change(conn, user["id"], "folders", changed)
     return {"ok": True}
 
+@app.post("/api/folders/{folder_id}/move")
+def move_folder(folder_id: str, payload: MovePayload, background: BackgroundTasks, user=Depends(require_user)):
+    with engine.begin() as conn:
+        rank, crowded = rank_for_move(conn, "folders", user["id"], folder_id, payload.afterId, payload.beforeId)
+        res = conn.execute(update(folders).where(and_(folders.c.id==folder_id, folders.c.user_id==user["id"])).values(sort_order=rank))
+        if res.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Folder not found")
+        record_change(conn, user["id"], "folders", [folder_id])
+    if crowded:
+        background.add_task(rebalance_ranks_task, "folders", user["id"])
+    return {"ok": True, "sortOrder": rank}
+
 @app.get("/api/lists", response_model=List[ListOut])
-def get_lists(user=Depends(require_user)):
+async def get_lists(request: Request, response: Response, user=Depends(require_user)):
+    not_modified = await conditional_get(request, response, user)
+    if not_modified:
+        return not_modified
     stmt = select(lists).where(lists.c.user_id == user["id"]).order_by(lists.c.sort_order.asc(), lists.c.created_at.asc())
-    with engine.connect() as conn:
-        rows = conn.execute(stmt).mappings().all()
+    rows = await db_run(lambda conn: conn.execute(stmt).mappings().all())
     return [to_list_out(r) for r in rows]
 
 @app.post("/api/lists", response_model=ListOut)
@@ -862,8 +1716,9 @@ def create_list(payload: ListCreate, user=Depends(require_user)):
     folder_id = payload.folderId.strip() if payload.folderId else None
     with engine.begin() as conn:
         if folder_id: ensure_folder_exists(conn, user["id"], folder_id)
-        conn.execute(insert(lists).values(id=lid,user_id=user["id"],system_key=None,title=title,emoji=emoji,sort_order=next_sort_order(lists, conn, user["id"]),created_at=now_ts(),folder_id=folder_id))
+        conn.execute(insert(lists).values(id=lid,user_id=user["id"],system_key=None,title=title,emoji=emoji,sort_order=next_rank(conn, "lists", user["id"]),created_at=now_ts(),folder_id=folder_id))
         row = conn.execute(select(lists).where(lists.c.id==lid)).mappings().first()
+        record_change(conn, user["id"], "lists", [lid])
     return to_list_out(row)
 
 @app.patch("/api/lists/{list_id}", response_model=ListOut)
@@ -892,6 +1747,7 @@ def update_list(list_id: str, payload: ListUpdate, user=Depends(require_user)):
         row = conn.execute(stmt).mappings().first()
         if not row:
             raise HTTPException(status_code=404, detail="List not found")
+        record_change(conn, user["id"], "lists", [list_id])
     return to_list_out(row)
 
 @app.delete("/api/lists/{list_id}")
@@ -904,10 +1760,13 @@ def delete_list(list_id: str, user=Depends(require_user)):
             raise HTTPException(status_code=400, detail="Cannot delete inbox")
 
         inbox_id = inbox_list_id(conn, user["id"])
-        conn.execute(update(tasks).where(and_(tasks.c.list_id==list_id, tasks.c.user_id==user["id"])).values(list_id=inbox_id, updated_at=now_ts()))
+        moved = conn.execute(update(tasks).where(and_(tasks.c.list_id==list_id, tasks.c.user_id==user["id"])).values(list_id=inbox_id, updated_at=now_ts()).returning(tasks.c.id)).scalars().all()
         res = conn.execute(delete(lists).where(and_(lists.c.id==list_id, lists.c.user_id==user["id"])))
         if res.rowcount == 0:
             raise HTTPException(status_code=404, detail="List not found")
+        record_change(conn, user["id"], "tasks", moved)
+        record_change(conn, user["id"], "lists", [list_id], op="delete")
+    invalidate_counts(user["id"])
     return {"deleted": True}
 
 @app.post("/api/lists/reorder")
@@ -915,22 +1774,38 @@ def reorder_lists(payload: ReorderSimple, user=Depends(require_user)):
     ordered = [x for x in payload.orderedIds if isinstance(x, str) and x.strip()]
     if not ordered:
         raise HTTPException(status_code=400, detail="orderedIds required")
-    base = 10
     with engine.begin() as conn:
-        for i, lid in enumerate(ordered):
-            conn.execute(update(lists).where(and_(lists.c.id==lid, lists.c.user_id==user["id"])).values(sort_order=base + i * 10))
+        changed = apply_order(conn, "lists", user["id"], ordered)
+        record_change(conn, user["id"], "lists", changed)
     return {"ok": True}
 
+@app.post("/api/lists/{list_id}/move")
+def move_list(list_id: str, payload: MovePayload, background: BackgroundTasks, user=Depends(require_user)):
+    with engine.begin() as conn:
+        rank, crowded = rank_for_move(conn, "lists", user["id"], list_id, payload.afterId, payload.beforeId)
+        res = conn.execute(update(lists).where(and_(lists.c.id==list_id, lists.c.user_id==user["id"])).values(sort_order=rank))
+        if res.rowcount == 0:
+            raise HTTPException(status_code=404, detail="List not found")
+        record_change(conn, user["id"], "lists", [list_id])
+    if crowded:
+        background.add_task(rebalance_ranks_task, "lists", user["id"])
+    return {"ok": True, "sortOrder": rank}
+
 @app.get("/api/sections", response_model=List[SectionOut])
-def list_sections(list_id: str, user=Depends(require_user)):
+async def list_sections(request: Request, response: Response, list_id: str, user=Depends(require_user)):
     lid = list_id.strip()
     if not lid:
         raise HTTPException(status_code=400, detail="list_id required")
-    with engine.connect() as conn:
+    not_modified = await conditional_get(request, response, user)
+    if not_modified:
+        return not_modified
+
+    def load(conn):
         ensure_list_exists(conn, user["id"], lid)
-        rows = conn.execute(
+        return conn.execute(
             select(sections).where(and_(sections.c.user_id==user["id"], sections.c.list_id==lid)).order_by(sections.c.sort_order.asc())
         ).mappings().all()
+    rows = await db_run(load)
     return [to_section_out(r) for r in rows]
 
 @app.post("/api/sections", response_model=SectionOut)
@@ -942,8 +1817,9 @@ def create_section(payload: SectionCreate, user=Depends(require_user)):
     sid = gen_id()
     with engine.begin() as conn:
         ensure_list_exists(conn, user["id"], lid)
-        so = next_sort_order(sections, conn=conn, user_id=user["id"])
+        so = next_rank(conn, "sections", user["id"])
         row = conn.execute(insert(sections).values(id=sid, user_id=user["id"], list_id=lid, title=title, sort_order=so, created_at=now_ts()).returning(sections)).mappings().first()
+        record_change(conn, user["id"], "sections", [sid])
     return to_section_out(row)
 
 @app.patch("/api/sections/{section_id}", response_model=SectionOut)
@@ -961,16 +1837,19 @@ def update_section(section_id: str, payload: SectionUpdate, user=Depends(require
         row = conn.execute(stmt).mappings().first()
         if not row:
             raise HTTPException(status_code=404, detail="Section not found")
+        record_change(conn, user["id"], "sections", [section_id])
     return to_section_out(row)
 
 @app.delete("/api/sections/{section_id}")
 def delete_section(section_id: str, user=Depends(require_user)):
     with engine.begin() as conn:
         # detach tasks
-        conn.execute(update(tasks).where(and_(tasks.c.section_id==section_id, tasks.c.user_id==user["id"])).values(section_id=None, updated_at=now_ts()))
+        detached = conn.execute(update(tasks).where(and_(tasks.c.section_id==section_id, tasks.c.user_id==user["id"])).values(section_id=None, updated_at=now_ts()).returning(tasks.c.id)).scalars().all()
         res = conn.execute(delete(sections).where(and_(sections.c.id==section_id, sections.c.user_id==user["id"])))
         if res.rowcount == 0:
             raise HTTPException(status_code=404, detail="Section not found")
+        record_change(conn, user["id"], "tasks", detached)
+        record_change(conn, user["id"], "sections", [section_id], op="delete")
     return {"deleted": True}
 
 @app.post("/api/sections/reorder")
@@ -978,18 +1857,95 @@ def reorder_sections(payload: ReorderSimple, user=Depends(require_user)):
     ordered = [x for x in payload.orderedIds if isinstance(x, str) and x.strip()]
     if not ordered:
         raise HTTPException(status_code=400, detail="orderedIds required")
-    base = 10
     with engine.begin() as conn:
-        for i, sid in enumerate(ordered):
-            conn.execute(update(sections).where(and_(sections.c.id==sid, sections.c.user_id==user["id"])).values(sort_order=base + i*10))
+        changed = apply_order(conn, "sections", user["id"], ordered)
+        record_change(conn, user["id"], "sections", changed)
     return {"ok": True}
 
+@app.post("/api/sections/{section_id}/move")
+def move_section(section_id: str, payload: MovePayload, background: BackgroundTasks, user=Depends(require_user)):
+    with engine.begin() as conn:
+        rank, crowded = rank_for_move(conn, "sections", user["id"], section_id, payload.afterId, payload.beforeId)
+        res = conn.execute(update(sections).where(and_(sections.c.id==section_id, sections.c.user_id==user["id"])).values(sort_order=rank))
+        if res.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Section not found")
+        record_change(conn, user["id"], "sections", [section_id])
+    if crowded:
+        background.add_task(rebalance_ranks_task, "sections", user["id"])
+    return {"ok": True, "sortOrder": rank}
+
+def task_sort_keys(sort: str) -> list:
+    """ORDER BY keys for a Sort mode as (expression, descending) pairs.
+
+    Nullable columns are coalesced: a preceding "is null" flag already groups
+    NULLs, and the coalesce keeps keyset comparisons well-defined inside that
+    group. Every mode ends with tasks.id so the order is total.
+    """
+    def nulls_last(col):
+        return case((col.is_(None), 1), else_=0)
+    keys = [(case((tasks.c.pinned.is_(True), 0), else_=1), False)]
+    if sort == "created":
+        keys += [(tasks.c.created_at, True)]
+    elif sort == "completed":
+        keys += [(nulls_last(tasks.c.completed_at), False), (func.coalesce(tasks.c.completed_at, 0), True), (tasks.c.created_at, True)]
+    elif sort == "trashed":
+        keys += [(nulls_last(tasks.c.trashed_at), False), (func.coalesce(tasks.c.trashed_at, 0), True), (tasks.c.created_at, True)]
+    elif sort == "manual":
+        keys += [(nulls_last(tasks.c.order_index), False), (func.coalesce(tasks.c.order_index, 0), False), (tasks.c.created_at, True)]
+    else:
+        keys += [
+            (nulls_last(tasks.c.due_date), False), (func.coalesce(tasks.c.due_date, ""), False),
+            (nulls_last(tasks.c.due_time), False), (func.coalesce(tasks.c.due_time, ""), False),
+            (tasks.c.created_at, True),
+        ]
+    keys.append((tasks.c.id, False))
+    return keys
+
+def encode_task_cursor(sort: str, values: list) -> str:
+    raw = json.dumps([sort, values], separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_task_cursor(sort: str, cursor: str, n_keys: int) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cur_sort, values = json.loads(raw.decode("utf-8"))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if cur_sort != sort or not isinstance(values, list) or len(values) != n_keys:
+        raise HTTPException(status_code=400, detail="Cursor does not match sort")
+    return values
+
+def keyset_after(keys: list, values: list):
+    """Rows strictly after `values` in the (mixed-direction) key order."""
+    branches = []
+    for i, (expr, desc) in enumerate(keys):
+        eqs = [k == v for (k, _), v in zip(keys[:i], values[:i])]
+        branches.append(and_(*eqs, expr < values[i] if desc else expr > values[i]))
+    return or_(*branches)
+
+# Responses with more rows than this are serialized on the threadpool so big
+# payloads don't block the event loop.
+SERIALIZE_INLINE_MAX = 500
+
 @app.get("/api/tasks", response_model=List[TaskOut])
-def list_tasks(filter: Filter="all", sort: Sort="due", list_id: Optional[str]=None, due: Optional[str]=None,
+async def list_tasks(request: Request, response: Response, filter: Filter="all", sort: Sort="due", list_id: Optional[str]=None, due: Optional[str]=None,
               due_from: Optional[str]=None, due_to: Optional[str]=None,
               completed_from: Optional[str]=None, completed_to: Optional[str]=None,
               q: Optional[str]=None,
-              tag: Optional[str]=None, priority: Optional[int]=None, user=Depends(require_user)):
+              tag: Optional[str]=None, priority: Optional[int]=None,
+              limit: Optional[int]=Query(default=None, ge=1, le=1000), cursor: Optional[str]=None,
+              fields: Optional[str]=None, user=Depends(require_user)):
+    """List tasks.
+
+    Without `limit` every matching row is returned. With `limit`, at most that
+    many rows come back and `X-Next-Cursor` carries an opaque keyset cursor for
+    the next page (pass it back as `cursor` with the same filter/sort).
+    `fields=id,title,...` returns only those TaskOut fields.
+    """
+    field_names = parse_task_fields(fields)
+    not_modified = await conditional_get(request, response, user)
+    if not_modified:
+        return not_modified
     conds=[]
     # Always filter by user
     conds.append(tasks.c.user_id == user["id"])
@@ -1028,39 +1984,53 @@ def list_tasks(filter: Filter="all", sort: Sort="due", list_id: Optional[str]=No
     if q: conds.append(tasks.c.title.ilike(f"%{q.strip()}%"))
     if tag:
         t=tag.strip().lstrip("#")
-        if t: conds.append(tasks.c.tags_json.ilike(f'%"{t}"%'))
+        if t:
+            conds.append(tasks.c.id.in_(
+                select(task_tags.c.task_id).where(and_(task_tags.c.user_id == user["id"], func.lower(task_tags.c.tag) == func.lower(t)))
+            ))
     if priority is not None: conds.append(tasks.c.priority==int(priority))
 
-    stmt = select(tasks)
-    if conds: stmt = stmt.where(and_(*conds))
-
-    pin_first = case((tasks.c.pinned.is_(True), 0), else_=1)
-
-    if sort=="created":
-        stmt = stmt.order_by(pin_first.asc(), tasks.c.created_at.desc())
-    elif sort=="completed":
-        nulls_last = case((tasks.c.completed_at.is_(None),1), else_=0)
-        stmt = stmt.order_by(pin_first.asc(), nulls_last.asc(), tasks.c.completed_at.desc(), tasks.c.created_at.desc())
-    elif sort=="trashed":
-        nulls_last = case((tasks.c.trashed_at.is_(None),1), else_=0)
-        stmt = stmt.order_by(pin_first.asc(), nulls_last.asc(), tasks.c.trashed_at.desc(), tasks.c.created_at.desc())
-    elif sort=="manual":
-        nulls_last = case((tasks.c.order_index.is_(None),1), else_=0)
-        stmt = stmt.order_by(pin_first.asc(), nulls_last.asc(), tasks.c.order_index.asc(), tasks.c.created_at.desc())
-    else:
-        nulls_date = case((tasks.c.due_date.is_(None),1), else_=0)
-        nulls_time = case((tasks.c.due_time.is_(None),1), else_=0)
-        stmt = stmt.order_by(pin_first.asc(), nulls_date.asc(), tasks.c.due_date.asc(), nulls_time.asc(), tasks.c.due_time.asc(), tasks.c.created_at.desc())
+    keys = task_sort_keys(sort)
+    if cursor:
+        conds.append(keyset_after(keys, decode_task_cursor(sort, cursor, len(keys))))
 
-    with engine.connect() as conn:
-        rows = conn.execute(stmt).mappings().all()
-    return [to_task_out(r) for r in rows]
+    if field_names is None:
+        cols = list(tasks.c)
+    else:
+        wanted = {c for f in field_names for c in TASK_FIELDS[f][0]}
+        cols = [c for c in tasks.c if c.name in wanted]
+    if limit is not None:
+        cols += [expr.label(f"_k{i}") for i, (expr, _) in enumerate(keys)]
+
+    stmt = select(*cols).where(and_(*conds))
+    stmt = stmt.order_by(*[expr.desc() if desc else expr.asc() for expr, desc in keys])
+    if limit is not None:
+        stmt = stmt.limit(limit + 1)
+
+    rows = await db_run(lambda conn: conn.execute(stmt).mappings().all())
+
+    headers = {}
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        headers["X-Next-Cursor"] = encode_task_cursor(sort, [last[f"_k{i}"] for i in range(len(keys))])
+
+    headers.update({"ETag": response.headers["ETag"], "Cache-Control": response.headers["Cache-Control"]})
+
+    def render():
+        if field_names is None:
+            return json_response([task_dict(r) for r in rows], headers)
+        return json_response([{f: TASK_FIELDS[f][1](r) for f in field_names} for r in rows], headers)
+    if len(rows) > SERIALIZE_INLINE_MAX:
+        return await run_in_threadpool(render)
+    return render()
 
 @app.post("/api/tasks", response_model=TaskOut)
-def create_task(payload: TaskCreate, user=Depends(require_user)):
+async def create_task(payload: TaskCreate, user=Depends(require_user)):
     title = payload.title.strip()
     if not title: raise HTTPException(status_code=400, detail="Title is empty")
-    with engine.begin() as conn:
+
+    def tx(conn):
         if payload.listId:
             list_id = payload.listId.strip()
             if not list_id:
@@ -1086,7 +2056,7 @@ def create_task(payload: TaskCreate, user=Depends(require_user)):
             due_time = None
             reminder_minutes = None
         tid = gen_id(); ts = now_ts()
-        order_index = ts*1000
+        order_index = next_rank(conn, "tasks", user["id"], list_id, section_id)
         stmt = insert(tasks).values(
             id=tid,user_id=user["id"],title=title,completed=False,created_at=ts,updated_at=ts,completed_at=None,
             list_id=list_id,section_id=section_id,due_date=due,due_time=due_time,
@@ -1097,16 +2067,23 @@ def create_task(payload: TaskCreate, user=Depends(require_user)):
             notes=(payload.notes.strip() if payload.notes else None),
             tags_json=dumps_tags(payload.tags),
             subtasks_json=dumps_subtasks(payload.subtasks),
-            tg_reminder_sent_at=None
+            tg_reminder_sent_at=None,
+            reminder_fire_at=reminder_fire_ts(due, due_time, reminder_minutes),
         ).returning(tasks)
         row = conn.execute(stmt).mappings().first()
+        sync_task_tags(conn, user["id"], tid, row["tags_json"])
+        record_change(conn, user["id"], "tasks", [tid])
+        return row
+    row = await db_run(tx, write=True)
+    invalidate_counts(user["id"])
+    reminders_touched([row])
     return to_task_out(row)
 
-@app.patch("/api/tasks/{task_id}", response_model=TaskOut)
-def update_task(task_id: str, payload: TaskUpdate, user=Depends(require_user)):
-    with engine.connect() as conn:
-        cur = conn.execute(select(tasks).where(and_(tasks.c.id==task_id, tasks.c.user_id==user["id"]))).mappings().first()
-    if not cur: raise HTTPException(status_code=404, detail="Task not found")
+def task_update_values(payload: TaskUpdate, cur, check_list, check_section) -> dict:
+    """Column values for applying `payload` to the task row `cur` (updated_at not included).
+
+    check_list(list_id) and check_section(section_id, list_id) raise for unknown ids.
+    """
     fields_set = set(getattr(payload, "model_fields_set", None) or getattr(payload, "__fields_set__", set()) or set())
     values={}
     if payload.title is not None:
@@ -1120,8 +2097,7 @@ def update_task(task_id: str, payload: TaskUpdate, user=Depends(require_user)):
     if payload.listId is not None:
         lid = payload.listId.strip()
         if not lid: raise HTTPException(status_code=400, detail="listId is empty")
-        with engine.connect() as conn:
-            ensure_list_exists(conn, user["id"], lid)
+        check_list(lid)
         values["list_id"]=lid
 
         # If moving to another list without specifying section, drop section assignment
@@ -1134,8 +2110,7 @@ def update_task(task_id: str, payload: TaskUpdate, user=Depends(require_user)):
             values["section_id"] = None
         else:
             target_list = values.get("list_id") or cur["list_id"]
-            with engine.connect() as conn:
-                ensure_section_exists(conn, user["id"], sid, target_list)
+            check_section(sid, target_list)
             values["section_id"] = sid
     if "dueDate" in fields_set:
         values["due_date"] = validate_date_str(payload.dueDate)
@@ -1175,56 +2150,173 @@ def update_task(task_id: str, payload: TaskUpdate, user=Depends(require_user)):
         if "reminder_minutes" in values and values["reminder_minutes"] is not None:
             values["reminder_minutes"] = None
 
+    if {"due_date", "due_time", "reminder_minutes"} & values.keys():
+        values["reminder_fire_at"] = reminder_fire_ts(
+            effective_due,
+            values.get("due_time", cur.get("due_time")),
+            values.get("reminder_minutes", cur.get("reminder_minutes")),
+        )
+
     if not values: raise HTTPException(status_code=400, detail="Nothing to update")
-    values["updated_at"]=now_ts()
-    stmt = update(tasks).where(and_(tasks.c.id==task_id, tasks.c.user_id==user["id"])).values(**values).returning(tasks)
-    with engine.begin() as conn:
+    return values
+
+@app.patch("/api/tasks/{task_id}", response_model=TaskOut)
+async def update_task(task_id: str, payload: TaskUpdate, user=Depends(require_user)):
+    def tx(conn):
+        cur = conn.execute(select(tasks).where(and_(tasks.c.id==task_id, tasks.c.user_id==user["id"]))).mappings().first()
+        if not cur: raise HTTPException(status_code=404, detail="Task not found")
+        values = task_update_values(
+            payload, cur,
+            lambda lid: ensure_list_exists(conn, user["id"], lid),
+            lambda sid, lid: ensure_section_exists(conn, user["id"], sid, lid),
+        )
+        values["updated_at"]=now_ts()
+        stmt = update(tasks).where(and_(tasks.c.id==task_id, tasks.c.user_id==user["id"])).values(**values).returning(tasks)
         row = conn.execute(stmt).mappings().first()
+        if row and "tags_json" in values:
+            sync_task_tags(conn, user["id"], task_id, row["tags_json"])
+        if row:
+            record_change(conn, user["id"], "tasks", [task_id])
+        return row
+    row = await db_run(tx, write=True)
+    invalidate_counts(user["id"])
+    reminders_touched([row])
     return to_task_out(row)
 
+TASK_BATCH_MAX = int(os.getenv("TASK_BATCH_MAX", "1000"))
+
+@app.post("/api/tasks/batch", response_model=List[TaskOut])
+async def batch_update_tasks(payload: TaskBatch, user=Depends(require_user)):
+    """Apply several TaskUpdate operations in one transaction; returns the updated tasks.
+
+    Lists and sections are validated once per batch, and tasks that end up with
+    identical changes are written with a single UPDATE. Any error rolls back
+    the whole batch.
+    """
+    uid = user["id"]
+    ops = [(list(dict.fromkeys(i.strip() for i in op.ids if isinstance(i, str) and i.strip())), op) for op in payload.ops]
+    ops = [(ids, op) for ids, op in ops if ids]
+    all_ids = list(dict.fromkeys(i for ids, _ in ops for i in ids))
+    if not all_ids:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+    if sum(len(ids) for ids, _ in ops) > TASK_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Too many tasks in batch (max {TASK_BATCH_MAX})")
+    list_ids = {op.listId.strip() for _, op in ops if op.listId and op.listId.strip()}
+    section_ids = {op.sectionId.strip() for _, op in ops if op.sectionId and op.sectionId.strip()}
+
+    def tx(conn):
+        cur = {r["id"]: r for r in conn.execute(select(tasks).where(and_(tasks.c.user_id==uid, tasks.c.id.in_(all_ids)))).mappings().all()}
+        if len(cur) != len(all_ids):
+            raise HTTPException(status_code=404, detail="Task not found")
+        known_lists = set(conn.execute(select(lists.c.id).where(and_(lists.c.user_id==uid, lists.c.id.in_(list_ids)))).scalars().all()) if list_ids else set()
+        section_list = dict(conn.execute(select(sections.c.id, sections.c.list_id).where(and_(sections.c.user_id==uid, sections.c.id.in_(section_ids)))).all()) if section_ids else {}
+
+        def check_list(lid):
+            if lid not in known_lists:
+                raise HTTPException(status_code=400, detail="List not found")
+
+        def check_section(sid, lid):
+            if sid not in section_list:
+                raise HTTPException(status_code=400, detail="Section not found")
+            if section_list[sid] != lid:
+                raise HTTPException(status_code=400, detail="Section does not belong to list")
+
+        ts = now_ts()
+        tags_changed = set()
+        for ids, op in ops:
+            # Values depend on the current row only through list_id/due_date, so most ops form one group.
+            groups: dict[tuple, tuple[dict, list]] = {}
+            for tid in ids:
+                values = task_update_values(op, cur[tid], check_list, check_section)
+                values["updated_at"] = ts
+                groups.setdefault(tuple(sorted(values.items())), (values, []))[1].append(tid)
+            for values, group_ids in groups.values():
+                stmt = update(tasks).where(and_(tasks.c.user_id==uid, tasks.c.id.in_(group_ids))).values(**values).returning(tasks)
+                for r in conn.execute(stmt).mappings().all():
+                    cur[r["id"]] = r
+                if "tags_json" in values:
+                    tags_changed.update(group_ids)
+        sync_task_tags_many(conn, uid, {tid: cur[tid]["tags_json"] for tid in tags_changed})
+        record_change(conn, uid, "tasks", all_ids)
+        return cur
+    cur = await db_run(tx, write=True)
+    invalidate_counts(uid)
+    reminders_touched(cur.values())
+    return json_response([task_dict(cur[tid]) for tid in all_ids])
+
 @app.post("/api/tasks/reorder")
-def reorder_tasks(payload: ReorderPayload, user=Depends(require_user)):
+async def reorder_tasks(payload: ReorderPayload, user=Depends(require_user)):
     list_id = payload.listId.strip()
     if not list_id:
         raise HTTPException(status_code=400, detail="listId required")
     section_id = payload.sectionId.strip() if payload.sectionId else None
-    with engine.connect() as conn:
+    ordered=[x for x in payload.orderedIds if isinstance(x,str) and x.strip()]
+
+    def tx(conn):
         ensure_list_exists(conn, user["id"], list_id)
         if section_id:
             ensure_section_exists(conn, user["id"], section_id, list_id)
-    ordered=[x for x in payload.orderedIds if isinstance(x,str) and x.strip()]
-    if not ordered:
-        raise HTTPException(status_code=400, detail="orderedIds required")
-    base = now_ts()*1000
-    step=10
-    with engine.begin() as conn:
-        for i, tid in enumerate(ordered):
-            cond = [tasks.c.id==tid, tasks.c.list_id==list_id, tasks.c.user_id==user["id"]]
-            if section_id:
-                cond.append(tasks.c.section_id==section_id)
-            else:
-                cond.append(tasks.c.section_id.is_(None))
-            conn.execute(update(tasks).where(and_(*cond)).values(order_index=base+i*step))
+        if not ordered:
+            raise HTTPException(status_code=400, detail="orderedIds required")
+        changed = apply_order(conn, "tasks", user["id"], ordered, list_id, section_id)
+        record_change(conn, user["id"], "tasks", changed)
+    await db_run(tx, write=True)
     return {"ok": True}
 
+@app.post("/api/tasks/{task_id}/move", response_model=TaskOut)
+async def move_task(task_id: str, payload: TaskMove, background: BackgroundTasks, user=Depends(require_user)):
+    """Move a task between two neighbours (optionally into another list/section); writes one row."""
+    def tx(conn):
+        cur = conn.execute(select(tasks.c.list_id, tasks.c.section_id).where(and_(tasks.c.id==task_id, tasks.c.user_id==user["id"]))).first()
+        if not cur:
+            raise HTTPException(status_code=404, detail="Task not found")
+        list_id = payload.listId.strip() if payload.listId else cur.list_id
+        if list_id != cur.list_id:
+            ensure_list_exists(conn, user["id"], list_id)
+        if payload.sectionId is not None:
+            section_id = payload.sectionId.strip() or None
+        else:
+            section_id = cur.section_id if list_id == cur.list_id else None
+        if section_id:
+            ensure_section_exists(conn, user["id"], section_id, list_id)
+        rank, crowded = rank_for_move(conn, "tasks", user["id"], task_id, payload.afterId, payload.beforeId, list_id, section_id)
+        values = {"order_index": rank}
+        if (list_id, section_id) != (cur.list_id, cur.section_id):
+            values.update(list_id=list_id, section_id=section_id, updated_at=now_ts())
+        row = conn.execute(update(tasks).where(and_(tasks.c.id==task_id, tasks.c.user_id==user["id"])).values(**values).returning(tasks)).mappings().first()
+        record_change(conn, user["id"], "tasks", [task_id])
+        return row, crowded, cur.list_id
+    row, crowded, old_list_id = await db_run(tx, write=True)
+    if row["list_id"] != old_list_id:
+        invalidate_counts(user["id"])
+    if crowded:
+        background.add_task(rebalance_ranks_task, "tasks", user["id"], row["list_id"], row["section_id"])
+    return to_task_out(row)
+
 @app.delete("/api/tasks/{task_id}")
-def delete_task(task_id: str, hard: bool = False, user=Depends(require_user)):
+async def delete_task(task_id: str, hard: bool = False, user=Depends(require_user)):
     """Delete task.
 
     - Default: move to Trash (soft delete).
     - If already in Trash OR hard=true: permanently delete.
     """
-    with engine.begin() as conn:
+    def tx(conn):
         row = conn.execute(select(tasks).where(and_(tasks.c.id==task_id, tasks.c.user_id==user["id"]))).mappings().first()
         if not row:
             raise HTTPException(status_code=404, detail="Task not found")
         if hard or bool(row.get("trashed")):
+            conn.execute(delete(task_tags).where(task_tags.c.task_id == task_id))
             res = conn.execute(delete(tasks).where(and_(tasks.c.id==task_id, tasks.c.user_id==user["id"])))
             if res.rowcount==0:
                 raise HTTPException(status_code=404, detail="Task not found")
+            record_change(conn, user["id"], "tasks", [task_id], op="delete")
             return {"deleted": True}
         conn.execute(update(tasks).where(and_(tasks.c.id==task_id, tasks.c.user_id==user["id"])).values(trashed=True, trashed_at=now_ts(), updated_at=now_ts()))
-    return {"trashed": True}
+        record_change(conn, user["id"], "tasks", [task_id])
+        return {"trashed": True}
+    out = await db_run(tx, write=True)
+    invalidate_counts(user["id"])
+    return out
 
 
 class TagOut(BaseModel):
@@ -1232,57 +2324,108 @@ class TagOut(BaseModel):
     count: int
 
 @app.post('/api/trash/empty')
-def empty_trash(user=Depends(require_user)):
-    with engine.begin() as conn:
-        conn.execute(delete(tasks).where(and_(tasks.c.user_id==user['id'], tasks.c.trashed.is_(True))))
+async def empty_trash(user=Depends(require_user)):
+    trashed_ids = select(tasks.c.id).where(and_(tasks.c.user_id==user['id'], tasks.c.trashed.is_(True)))
+
+    def tx(conn):
+        conn.execute(delete(task_tags).where(and_(task_tags.c.user_id==user['id'], task_tags.c.task_id.in_(trashed_ids))))
+        removed = conn.execute(delete(tasks).where(and_(tasks.c.user_id==user['id'], tasks.c.trashed.is_(True))).returning(tasks.c.id)).scalars().all()
+        record_change(conn, user['id'], "tasks", removed, op="delete")
+    await db_run(tx, write=True)
+    invalidate_counts(user['id'])
     return {"ok": True}
 
 @app.get('/api/tags', response_model=List[TagOut])
-def list_tags(include_completed: bool = False, user=Depends(require_user)):
+async def list_tags(request: Request, response: Response, include_completed: bool = False, user=Depends(require_user)):
+    not_modified = await conditional_get(request, response, user)
+    if not_modified:
+        return not_modified
     # Return tag counts for the sidebar.
-    with engine.connect() as conn:
-        conds = [tasks.c.user_id==user['id'], tasks.c.trashed.is_(False)]
-        if not include_completed:
-            conds.append(tasks.c.completed.is_(False))
-        rows = conn.execute(select(tasks.c.tags_json).where(and_(*conds))).all()
-    counts = {}
-    for (s,) in rows:
-        for t in parse_tags_json(s or '[]'):
-            counts[t] = counts.get(t, 0) + 1
+    conds = [tasks.c.user_id==user['id'], tasks.c.trashed.is_(False)]
+    if not include_completed:
+        conds.append(tasks.c.completed.is_(False))
+    stmt = (
+        select(task_tags.c.tag, func.count())
+        .select_from(task_tags.join(tasks, tasks.c.id == task_tags.c.task_id))
+        .where(and_(task_tags.c.user_id==user['id'], *conds))
+        .group_by(task_tags.c.tag)
+    )
+    rows = await db_run(lambda conn: conn.execute(stmt).all())
+    counts = {t: int(c) for t, c in rows}
     out = [TagOut(tag=k, count=v) for k, v in sorted(counts.items(), key=lambda kv: (-kv[1], kv[0].lower()))]
     return out
 
+# Per-process cache of /api/counts payloads: user_id -> (day, data version, payload).
+# The version is read before the counts query, so an entry is only served while no
+# write (from any worker) has bumped the user's version since it was computed.
+_counts_cache = TTLCache(
+    maxsize=int(os.getenv("COUNTS_CACHE_MAX", "10000")),
+    ttl=int(os.getenv("COUNTS_CACHE_TTL", "30")),
+)
+
+def invalidate_counts(user_id: str) -> None:
+    _counts_cache.pop(user_id)
+
 @app.get('/api/counts')
-def get_counts(user=Depends(require_user)):
+async def get_counts(request: Request, response: Response, user=Depends(require_user)):
     # Aggregated counters for smart lists and sidebar.
+    not_modified = await conditional_get(request, response, user, dated=True)
+    if not_modified:
+        return not_modified
     today = today_str()
+    version = request.state.data_version
+    cached = _counts_cache.get(user['id'])
+    if cached is not None and cached[0] == today and cached[1] == version:
+        return cached[2]
     next_to = (date.today() + timedelta(days=6)).isoformat()
-    with engine.connect() as conn:
-        inbox_id = inbox_list_id(conn, user['id'])
-        active_conds = and_(tasks.c.user_id==user['id'], tasks.c.completed.is_(False), tasks.c.trashed.is_(False))
 
-        active_total = conn.execute(select(text('COUNT(*)')).select_from(tasks).where(active_conds)).scalar_one()
-        completed_total = conn.execute(select(text('COUNT(*)')).select_from(tasks).where(and_(tasks.c.user_id==user['id'], tasks.c.completed.is_(True), tasks.c.trashed.is_(False)))).scalar_one()
-        trash_total = conn.execute(select(text('COUNT(*)')).select_from(tasks).where(and_(tasks.c.user_id==user['id'], tasks.c.trashed.is_(True)))).scalar_one()
-
-        today_count = conn.execute(select(text('COUNT(*)')).select_from(tasks).where(and_(active_conds, tasks.c.due_date==today))).scalar_one()
-        next7_count = conn.execute(select(text('COUNT(*)')).select_from(tasks).where(and_(active_conds, tasks.c.due_date.is_not(None), tasks.c.due_date>=today, tasks.c.due_date<=next_to))).scalar_one()
-        inbox_count = conn.execute(select(text('COUNT(*)')).select_from(tasks).where(and_(active_conds, tasks.c.list_id==inbox_id))).scalar_one()
-
-        rows = conn.execute(
-            select(tasks.c.list_id, text('COUNT(*) as c')).where(active_conds).group_by(tasks.c.list_id)
-        ).all()
-        by_list = {lid: int(c) for lid, c in rows}
-
-    return {
-        'activeTotal': int(active_total),
-        'completedTotal': int(completed_total),
-        'trashTotal': int(trash_total),
-        'today': int(today_count),
-        'next7': int(next7_count),
-        'inbox': int(inbox_count),
+    def n(cond):
+        return func.coalesce(func.sum(case((cond, 1), else_=0)), 0)
+
+    active = and_(tasks.c.completed.is_(False), tasks.c.trashed.is_(False))
+    # One pass over the user's tasks, grouped per list; totals are summed in Python.
+    stmt = (
+        select(
+            tasks.c.list_id,
+            lists.c.system_key,
+            n(active),
+            n(and_(tasks.c.completed.is_(True), tasks.c.trashed.is_(False))),
+            n(tasks.c.trashed.is_(True)),
+            n(and_(active, tasks.c.due_date==today)),
+            n(and_(active, tasks.c.due_date.is_not(None), tasks.c.due_date>=today, tasks.c.due_date<=next_to)),
+        )
+        .select_from(tasks.outerjoin(lists, and_(lists.c.id==tasks.c.list_id, lists.c.user_id==tasks.c.user_id)))
+        .where(tasks.c.user_id==user['id'])
+        .group_by(tasks.c.list_id, lists.c.system_key)
+    )
+    rows = await db_run(lambda conn: conn.execute(stmt).all())
+
+    active_total = completed_total = trash_total = today_count = next7_count = 0
+    by_list = {}
+    inbox_id = None
+    for lid, system_key, a, c, tr, td, n7 in rows:
+        a = int(a)
+        active_total += a; completed_total += int(c); trash_total += int(tr)
+        today_count += int(td); next7_count += int(n7)
+        if a:
+            by_list[lid] = by_list.get(lid, 0) + a
+        if system_key == "inbox":
+            inbox_id = lid
+    if inbox_id is None:
+        # Inbox holds no tasks at all (or is a legacy list without system_key).
+        inbox_id = await db_run(inbox_list_id, user['id'], write=True)
+
+    payload = {
+        'activeTotal': active_total,
+        'completedTotal': completed_total,
+        'trashTotal': trash_total,
+        'today': today_count,
+        'next7': next7_count,
+        'inbox': by_list.get(inbox_id, 0),
         'byList': by_list,
     }
+    _counts_cache.set(user['id'], (today, version, payload))
+    return payload
 
 @app.get('/api/stats')
 def get_stats(days: int = 14, user=Depends(require_user)):
@@ -1367,6 +2510,98 @@ def get_stats(days: int = 14, user=Depends(require_user)):
     }
 
 
+# --- Delta sync ---
+
+SYNC_TOMBSTONE_DAYS = int(os.getenv("SYNC_TOMBSTONE_DAYS", "30"))
+_sync_pruned = TTLCache(maxsize=10000, ttl=3600)
+
+class SyncDeleted(BaseModel):
+    folders: List[str] = Field(default_factory=list)
+    lists: List[str] = Field(default_factory=list)
+    sections: List[str] = Field(default_factory=list)
+    tasks: List[str] = Field(default_factory=list)
+
+class SyncOut(BaseModel):
+    version: int
+    reset: bool = False
+    folders: List[FolderOut] = Field(default_factory=list)
+    lists: List[ListOut] = Field(default_factory=list)
+    sections: List[SectionOut] = Field(default_factory=list)
+    tasks: List[TaskOut] = Field(default_factory=list)
+    deleted: SyncDeleted = Field(default_factory=SyncDeleted)
+
+def _sync_sources():
+    return {
+        "folders": (folders, to_folder_out),
+        "lists": (lists, to_list_out),
+        "sections": (sections, to_section_out),
+        "tasks": (tasks, to_task_out),
+    }
+
+def prune_tombstones(conn, user_id: str) -> None:
+    """Drop tombstones older than SYNC_TOMBSTONE_DAYS and raise the user's floor_version."""
+    cutoff = now_ts() - SYNC_TOMBSTONE_DAYS * 86400
+    old = and_(change_log.c.user_id == user_id, change_log.c.op == "delete", change_log.c.changed_at < cutoff)
+    top = conn.execute(select(func.max(change_log.c.version)).where(old)).scalar()
+    if top is None:
+        return
+    conn.execute(delete(change_log).where(and_(change_log.c.user_id == user_id, change_log.c.op == "delete", change_log.c.version <= top)))
+    conn.execute(
+        update(sync_versions)
+        .where(and_(sync_versions.c.user_id == user_id, sync_versions.c.floor_version < top))
+        .values(floor_version=top)
+    )
+
+@app.get("/api/sync", response_model=SyncOut)
+async def sync_changes(since: int = Query(default=0, ge=0), user=Depends(require_user)):
+    """Everything that changed after data version `since`.
+
+    `since=0` (or a version older than the pruned tombstones) returns a full
+    snapshot with reset=true. Clients store the returned `version` and pass it
+    back next time; `deleted` holds ids removed since then.
+    """
+    uid = user["id"]
+    if _sync_pruned.get(uid) is None:
+        _sync_pruned.set(uid, True)
+        await db_run(prune_tombstones, uid, write=True)
+    sources = _sync_sources()
+
+    def load(conn):
+        vrow = conn.execute(select(sync_versions.c.version, sync_versions.c.floor_version).where(sync_versions.c.user_id == uid)).first()
+        version, floor = (int(vrow[0]), int(vrow[1])) if vrow else (0, 0)
+        reset = since == 0 or since < floor or since > version
+        out = SyncOut(version=version, reset=reset)
+        if reset:
+            for name, (table, conv) in sources.items():
+                rows = conn.execute(select(table).where(table.c.user_id == uid)).mappings().all()
+                setattr(out, name, [conv(r) for r in rows])
+            return out
+        if since == version:
+            return out
+        changes = conn.execute(
+            select(change_log.c.entity, change_log.c.entity_id, change_log.c.op)
+            .where(and_(change_log.c.user_id == uid, change_log.c.version > since, change_log.c.version <= version))
+        ).all()
+        upserts: dict[str, list[str]] = {}
+        for entity, eid, op in changes:
+            if entity not in sources:
+                continue
+            if op == "delete":
+                getattr(out.deleted, entity).append(eid)
+            else:
+                upserts.setdefault(entity, []).append(eid)
+        for name, ids in upserts.items():
+            table, conv = sources[name]
+            found = []
+            for i in range(0, len(ids), 500):
+                found += conn.execute(
+                    select(table).where(and_(table.c.user_id == uid, table.c.id.in_(ids[i:i + 500])))
+                ).mappings().all()
+            setattr(out, name, [conv(r) for r in found])
+        return out
+    return await db_run(load)
+
+
 # --- Telegram bot integration ---
 
 def generate_telegram_link_code() -> str:
@@ -1437,9 +2672,11 @@ def get_telegram_settings(user=Depends(require_user)):
             if not urow:
                 # synthesize guest-like payload
                 return TelegramSettingsOut(accountId=user['id'], botConfigured=tg_bridge.is_configured(), botUsername=tg_bridge.bot_username, linked=False, linkCode=None, notifyEnabled=False, lastBotError=tg_bridge.last_error)
-        ensure_telegram_link_code(conn, user['id'], force_new=False)
+        code = ensure_telegram_link_code(conn, user['id'], force_new=False)
         urow = conn.execute(select(users).where(users.c.id == user['id'])).mappings().first()
-        return telegram_settings_payload(urow)
+    if code != user.get('telegram_link_code'):
+        invalidate_user_sessions(user['id'])  # a new link code was issued
+    return telegram_settings_payload(urow)
 
 
 @app.post('/api/settings/telegram/regenerate', response_model=TelegramSettingsOut)
@@ -1447,7 +2684,8 @@ def regenerate_telegram_link(user=Depends(require_user)):
     with engine.begin() as conn:
         ensure_telegram_link_code(conn, user['id'], force_new=True)
         urow = conn.execute(select(users).where(users.c.id == user['id'])).mappings().first()
-        return telegram_settings_payload(urow)
+    invalidate_user_sessions(user['id'])
+    return telegram_settings_payload(urow)
 
 
 @app.patch('/api/settings/telegram', response_model=TelegramSettingsOut)
@@ -1458,9 +2696,12 @@ def patch_telegram_settings(payload: TelegramSettingsPatch, user=Depends(require
             values['telegram_notify_enabled'] = bool(payload.notifyEnabled)
         if values:
             conn.execute(update(users).where(users.c.id == user['id']).values(**values))
-        ensure_telegram_link_code(conn, user['id'], force_new=False)
+        code = ensure_telegram_link_code(conn, user['id'], force_new=False)
         urow = conn.execute(select(users).where(users.c.id == user['id'])).mappings().first()
-        return telegram_settings_payload(urow)
+    if code != user.get('telegram_link_code'):
+        invalidate_user_sessions(user['id'])
+    tg_bridge.forget_user(user['id'])
+    return telegram_settings_payload(urow)
 
 
 @app.post('/api/settings/telegram/unlink', response_model=TelegramSettingsOut)
@@ -1469,7 +2710,9 @@ def unlink_telegram(user=Depends(require_user)):
         conn.execute(update(users).where(users.c.id == user['id']).values(telegram_chat_id=None, telegram_username=None, telegram_notify_enabled=False))
         ensure_telegram_link_code(conn, user['id'], force_new=True)
         urow = conn.execute(select(users).where(users.c.id == user['id'])).mappings().first()
-        return telegram_settings_payload(urow)
+    invalidate_user_sessions(user['id'])
+    tg_bridge.forget_user(user['id'])
+    return telegram_settings_payload(urow)
 
 
 @app.post('/api/settings/telegram/test')
@@ -1483,26 +2726,66 @@ def send_telegram_test(user=Depends(require_user)):
         raise HTTPException(status_code=400, detail='Telegram не подключен')
     if not tg_bridge.is_configured():
         raise HTTPException(status_code=400, detail='TELEGRAM_BOT_TOKEN не настроен на сервере')
-    ok = tg_bridge._send_message(chat_id, f"✅ Тестовое сообщение ClockTime\nАккаунт: {user['id']}")
+    # Wait for the real outcome: replies are normally fire-and-forget, but this
+    # endpoint exists to tell the user whether the chat and token actually work.
+    ok, error = tg_bridge.send_message_wait(chat_id, f"✅ Тестовое сообщение ClockTime\nАккаунт: {user['id']}")
     if not ok:
-        raise HTTPException(status_code=502, detail='Не удалось отправить сообщение Telegram')
+        raise HTTPException(status_code=502, detail=f'Не удалось отправить сообщение Telegram: {error}')
+    return {'ok': True}
+
+
+@app.post(TelegramBotBridge.WEBHOOK_PATH)
+async def telegram_webhook(request: Request):
+    if not tg_bridge.webhook_mode:
+        raise HTTPException(status_code=404, detail='Not found')
+    secret = request.headers.get('X-Telegram-Bot-Api-Secret-Token') or ''
+    if not hmac.compare_digest(secret.encode('utf-8'), tg_bridge.webhook_secret.encode('utf-8')):
+        raise HTTPException(status_code=401, detail='Bad webhook secret')
+    try:
+        upd = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail='Invalid JSON')
+    if not isinstance(upd, dict):
+        raise HTTPException(status_code=400, detail='Update must be an object')
+    await run_in_threadpool(tg_bridge.process_webhook_update, upd)
     return {'ok': True}
 
 
+wal_checkpointer = WalCheckpointer(engine, SQLITE_CHECKPOINT_INTERVAL if SQLITE_TUNED else 0, logger=lambda m: print(f"[sqlite] {m}"))
+
+# With several uvicorn workers (or replicas) only the lease holder polls Telegram
+# and sends reminders; another process takes over when the lease expires.
+BOT_LEASE_TTL = float(os.getenv("BOT_LEASE_TTL", "30"))
+bot_lease = DbLease(
+    engine, leases, "telegram-bot", ttl=BOT_LEASE_TTL,
+    on_acquired=tg_bridge.start_leader_work, on_lost=tg_bridge.stop_leader_work,
+    logger=lambda m: print(f"[lease] {m}"),
+)
+
 @app.on_event('startup')
 def _start_background_integrations():
     try:
         tg_bridge.start()
+        if tg_bridge.is_configured():
+            bot_lease.start()
     except Exception:
         pass
+    wal_checkpointer.start()
 
 
 @app.on_event('shutdown')
 def _stop_background_integrations():
     try:
+        bot_lease.stop()
         tg_bridge.stop()
     except Exception:
         pass
+    wal_checkpointer.stop()
+
+@app.on_event('shutdown')
+async def _dispose_async_engine():
+    if async_engine is not None:
+        await async_engine.dispose()
 
 
 FRONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "frontend")
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import event, exc
+
+
+class _Histogram:
+    """Fixed-bucket latency histogram in milliseconds (not thread-safe on its own)."""
+
+    def __init__(self, buckets_ms: tuple[float, ...]):
+        self.buckets_ms = buckets_ms
+        self.counts = [0] * (len(buckets_ms) + 1)
+        self.total = 0.0
+        self.max = 0.0
+        self.n = 0
+
+    def add(self, ms: float) -> None:
+        self.n += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+        i = next((k for k, b in enumerate(self.buckets_ms) if ms <= b), len(self.buckets_ms))
+        self.counts[i] += 1
+
+    def snapshot(self) -> dict:
+        labels = [f"le_{b:g}" for b in self.buckets_ms] + ["inf"]
+        return {
+            "count": self.n,
+            "avg": round(self.total / (self.n or 1), 2),
+            "max": round(self.max, 2),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class PoolMetrics:
+    """Connection pool statistics for one engine.
+
+    Counters come from SQLAlchemy pool events (connect, checkout, checkin,
+    invalidate, close). Checkout latency, i.e. how long a caller waited for a
+    connection, is measured by the pool class returned from pool_class(),
+    because the pool has no "before checkout" event.
+    """
+
+    CHECKOUT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+    HELD_BUCKETS_MS = (5, 25, 100, 250, 1000, 5000, 30000)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._engine = None
+        self.counters = {"connects": 0, "checkouts": 0, "checkins": 0, "invalidated": 0, "closed": 0, "timeouts": 0, "waiting": 0}
+        self.checkout_ms = _Histogram(self.CHECKOUT_BUCKETS_MS)
+        self.held_ms = _Histogram(self.HELD_BUCKETS_MS)
+
+    def pool_class(self, base: type) -> type:
+        """Subclass of the pool class `base` that times Pool.connect()."""
+        metrics = self
+
+        class TimedPool(base):
+            def connect(self):
+                started = time.perf_counter()
+                with metrics._lock:
+                    metrics.counters["waiting"] += 1
+                try:
+                    conn = super().connect()
+                except exc.TimeoutError:
+                    with metrics._lock:
+                        metrics.counters["timeouts"] += 1
+                    raise
+                finally:
+                    with metrics._lock:
+                        metrics.counters["waiting"] -= 1
+                with metrics._lock:
+                    metrics.checkout_ms.add((time.perf_counter() - started) * 1000.0)
+                return conn
+
+        TimedPool.__name__ = f"Timed{base.__name__}"
+        return TimedPool
+
+    def attach(self, engine) -> None:
+        """Listen to pool events of a sync Engine (pass async_engine.sync_engine for async ones).
+
+        Listeners go on the engine, so they also cover the pool that replaces
+        this one after engine.dispose(); snapshot() reads engine.pool each time.
+        """
+        self._engine = engine
+
+        def bump(name: str) -> None:
+            with self._lock:
+                self.counters[name] += 1
+
+        @event.listens_for(engine, "connect")
+        def _connect(dbapi_conn, record):
+            bump("connects")
+
+        @event.listens_for(engine, "checkout")
+        def _checkout(dbapi_conn, record, proxy):
+            record.info["checked_out_at"] = time.perf_counter()
+            bump("checkouts")
+
+        @event.listens_for(engine, "checkin")
+        def _checkin(dbapi_conn, record):
+            started = record.info.pop("checked_out_at", None)
+            with self._lock:
+                self.counters["checkins"] += 1
+                if started is not None:
+                    self.held_ms.add((time.perf_counter() - started) * 1000.0)
+
+        @event.listens_for(engine, "invalidate")
+        def _invalidate(dbapi_conn, record, exception):
+            bump("invalidated")
+
+        @event.listens_for(engine, "close")
+        def _close(dbapi_conn, record):
+            bump("closed")
+
+    def snapshot(self) -> dict:
+        pool = self._engine.pool if self._engine is not None else None
+        state: dict[str, Optional[int]] = {"size": None, "checkedOut": None, "checkedIn": None, "overflow": None}
+        if pool is not None:
+            for key, attr in (("size", "size"), ("checkedOut", "checkedout"), ("checkedIn", "checkedin"), ("overflow", "overflow")):
+                fn = getattr(pool, attr, None)
+                state[key] = fn() if callable(fn) else None
+            if state["overflow"] is not None:
+                # QueuePool.overflow() counts unopened base slots as negative overflow.
+                state["overflow"] = max(0, state["overflow"])
+        with self._lock:
+            return {
+                "pool": type(pool).__name__ if pool is not None else None,
+                **state,
+                **self.counters,
+                "checkoutMs": self.checkout_ms.snapshot(),
+                "heldMs": self.held_ms.snapshot(),
+            }
@@ -0,0 +1,257 @@
+"""Quick-add parser behind the bot's /add: pulls due date, time, reminder,
+repeat rule, duration, priority and #tags out of free text; the rest is the title.
+
+    >>> parse_quick_add("Позвонить маме завтра в 19:00 @15m #семья !2")["due_time"]
+    '19:00'
+
+Tokens are classified in one left-to-right pass. Words without a digit only
+go through keyword tables; patterns are precompiled and token-level results
+are memoized, so bulk parsing (parse_quick_add_many) stays cheap.
+benchmarks/bench_quick_add.py checks it against the original cascade.
+"""
+from __future__ import annotations
+
+import re
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Iterable, Optional
+
+MONTHS_RU = {"янв":1,"января":1,"фев":2,"февраля":2,"мар":3,"марта":3,"апр":4,"апреля":4,"май":5,"мая":5,"июн":6,"июня":6,"июл":7,"июля":7,"авг":8,"августа":8,"сен":9,"сент":9,"сентября":9,"окт":10,"октября":10,"ноя":11,"ноября":11,"дек":12,"декабря":12}
+# Sunday=0 like the web app; _WEEKDAY_PY maps to date.weekday() (Monday=0)
+WEEKDAYS = {"вс":0,"воскресенье":0,"пн":1,"понедельник":1,"вт":2,"вторник":2,"ср":3,"среда":3,"чт":4,"четверг":4,"пт":5,"пятница":5,"сб":6,"суббота":6}
+_WEEKDAY_PY = {k: (v - 1) % 7 for k, v in WEEKDAYS.items()}
+
+_REPEAT_ONE = {
+    "daily": "daily", "ежедневно": "daily", "weekly": "weekly", "еженедельно": "weekly",
+    "monthly": "monthly", "ежемесячно": "monthly", "yearly": "yearly", "ежегодно": "yearly",
+    "weekdays": "weekdays", "будни": "weekdays",
+}
+_REPEAT_TWO = {
+    ("каждый", "день"): "daily", ("каждый", "дня"): "daily", ("каждую", "неделю"): "weekly",
+    ("каждый", "месяц"): "monthly", ("каждый", "год"): "yearly",
+    ("по", "будням"): "weekdays", ("по", "будни"): "weekdays",
+}
+_RELATIVE_DAYS = {"сегодня": 0, "today": 0, "завтра": 1, "tomorrow": 1, "послезавтра": 2}
+_AT = frozenset({"в", "во"})
+_DURATION_WORDS = frozenset({"на", "dur", "duration", "длительность"})
+_DURATION_UNITS = {
+    "мин": 1, "м": 1, "min": 1, "minute": 1, "minutes": 1,
+    "ч": 60, "час": 60, "часа": 60, "часов": 60, "h": 60, "hr": 60, "hrs": 60, "hour": 60, "hours": 60,
+    "д": 1440, "дн": 1440, "дня": 1440, "дней": 1440, "day": 1440, "days": 1440,
+}
+_IN_UNIT_WORDS = frozenset({"д", "дн", "дня", "дней", "day", "days", "неделя", "недели", "недель", "week", "weeks"})
+
+_HAS_DIGIT = re.compile(r"\d").search
+_TIME_AT = re.compile(r"^в(?=\d)")
+_TIME_SEP = re.compile(r"[.,](\d{2})$")
+_TIME = re.compile(r"(\d{1,2}):(\d{2})(am|pm)?|(\d{1,2})(am|pm)|\d{4}")
+_REMINDER = re.compile(r"@?(\d+)(m|min|h|d)", re.I)
+_DURATION_PREFIX = re.compile(r"^(dur:|duration:|длительность:|~+)")
+_DURATION = re.compile(
+    r"(?P<h>\d+(?:\.\d+)?)ч(?:(?P<hm>\d{1,2})м(?:ин)?)?"
+    r"|(?P<m>\d+)м(?:ин)?"
+    r"|(?P<hours>\d+(?:\.\d+)?)час(?:а|ов)?"
+    r"|(?P<mins>\d+)мин(?:ут[аы]?)?"
+    r"|(?P<eh>\d+)h(?P<em>\d{1,2})m"
+)
+_IN_DAYS = re.compile(r"(\d+)(д|дн|дня|дней|w|нед|недел[яьи]?)", re.I)
+_DIGITS = re.compile(r"\d+")
+_ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+_NUMERIC_DATE = re.compile(r"(\d{1,2})[./-](\d{1,2})(?:[./-](\d{2,4}))?")
+_DAY = re.compile(r"\d{1,2}")
+_YEAR = re.compile(r"\d{2,4}")
+
+
+def _iso_date(y: int, m: int, d: int) -> Optional[str]:
+    try:
+        return date(y, m, d).isoformat()
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=8192)
+def parse_time_token(tok: str) -> Optional[str]:
+    """'19:00', '7pm', 'в9.30', '0930' -> 'HH:MM'."""
+    x = (tok or "").strip().lower()
+    if not x:
+        return None
+    x = _TIME_SEP.sub(r":\1", _TIME_AT.sub("", x))
+    m = _TIME.fullmatch(x)
+    if not m:
+        return None
+    if m.group(1) is not None:
+        h = int(m.group(1)); mm = int(m.group(2)); ap = m.group(3) or ""
+    elif m.group(4) is not None:
+        h = int(m.group(4)); mm = 0; ap = m.group(5)
+    else:
+        h = int(x[:2]); mm = int(x[2:]); ap = ""
+    if ap:
+        if h == 12: h = 0
+        if ap == "pm": h += 12
+    if 0 <= h < 24 and 0 <= mm < 60:
+        return f"{h:02d}:{mm:02d}"
+    return None
+
+
+@lru_cache(maxsize=8192)
+def parse_reminder_token(tok: str) -> Optional[int]:
+    """'@15m', '2h', '1d' -> minutes before the due moment."""
+    m = _REMINDER.fullmatch((tok or "").strip())
+    if not m:
+        return None
+    n = int(m.group(1)); u = m.group(2).lower()
+    return n * 1440 if u.startswith("d") else n * 60 if u.startswith("h") else n
+
+
+@lru_cache(maxsize=8192)
+def parse_duration_token(tok: str) -> Optional[int]:
+    """'1.5ч', '2ч30м', '45мин', '~30м', 'dur:1h30m' -> minutes."""
+    x = (tok or "").strip().lower()
+    if not x:
+        return None
+    x = _DURATION_PREFIX.sub("", x).replace(",", ".")
+    m = _DURATION.fullmatch(x)
+    if not m:
+        return None
+    g = m.groupdict()
+    if g["h"] is not None:
+        return max(1, round(float(g["h"]) * 60 + int(g["hm"] or 0)))
+    if g["m"] is not None:
+        return int(g["m"])
+    if g["hours"] is not None:
+        return max(1, round(float(g["hours"]) * 60))
+    if g["mins"] is not None:
+        return int(g["mins"])
+    return int(g["eh"]) * 60 + int(g["em"])
+
+
+def parse_duration_pair(a: str, b: str) -> Optional[int]:
+    """'1,5' 'часа' -> minutes."""
+    try:
+        n = float(str(a).replace(",", "."))
+    except Exception:
+        return None
+    mult = _DURATION_UNITS.get((b or "").strip().lower())
+    if mult is None:
+        return None
+    return max(1, round(n * mult))
+
+
+def _parse_date(lows: list[str], i: int, today: date, has_digit: bool) -> Optional[tuple[str, int]]:
+    """Date starting at lows[i] -> (ISO date, tokens used)."""
+    t1 = lows[i]
+    t2 = lows[i + 1] if i + 1 < len(lows) else ""
+    rel = _RELATIVE_DAYS.get(t1)
+    if rel is not None:
+        return ((today + timedelta(days=rel)).isoformat(), 1)
+    if t1 == "через":
+        m = _IN_DAYS.fullmatch(t2)
+        if m:
+            n = int(m.group(1)); u = m.group(2).lower()
+            delta = n * 7 if (u.startswith("w") or u.startswith("нед")) else n
+            return ((today + timedelta(days=delta)).isoformat(), 2)
+        t3 = lows[i + 2] if i + 2 < len(lows) else ""
+        if _DIGITS.fullmatch(t2) and t3 in _IN_UNIT_WORDS:
+            n = int(t2); delta = n * 7 if (t3.startswith("нед") or t3.startswith("week")) else n
+            return ((today + timedelta(days=delta)).isoformat(), 3)
+        return None
+    if t1 in _AT and t2 in _WEEKDAY_PY:
+        delta = (_WEEKDAY_PY[t2] - today.weekday()) % 7 or 7
+        return ((today + timedelta(days=delta)).isoformat(), 2)
+    if t1 in _WEEKDAY_PY:
+        delta = (_WEEKDAY_PY[t1] - today.weekday()) % 7 or 7
+        return ((today + timedelta(days=delta)).isoformat(), 1)
+    if not has_digit:
+        return None
+    if _ISO_DATE.fullmatch(t1):
+        return (t1, 1)
+    m = _NUMERIC_DATE.fullmatch(t1)
+    if m:
+        dd = int(m.group(1)); mm = int(m.group(2)); yy = int(m.group(3)) if m.group(3) else today.year
+        if yy < 100: yy += 2000
+        v = _iso_date(yy, mm, dd)
+        if v: return (v, 1)
+    if t2 in MONTHS_RU and _DAY.fullmatch(t1):
+        t3 = lows[i + 2] if i + 2 < len(lows) else ""
+        dd = int(t1); yy = today.year; used = 2
+        if _YEAR.fullmatch(t3):
+            yy = int(t3); yy = yy + 2000 if yy < 100 else yy; used = 3
+        v = _iso_date(yy, MONTHS_RU[t2], dd)
+        if v and used == 2 and v < (today - timedelta(days=1)).isoformat():
+            v = _iso_date(yy + 1, MONTHS_RU[t2], dd) or v
+        if v: return (v, used)
+    return None
+
+
+def parse_quick_add(raw: str, today: Optional[date] = None) -> dict:
+    """Parse one /add text; `today` (default: date.today()) anchors relative dates."""
+    if today is None:
+        today = date.today()
+    tokens = (raw or "").strip().split()
+    lows = [t.lower() for t in tokens]
+    n = len(tokens)
+    kept = []; tags = []
+    due_date = None; due_time = None; reminder = None; repeat_rule = None; duration = None; priority = 0
+    i = 0
+    while i < n:
+        t = tokens[i]; low = lows[i]
+        if t[0] == "#" and len(t) > 1:
+            tags.append(t[1:]); i += 1; continue
+        if len(t) == 2 and t[0] == "!" and t[1] in "123":
+            priority = int(t[1]); i += 1; continue
+        rule = _REPEAT_ONE.get(low)
+        if rule:
+            repeat_rule = rule; i += 1; continue
+        if i + 1 < n:
+            rule = _REPEAT_TWO.get((low, lows[i + 1]))
+            if rule:
+                repeat_rule = rule; i += 2; continue
+        if low in _AT and i + 1 < n:
+            tm = parse_time_token(tokens[i + 1])
+            if tm:
+                due_time = tm; i += 2; continue
+        has_digit = _HAS_DIGIT(t) is not None
+        if has_digit:
+            # time, reminder and duration tokens all contain a digit; keyword-led forms never do
+            tm = parse_time_token(t)
+            if tm:
+                due_time = tm; i += 1; continue
+            r = parse_reminder_token(t)
+            if r is not None:
+                reminder = r; i += 1; continue
+            d = parse_duration_token(t)
+            if d is not None:
+                duration = d; i += 1; continue
+        elif low in _DURATION_WORDS and i + 1 < n:
+            d = parse_duration_token(tokens[i + 1])
+            if d is not None:
+                duration = d; i += 2; continue
+            d = parse_duration_pair(tokens[i + 1], tokens[i + 2] if i + 2 < n else "")
+            if d is not None:
+                duration = d; i += 3; continue
+        dt = _parse_date(lows, i, today, has_digit)
+        if dt:
+            due_date, used = dt; i += used; continue
+        kept.append(t); i += 1
+    clean_tags = []; seen = set()
+    for tg in tags:
+        x = tg.strip().lstrip("#")
+        if x and x not in seen:
+            seen.add(x); clean_tags.append(x)
+    return {
+        "title": " ".join(kept).strip(),
+        "due_date": due_date,
+        "due_time": due_time,
+        "reminder_minutes": reminder,
+        "repeat_rule": repeat_rule,
+        "duration_minutes": duration,
+        "priority": priority,
+        "tags": clean_tags,
+    }
+
+
+def parse_quick_add_many(texts: Iterable[str], today: Optional[date] = None) -> list[dict]:
+    """parse_quick_add over many texts with one shared `today`."""
+    if today is None:
+        today = date.today()
+    return [parse_quick_add(t, today) for t in texts]
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import threading
+from typing import Callable, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+
+def sqlite_pragmas(
+    *,
+    wal: bool = True,
+    synchronous: str = "NORMAL",
+    busy_timeout_ms: int = 5000,
+    cache_size_kb: int = 20000,
+    mmap_size: int = 256 * 1024 * 1024,
+) -> list[str]:
+    """PRAGMA statements applied to every new SQLite connection."""
+    out = []
+    if wal:
+        out.append("PRAGMA journal_mode=WAL")
+    out += [
+        f"PRAGMA synchronous={synchronous.upper()}",
+        f"PRAGMA busy_timeout={int(busy_timeout_ms)}",
+        # negative cache_size = size in KiB rather than pages
+        f"PRAGMA cache_size={-abs(int(cache_size_kb))}",
+        f"PRAGMA mmap_size={int(mmap_size)}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+    return out
+
+
+def configure_sqlite(engine: Engine, pragmas: list[str]) -> None:
+    """Run `pragmas` on each new DBAPI connection of a (sync) SQLite engine.
+
+    For an AsyncEngine pass `async_engine.sync_engine`.
+    """
+    if engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_conn, record):
+        cur = dbapi_conn.cursor()
+        try:
+            for p in pragmas:
+                cur.execute(p)
+        finally:
+            cur.close()
+
+
+class WalCheckpointer:
+    """Background thread running `PRAGMA wal_checkpoint` every `interval` seconds.
+
+    SQLite auto-checkpoints on commit, but a steady stream of readers can keep
+    the WAL from ever being reset; a periodic PASSIVE checkpoint keeps it short
+    without blocking anyone. stop() runs a final TRUNCATE checkpoint.
+    """
+
+    def __init__(self, engine: Engine, interval: float = 300.0, logger: Optional[Callable[[str], None]] = None):
+        self.engine = engine
+        self.interval = float(interval)
+        self.log = logger or (lambda _m: None)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def checkpoint(self, mode: str = "PASSIVE") -> Optional[tuple]:
+        """Run one checkpoint; returns (busy, wal_frames, checkpointed_frames)."""
+        with self.engine.connect() as conn:
+            row = conn.execute(text(f"PRAGMA wal_checkpoint({mode})")).first()
+        return tuple(row) if row else None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.checkpoint("PASSIVE")
+            except Exception as e:
+                self.log(f"checkpoint failed: {e}")
+
+    def start(self) -> None:
+        if self.engine.dialect.name != "sqlite" or self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ct-sqlite-checkpoint", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+        try:
+            self.checkpoint("TRUNCATE")
+        except Exception as e:
+            self.log(f"final checkpoint failed: {e}")
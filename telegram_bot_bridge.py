@@ -1,211 +1,53 @@
 from __future__ import annotations
 
+import functools
+import hashlib
+import heapq
 import json
 import os
-import re
 import threading
 import time
 import urllib.parse
-import urllib.request
 from datetime import datetime, timezone, timedelta, date
 from typing import Optional
 
-from sqlalchemy import and_, select, update, or_, case
+from sqlalchemy import and_, select, update, or_, case, func
+from sqlalchemy.exc import IntegrityError
 
+from telegram_delivery import DeliveryQueue, TelegramApiError
+from telegram_http import KeepAliveClient
+from chat_executor import KeyedExecutor
+from chat_state import ChatStateStore
+from db_rate_limit import DbRateLimiter
+from quick_add import parse_quick_add
+from ttl_cache import TTLCache
 
-_MONTHS_RU = {"янв":1,"января":1,"фев":2,"февраля":2,"мар":3,"марта":3,"апр":4,"апреля":4,"май":5,"мая":5,"июн":6,"июня":6,"июл":7,"июля":7,"авг":8,"августа":8,"сен":9,"сент":9,"сентября":9,"окт":10,"октября":10,"ноя":11,"ноября":11,"дек":12,"декабря":12}
-_WEEKDAYS = {"вс":0,"воскресенье":0,"пн":1,"понедельник":1,"вт":2,"вторник":2,"ср":3,"среда":3,"чт":4,"четверг":4,"пт":5,"пятница":5,"сб":6,"суббота":6}
 
-def _iso_date(y:int,m:int,d:int)->Optional[str]:
+def task_due_ts(due_date: Optional[str], due_time: Optional[str]) -> Optional[int]:
+    """Epoch seconds of a task's due moment (09:00 when it has no time; dates are UTC)."""
+    if not due_date:
+        return None
     try:
-        dt = date(y,m,d)
-        return dt.isoformat()
+        if due_time:
+            dt = datetime.strptime(f"{due_date} {due_time}", "%Y-%m-%d %H:%M")
+        else:
+            # no task timezone in app yet -> use a conventional morning reminder time (09:00 server local/UTC naive)
+            dt = datetime.strptime(f"{due_date} 09:00", "%Y-%m-%d %H:%M")
+        # treat as UTC to keep behaviour deterministic across Railway restarts/regions
+        dt = dt.replace(tzinfo=timezone.utc)
+        return int(dt.timestamp())
     except Exception:
         return None
 
-def _parse_time_token(tok:str)->Optional[str]:
-    x=(tok or '').strip().lower()
-    if not x:
-        return None
-    x=re.sub(r'^в(?=\d)','',x)
-    x=re.sub(r'[.,](\d{2})$', r':\1', x)
-    m=re.match(r'^(\d{1,2}):(\d{2})(am|pm)?$', x)
-    if not m:
-        m2=re.match(r'^(\d{1,2})(am|pm)$', x)
-        if m2:
-            h=int(m2.group(1)); mm=0; ap=m2.group(2).lower()
-        else:
-            if re.fullmatch(r'\d{4}', x):
-                h=int(x[:2]); mm=int(x[2:]); ap=''
-            else:
-                return None
-    else:
-        h=int(m.group(1)); mm=int(m.group(2)); ap=(m.group(3) or '').lower()
-    if ap:
-        if h==12: h=0
-        if ap=='pm': h += 12
-    if 0 <= h < 24 and 0 <= mm < 60:
-        return f"{h:02d}:{mm:02d}"
-    return None
-
-def _parse_reminder_token(tok:str)->Optional[int]:
-    m=re.match(r'^@?(\d+)(m|min|h|d)$', (tok or '').strip(), flags=re.I)
-    if not m:
-        return None
-    n=int(m.group(1)); u=m.group(2).lower()
-    return n*1440 if u.startswith('d') else n*60 if u.startswith('h') else n
 
-def _parse_duration_token(tok:str)->Optional[int]:
-    x=(tok or '').strip().lower()
-    if not x:
+def reminder_fire_ts(due_date: Optional[str], due_time: Optional[str], reminder_minutes: Optional[int]) -> Optional[int]:
+    """Value for tasks.reminder_fire_at: when the reminder is due, or None without one."""
+    if reminder_minutes is None:
         return None
-    x=re.sub(r'^(dur:|duration:|длительность:|~+)', '', x)
-    x=x.replace(',', '.')
-    m=re.match(r'^(\d+(?:\.\d+)?)ч(?:(\d{1,2})м(?:ин)?)?$', x)
-    if m:
-        return max(1, round(float(m.group(1))*60 + int(m.group(2) or 0)))
-    m=re.match(r'^(\d+)м(?:ин)?$', x)
-    if m:
-        return int(m.group(1))
-    m=re.match(r'^(\d+(?:\.\d+)?)час(?:а|ов)?$', x)
-    if m:
-        return max(1, round(float(m.group(1))*60))
-    m=re.match(r'^(\d+)мин(?:ут[аы]?)?$', x)
-    if m:
-        return int(m.group(1))
-    m=re.match(r'^(\d+)h(\d{1,2})m$', x, flags=re.I)
-    if m:
-        return int(m.group(1))*60 + int(m.group(2))
-    return None
-
-def _parse_duration_pair(a:str,b:str)->Optional[int]:
-    try:
-        n=float(str(a).replace(',', '.'))
-    except Exception:
+    due_ts = task_due_ts(due_date, due_time)
+    if due_ts is None:
         return None
-    u=(b or '').strip().lower()
-    if u in {'мин','м','min','minute','minutes'}:
-        return max(1, round(n))
-    if u in {'ч','час','часа','часов','h','hr','hrs','hour','hours'}:
-        return max(1, round(n*60))
-    if u in {'д','дн','дня','дней','day','days'}:
-        return max(1, round(n*1440))
-    return None
-
-def _parse_repeat(tokens:list[str], i:int)->Optional[tuple[str,int]]:
-    a=(tokens[i] if i < len(tokens) else '').lower()
-    b=(tokens[i+1] if i+1 < len(tokens) else '').lower()
-    one={('daily',):'daily',('ежедневно',):'daily',('weekly',):'weekly',('еженедельно',):'weekly',('monthly',):'monthly',('ежемесячно',):'monthly',('yearly',):'yearly',('ежегодно',):'yearly',('weekdays',):'weekdays',('будни',):'weekdays'}
-    for k,v in one.items():
-        if a == k[0]: return (v,1)
-    if a == 'каждый' and b in {'день','дня'}: return ('daily',2)
-    if a == 'каждую' and b == 'неделю': return ('weekly',2)
-    if a == 'каждый' and b == 'месяц': return ('monthly',2)
-    if a == 'каждый' and b == 'год': return ('yearly',2)
-    if a == 'по' and b in {'будням','будни'}: return ('weekdays',2)
-    return None
-
-def _parse_date_tokens(tokens:list[str], i:int)->Optional[tuple[str,int]]:
-    t1=(tokens[i] if i < len(tokens) else '').lower()
-    t2=(tokens[i+1] if i+1 < len(tokens) else '').lower()
-    t3=(tokens[i+2] if i+2 < len(tokens) else '').lower()
-    today=date.today()
-    if t1 in {'сегодня','today'}: return (today.isoformat(),1)
-    if t1 in {'завтра','tomorrow'}: return ((today+timedelta(days=1)).isoformat(),1)
-    if t1 == 'послезавтра': return ((today+timedelta(days=2)).isoformat(),1)
-    if t1 == 'через':
-        m=re.match(r'^(\d+)(д|дн|дня|дней|w|нед|недел[яьи]?)$', t2, flags=re.I)
-        if m:
-            n=int(m.group(1)); u=m.group(2).lower(); delta=n*7 if (u.startswith('w') or u.startswith('нед')) else n
-            return ((today+timedelta(days=delta)).isoformat(),2)
-        if re.fullmatch(r'\d+', t2) and re.match(r'^(д|дн|дня|дней|day|days|неделя|недели|недель|week|weeks)$', t3):
-            n=int(t2); delta=n*7 if (t3.startswith('нед') or t3.startswith('week')) else n
-            return ((today+timedelta(days=delta)).isoformat(),3)
-    if t1 in {'в','во'} and t2 in _WEEKDAYS:
-        target=_WEEKDAYS[t2]; delta=(target - today.weekday() - 1) % 7  # Python Monday=0, JS Sunday=0 mismatch fix later below
-        # easier use datetime.weekday map manually from isoweekday
-        pyw=today.weekday()  # Mon=0..Sun=6
-        target_py={1:0,2:1,3:2,4:3,5:4,6:5,0:6}[target]
-        delta=(target_py - pyw) % 7 or 7
-        return ((today+timedelta(days=delta)).isoformat(),2)
-    if t1 in _WEEKDAYS:
-        pyw=today.weekday()
-        target_py={1:0,2:1,3:2,4:3,5:4,6:5,0:6}[_WEEKDAYS[t1]]
-        delta=(target_py - pyw) % 7 or 7
-        return ((today+timedelta(days=delta)).isoformat(),1)
-    if re.fullmatch(r'\d{4}-\d{2}-\d{2}', t1):
-        return (t1,1)
-    m=re.match(r'^(\d{1,2})[./-](\d{1,2})(?:[./-](\d{2,4}))?$', t1)
-    if m:
-        dd=int(m.group(1)); mm=int(m.group(2)); yy=int(m.group(3)) if m.group(3) else today.year
-        if yy < 100: yy += 2000
-        v=_iso_date(yy,mm,dd)
-        if v: return (v,1)
-    if re.fullmatch(r'\d{1,2}', t1) and t2 in _MONTHS_RU:
-        dd=int(t1); yy=today.year; used=2
-        if re.fullmatch(r'\d{2,4}', t3):
-            yy=int(t3); yy = yy+2000 if yy < 100 else yy; used=3
-        v=_iso_date(yy,_MONTHS_RU[t2],dd)
-        if v and used == 2 and v < (today - timedelta(days=1)).isoformat():
-            v=_iso_date(yy+1,_MONTHS_RU[t2],dd) or v
-        if v: return (v,used)
-    return None
-
-def _parse_quick_add_text(raw:str)->dict:
-    tokens=[t for t in (raw or '').strip().split() if t]
-    kept=[]; tags=[]
-    due_date=None; due_time=None; reminder=None; repeat_rule=None; duration=None; priority=0
-    i=0
-    while i < len(tokens):
-        t=tokens[i]; low=t.lower()
-        if t.startswith('#') and len(t) > 1:
-            tags.append(t[1:]); i += 1; continue
-        m=re.match(r'^!([1-3])$', t)
-        if m:
-            priority=int(m.group(1)); i += 1; continue
-        rep=_parse_repeat(tokens, i)
-        if rep:
-            repeat_rule, used = rep; i += used; continue
-        if low in {'в','во'} and i+1 < len(tokens):
-            tm=_parse_time_token(tokens[i+1])
-            if tm:
-                due_time=tm; i += 2; continue
-        tm=_parse_time_token(t)
-        if tm:
-            due_time=tm; i += 1; continue
-        r=_parse_reminder_token(t)
-        if r is not None:
-            reminder=r; i += 1; continue
-        if low in {'на','dur','duration','длительность'} and i+1 < len(tokens):
-            d=_parse_duration_token(tokens[i+1])
-            if d is not None:
-                duration=d; i += 2; continue
-            d2=_parse_duration_pair(tokens[i+1], tokens[i+2] if i+2 < len(tokens) else '')
-            if d2 is not None:
-                duration=d2; i += 3; continue
-        d=_parse_duration_token(t)
-        if d is not None:
-            duration=d; i += 1; continue
-        dt=_parse_date_tokens(tokens, i)
-        if dt:
-            due_date, used = dt; i += used; continue
-        kept.append(t); i += 1
-    # de-dup tags
-    clean_tags=[]; seen=set()
-    for tg in tags:
-        x=tg.strip().lstrip('#')
-        if x and x not in seen:
-            seen.add(x); clean_tags.append(x)
-    return {
-        'title': ' '.join(kept).strip(),
-        'due_date': due_date,
-        'due_time': due_time,
-        'reminder_minutes': reminder,
-        'repeat_rule': repeat_rule,
-        'duration_minutes': duration,
-        'priority': priority,
-        'tags': clean_tags,
-    }
+    return due_ts - int(reminder_minutes) * 60
 
 
 class TelegramBotBridge:
@@ -216,37 +58,108 @@ class TelegramBotBridge:
     - /tasks, /today, /next7, /inbox quick views
     - /add <text> add task to inbox
     - /done <id_prefix> mark task completed
-    - background reminder sender (Telegram messages)
+    - background reminder sender (Telegram messages), driven by tasks.reminder_fire_at
 
     Bot token is read from TELEGRAM_BOT_TOKEN (preferred) or CLOCKTIME_TELEGRAM_BOT_TOKEN.
+    Replies and reminders go through a rate-limited DeliveryQueue (telegram_delivery.py;
+    replies first), tuned by
+    TELEGRAM_SEND_WORKERS, TELEGRAM_GLOBAL_RATE (msg/s; raise it with paid broadcasts),
+    TELEGRAM_CHAT_INTERVAL and TELEGRAM_QUEUE_MAX. TELEGRAM_API_BASE points the bridge
+    at another Bot API server (a local one or a fake for benchmarks). Bot API calls reuse
+    keep-alive connections (TELEGRAM_HTTP_POOL_SIZE, TELEGRAM_HTTP_CONNECT_TIMEOUT).
+    Incoming updates are handled on TELEGRAM_UPDATE_WORKERS threads, in order within a chat.
+
+    With TELEGRAM_WEBHOOK_URL (the app's public base URL) set, the bridge registers a
+    webhook at WEBHOOK_PATH instead of polling; main.py serves that route and checks
+    TELEGRAM_WEBHOOK_SECRET (derived from the token when unset). Any web worker may
+    then get an update: re-sent updates are caught through `updates_log`, and send
+    slots are shared through the `rate_limits` table, so several workers together
+    stay within Telegram's limits.
     """
 
-    def __init__(self, *, engine, users, tasks, lists, now_ts_fn, gen_id_fn, logger=None):
+    def __init__(self, *, engine, users, tasks, lists, now_ts_fn, gen_id_fn, task_tags=None, sync_versions=None, chat_state=None, updates_log=None, rate_limits=None, on_tasks_changed=None, on_user_changed=None, journal_fn=None, task_rank_fn=None, logger=None):
         self.engine = engine
         self.users = users
         self.tasks = tasks
         self.lists = lists
+        self.task_tags = task_tags
+        self.sync_versions = sync_versions
         self.now_ts = now_ts_fn
         self.gen_id = gen_id_fn
         self.logger = logger or (lambda *a, **k: None)
+        self.on_tasks_changed = on_tasks_changed or (lambda user_id: None)
+        self.on_user_changed = on_user_changed or (lambda user_id: None)
+        # journal_fn(conn, user_id, entity, ids) records task changes for delta sync
+        self.journal_fn = journal_fn
+        # task_rank_fn(conn, user_id, list_id) -> order_index that appends a task to the list
+        self.task_rank_fn = task_rank_fn
 
         self.token = (os.getenv("TELEGRAM_BOT_TOKEN") or os.getenv("CLOCKTIME_TELEGRAM_BOT_TOKEN") or "").strip()
         self.enabled = bool(self.token)
+        self.api_base = (os.getenv("TELEGRAM_API_BASE") or "https://api.telegram.org").strip().rstrip("/")
+        send_workers = int(os.getenv("TELEGRAM_SEND_WORKERS", "8"))
+        # one keep-alive connection per send worker, plus getUpdates and command replies
+        self.http = KeepAliveClient(
+            self.api_base,
+            pool_size=int(os.getenv("TELEGRAM_HTTP_POOL_SIZE", str(send_workers + 4))),
+            connect_timeout=float(os.getenv("TELEGRAM_HTTP_CONNECT_TIMEOUT", "10")),
+        )
+        self.delivery = DeliveryQueue(
+            lambda payload: self._tg_api("sendMessage", payload, timeout=20),
+            workers=send_workers,
+            # a little under Telegram's ~30 msg/s and 1 msg/s per chat, so jitter doesn't earn 429s
+            global_rate=float(os.getenv("TELEGRAM_GLOBAL_RATE", "27")),
+            chat_interval=float(os.getenv("TELEGRAM_CHAT_INTERVAL", "1.1")),
+            max_queue=int(os.getenv("TELEGRAM_QUEUE_MAX", "10000")),
+            logger=self._log,
+        )
         self._stop = threading.Event()
         self._started = False
         self._updates_thread: Optional[threading.Thread] = None
         self._reminder_thread: Optional[threading.Thread] = None
+        self._reminders_wake = threading.Event()
+        # getUpdates offset: one past the newest dispatched update, so a slow handler
+        # never holds back updates of other chats. Handlers run on a per-chat ordered
+        # pool; unfinished updates are kept in `updates_log` and replayed by the next leader.
+        self.updates_log = updates_log
         self._offset = 0
+        self._updates_lock = threading.Lock()
+        self._updates_in_flight: set[int] = set()
+        self._handlers = KeyedExecutor(int(os.getenv("TELEGRAM_UPDATE_WORKERS", "8")), name="ct-telegram-handler", logger=self._log)
+        self.webhook_url = self._webhook_full_url((os.getenv("TELEGRAM_WEBHOOK_URL") or "").strip())
+        self.webhook_secret = (os.getenv("TELEGRAM_WEBHOOK_SECRET") or "").strip() or (
+            hashlib.sha256(f"ct-webhook:{self.token}".encode("utf-8")).hexdigest() if self.token else ""
+        )
+        self.webhook_max_connections = int(os.getenv("TELEGRAM_WEBHOOK_MAX_CONNECTIONS", "40"))
+        if self.webhook_mode and rate_limits is not None:
+            # Every web worker answers webhook updates and sends on its own: share the limits.
+            self.delivery.shared_limiter = DbRateLimiter(engine, rate_limits, logger=self._log)
+        self._updates_pruned_at = 0.0
+        # Telegram re-sends an update when our reply was slow or failed; skip ones already taken.
+        self._seen_updates = TTLCache(maxsize=20000, ttl=3600)
+        self._chat_cache = TTLCache(maxsize=self.CHAT_CACHE_SIZE, ttl=self.CHAT_CACHE_TTL)
+        self._page_cache = TTLCache(maxsize=self.PAGE_CACHE_SIZE, ttl=self.PAGE_CACHE_TTL)
         self.bot_username: Optional[str] = None
         self.last_error: Optional[str] = None
-        self._chat_view_mode: dict[str, str] = {}
+        # view mode and last list page per chat; kept in the chat_state table, bounded in memory.
+        # With a webhook any worker may get a chat's next update, so reads go to the table
+        # and view mode changes are written at once; a polling leader sees every update itself.
+        self.chat_state = ChatStateStore(
+            engine, chat_state,
+            maxsize=int(os.getenv("TELEGRAM_CHAT_STATE_CACHE", "10000")),
+            ttl=0 if self.webhook_mode else 60, flush_interval=5, logger=self._log,
+        ) if chat_state is not None else None
 
     # ---------- lifecycle ----------
     def start(self):
+        """Start the per-process parts: bot info and the delivery queue.
+
+        Polling/webhook registration and reminders run in one process only;
+        main.py calls start_leader_work() in whichever process holds the lease.
+        """
         if not self.enabled or self._started:
             return
         self._started = True
-        self._stop.clear()
         # fetch bot info (best effort)
         try:
             me = self._tg_api("getMe", {})
@@ -256,18 +169,156 @@ class TelegramBotBridge:
             self.last_error = str(e)
             self._log(f"getMe failed: {e}")
 
-        self._updates_thread = threading.Thread(target=self._updates_loop, name="ct-telegram-updates", daemon=True)
-        self._reminder_thread = threading.Thread(target=self._reminder_loop, name="ct-telegram-reminders", daemon=True)
-        self._updates_thread.start()
+        self.delivery.start()
+        if self.chat_state is not None:
+            self.chat_state.start()
+        self._log(f"Telegram bridge started ({'webhook' if self.webhook_mode else 'polling'})")
+
+    def start_leader_work(self):
+        """Register the webhook or start polling, and start the reminder scheduler."""
+        if not self.enabled or self._reminder_thread is not None:
+            return
+        # A fresh event per term: loops of a previous term may still be finishing a long poll.
+        self._stop = stop = threading.Event()
+        if self.webhook_mode:
+            self._register_webhook()
+        else:
+            self._delete_webhook()
+            with self._updates_lock:
+                self._offset = 0
+                self._updates_in_flight.clear()
+            self._handlers.start()
+            self._updates_thread = threading.Thread(target=self._updates_loop, args=(stop,), name="ct-telegram-updates", daemon=True)
+            self._updates_thread.start()
+        self._reminder_thread = threading.Thread(target=self._reminder_loop, args=(stop,), name="ct-telegram-reminders", daemon=True)
         self._reminder_thread.start()
-        self._log("Telegram bridge started")
 
-    def stop(self):
+    def stop_leader_work(self):
+        """Stop polling and reminders; unfinished updates go to the next leader."""
         self._stop.set()
+        self._reminders_wake.set()
+        dropped = self._handlers.stop(timeout=2)
+        if dropped:
+            self._log(f"left {dropped} queued updates to the next leader")
+        for t in (self._updates_thread, self._reminder_thread):
+            if t is not None:
+                t.join(timeout=1)
+        self._updates_thread = self._reminder_thread = None
+
+    def stop(self):
+        self.stop_leader_work()
+        self.delivery.stop()
+        if self.chat_state is not None:
+            self.chat_state.stop()
+        self.http.close()
+
+    def reminders_changed(self):
+        """Tell the reminder scheduler that reminder_fire_at of some task changed."""
+        self._reminders_wake.set()
 
     def is_configured(self) -> bool:
         return self.enabled
 
+    # ---------- webhook ----------
+    WEBHOOK_PATH = "/api/telegram/webhook"
+
+    @classmethod
+    def _webhook_full_url(cls, base: str) -> str:
+        if not base:
+            return ""
+        base = base.rstrip("/")
+        return base if base.endswith(cls.WEBHOOK_PATH) else base + cls.WEBHOOK_PATH
+
+    @property
+    def webhook_mode(self) -> bool:
+        return self.enabled and bool(self.webhook_url)
+
+    def _register_webhook(self):
+        try:
+            resp = self._tg_api("setWebhook", {
+                "url": self.webhook_url,
+                "secret_token": self.webhook_secret,
+                "max_connections": self.webhook_max_connections,
+                "allowed_updates": ["message", "callback_query"],
+            }, timeout=20)
+            if not resp.get("ok"):
+                raise RuntimeError(resp.get("description") or "setWebhook failed")
+        except Exception as e:
+            self.last_error = str(e)
+            self._log(f"setWebhook failed: {e}")
+
+    def _delete_webhook(self):
+        # getUpdates answers 409 while a webhook is set (e.g. left over from webhook mode)
+        try:
+            self._tg_api("deleteWebhook", {"drop_pending_updates": False}, timeout=20)
+        except Exception as e:
+            self._log(f"deleteWebhook failed: {e}")
+
+    # A webhook update claimed by a worker that never marked it done (crashed) may be
+    # taken over when Telegram re-sends it this many seconds later.
+    WEBHOOK_CLAIM_TIMEOUT = 60
+
+    def process_webhook_update(self, upd: dict) -> bool:
+        """Handle one update posted to the webhook; False if it was a duplicate.
+
+        Duplicates are caught across workers by claiming the update_id in
+        `updates_log` (a per-process cache answers repeats without a query).
+        """
+        uid = upd.get("update_id")
+        if uid is not None:
+            if self._seen_updates.get(uid):
+                return False
+            self._seen_updates.set(uid, True)
+            if not self._claim_webhook_update(int(uid), upd):
+                return False
+        try:
+            self._handle_update(upd)
+        except Exception as e:
+            # Still acknowledged: a failing update would otherwise be re-sent forever.
+            self.last_error = str(e)
+            self._log(f"handle update failed: {e}")
+        finally:
+            if uid is not None:
+                self._mark_update_done(int(uid))
+        return True
+
+    def _claim_webhook_update(self, uid: int, upd: dict) -> bool:
+        """Record the update as taken by this worker; False if another one has it (or had it)."""
+        if self.updates_log is None:
+            return True
+        t = self.updates_log
+        now = int(time.time())
+        self._prune_updates_log(now)
+        try:
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(t.insert().values(update_id=uid, payload=json.dumps(upd, ensure_ascii=False), done=False, received_at=now))
+                return True
+            except IntegrityError:
+                with self.engine.begin() as conn:
+                    res = conn.execute(
+                        update(t)
+                        .where(and_(t.c.update_id == uid, t.c.done.is_(False), t.c.received_at < now - self.WEBHOOK_CLAIM_TIMEOUT))
+                        .values(received_at=now)
+                    )
+                return bool(res.rowcount)
+        except Exception as e:
+            # Can't tell: handling it twice beats dropping it.
+            self._log(f"claiming update {uid} failed: {e}")
+            return True
+
+    def _prune_updates_log(self, now: int) -> None:
+        """Webhook mode has no resume step to clean the log; drop day-old rows every few minutes."""
+        if now - self._updates_pruned_at < 600:
+            return
+        self._updates_pruned_at = now
+        t = self.updates_log
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(t.delete().where(t.c.received_at < now - self.UPDATES_LOG_MAX_AGE))
+        except Exception as e:
+            self._log(f"pruning the updates log failed: {e}")
+
     # ---------- telegram HTTP ----------
     def _log(self, msg: str):
         try:
@@ -275,32 +326,90 @@ class TelegramBotBridge:
         except Exception:
             pass
 
+    def _tasks_changed(self, user_id: str):
+        try:
+            self.on_tasks_changed(user_id)
+        except Exception as e:
+            self._log(f"on_tasks_changed failed: {e}")
+
+    def _journal_tasks(self, conn, user_id: str, task_ids: list[str]):
+        if self.journal_fn is not None:
+            self.journal_fn(conn, user_id, "tasks", task_ids)
+
+    def _user_changed(self, user_id: str):
+        try:
+            self.on_user_changed(user_id)
+        except Exception as e:
+            self._log(f"on_user_changed failed: {e}")
+
+    # Calls that are safe to resend when a connection drops before the response
+    # arrives; a resent sendMessage would show up twice.
+    IDEMPOTENT_METHODS = frozenset({"getUpdates", "getMe", "answerCallbackQuery"})
+
     def _tg_api(self, method: str, data: Optional[dict] = None, timeout: int = 35) -> dict:
         if not self.token:
             raise RuntimeError("Telegram bot token is not configured")
-        url = f"https://api.telegram.org/bot{self.token}/{method}"
         payload = json.dumps(data or {}).encode("utf-8")
-        req = urllib.request.Request(url, data=payload, headers={"Content-Type": "application/json"}, method="POST")
-        with urllib.request.urlopen(req, timeout=timeout) as resp:
-            raw = resp.read().decode("utf-8", "ignore")
+        status, body_bytes = self.http.post(
+            f"/bot{self.token}/{method}", payload, timeout=timeout, idempotent=method in self.IDEMPOTENT_METHODS
+        )
+        raw = body_bytes.decode("utf-8", "ignore")
+        if status >= 400:
+            # Bot API errors come back as non-2xx with a JSON body:
+            # {"ok": false, "error_code": 429, "description": ..., "parameters": {"retry_after": 5}}
+            try:
+                body = json.loads(raw)
+            except Exception:
+                body = {}
+            params = body.get("parameters") or {}
+            raise TelegramApiError(
+                f"{method}: {body.get('description') or f'HTTP {status}'}",
+                error_code=int(body.get("error_code") or status),
+                retry_after=params.get("retry_after"),
+            )
         try:
             return json.loads(raw)
         except Exception:
             raise RuntimeError(f"Telegram API invalid response: {raw[:200]}")
 
     def _send_message(self, chat_id: str, text: str, *, parse_mode: str = "HTML", reply_markup: Optional[dict] = None):
-        try:
-            payload = {"chat_id": str(chat_id), "text": text, "disable_web_page_preview": True}
-            if parse_mode:
-                payload["parse_mode"] = parse_mode
-            if reply_markup:
-                payload["reply_markup"] = reply_markup
-            self._tg_api("sendMessage", payload, timeout=20)
+        """Reply to a chat: queued ahead of reminders, never blocks the handler thread."""
+        if self._queue_message(chat_id, text, parse_mode=parse_mode, reply_markup=reply_markup, on_done=self._reply_done, urgent=True):
             return True
-        except Exception as e:
-            self.last_error = str(e)
-            self._log(f"sendMessage failed: {e}")
-            return False
+        self.last_error = "delivery queue full"
+        self._log(f"sendMessage to {chat_id} dropped: delivery queue full")
+        return False
+
+    def send_message_wait(self, chat_id: str, text: str, *, timeout: float = 15.0) -> tuple[bool, Optional[str]]:
+        """Send through the delivery queue (urgent) and wait for the outcome: (ok, error text)."""
+        done = threading.Event()
+        outcome: list = []
+
+        def on_done(ok: bool, error: Optional[Exception]):
+            outcome.append((ok, None if ok else str(error or "delivery stopped")))
+            done.set()
+
+        if not self._queue_message(chat_id, text, on_done=on_done, urgent=True):
+            return False, "delivery queue full"
+        if not done.wait(timeout):
+            return False, "timed out waiting for Telegram"
+        ok, error = outcome[0]
+        if error:
+            self.last_error = error
+        return ok, error
+
+    def _reply_done(self, ok: bool, error: Optional[Exception]):
+        if not ok and error is not None:
+            self.last_error = str(error)
+
+    def _queue_message(self, chat_id: str, text: str, *, parse_mode: str = "HTML", reply_markup: Optional[dict] = None, on_done=None, urgent: bool = False) -> bool:
+        """Hand a message to the delivery queue; False if the queue is full."""
+        payload = {"chat_id": str(chat_id), "text": text, "disable_web_page_preview": True}
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        if reply_markup:
+            payload["reply_markup"] = reply_markup
+        return self.delivery.submit(str(chat_id), payload, on_done, urgent=urgent)
 
     def _edit_message(self, chat_id: str, message_id: int, text: str, *, parse_mode: str = "HTML", reply_markup: Optional[dict] = None):
         try:
@@ -405,12 +514,31 @@ class TelegramBotBridge:
         return m.get(str(rule or ""), str(rule or ""))
 
     def _get_view_mode(self, chat_id: str) -> str:
-        v = (self._chat_view_mode.get(str(chat_id)) or "expanded").strip().lower()
+        if self.chat_state is None:
+            return "expanded"
+        v = (self.chat_state.get(chat_id).get("view_mode") or "expanded").strip().lower()
         return "compact" if v == "compact" else "expanded"
 
+    def _list_page_arg(self, chat_id: str, mode: str, arg: str) -> int:
+        """Page for a list command: `/tasks 3` opens page 3, a bare `/tasks` the chat's last page of that list."""
+        arg = (arg or "").strip()
+        if arg.isdigit():
+            return max(1, int(arg))
+        if self.chat_state is not None:
+            state = self.chat_state.get(chat_id)
+            if state.get("last_mode") == mode and state.get("last_page"):
+                return int(state["last_page"])
+        return 1
+
     def _set_view_mode(self, chat_id: str, mode: str):
         m = (mode or "").strip().lower()
-        self._chat_view_mode[str(chat_id)] = "compact" if m == "compact" else "expanded"
+        if self.chat_state is not None:
+            self.chat_state.update(chat_id, view_mode="compact" if m == "compact" else "expanded")
+            if self.webhook_mode:
+                try:
+                    self.chat_state.flush()
+                except Exception as e:
+                    self._log(f"chat state write failed, retrying in background: {e}")
 
     def _fmt_task_line_compact(self, r) -> str:
         title = self._h((getattr(r, "title", "") or "")[:72])
@@ -460,21 +588,123 @@ class TelegramBotBridge:
         return body
 
     # ---------- command handling ----------
-    def _updates_loop(self):
-        while not self._stop.is_set():
+    UPDATES_MAX_PENDING = 1000
+    # Telegram keeps unconfirmed updates for a day and may restart update ids after a
+    # quiet week; an older log says nothing about the current offset.
+    UPDATES_LOG_MAX_AGE = 24 * 3600
+
+    def updates_snapshot(self) -> dict:
+        """Polling position: next offset, completed watermark (lowest unfinished id), handlers busy."""
+        with self._updates_lock:
+            return {
+                "offset": self._offset,
+                "completed": min(self._updates_in_flight, default=self._offset),
+                "inFlight": len(self._updates_in_flight),
+                "logged": self.updates_log is not None,
+            }
+
+    def _resume_updates(self) -> list[dict]:
+        """Restore the offset from the updates log; returns the unfinished updates, oldest first."""
+        if self.updates_log is None:
+            return []
+        t = self.updates_log
+        cutoff = int(time.time()) - self.UPDATES_LOG_MAX_AGE
+        with self.engine.begin() as conn:
+            conn.execute(t.delete().where(t.c.received_at < cutoff))
+            last = conn.execute(select(func.max(t.c.update_id))).scalar()
+            rows = conn.execute(select(t.c.update_id, t.c.payload).where(t.c.done.is_(False)).order_by(t.c.update_id)).all()
+        pending = []
+        for uid, payload in rows:
             try:
+                pending.append(json.loads(payload))
+            except Exception:
+                self._log(f"dropping unreadable logged update {uid}")
+        with self._updates_lock:
+            self._offset = int(last) + 1 if last is not None else 0
+            self._updates_in_flight = {int(u["update_id"]) for u in pending}
+        return pending
+
+    def _log_updates(self, updates: list[dict]) -> None:
+        """Record dispatched updates and prune finished ones below the newest."""
+        if self.updates_log is None or not updates:
+            return
+        t = self.updates_log
+        now = int(time.time())
+        with self.engine.begin() as conn:
+            conn.execute(t.insert(), [
+                {"update_id": int(u["update_id"]), "payload": json.dumps(u, ensure_ascii=False), "done": False, "received_at": now}
+                for u in updates
+            ])
+            newest = max(int(u["update_id"]) for u in updates)
+            conn.execute(t.delete().where(and_(t.c.done.is_(True), t.c.update_id < newest)))
+
+    def _mark_update_done(self, uid: int) -> None:
+        if self.updates_log is None:
+            return
+        t = self.updates_log
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(update(t).where(t.c.update_id == uid).values(done=True))
+        except Exception as e:
+            # left unfinished in the log: a later leader replays it
+            self._log(f"marking update {uid} done failed: {e}")
+
+    def _dispatch_update(self, upd: dict, stop: threading.Event) -> None:
+        uid = int(upd["update_id"])
+        self._handlers.submit(self._update_chat_key(upd), lambda: self._run_update(uid, upd, stop))
+
+    def _update_chat_key(self, upd: dict) -> str:
+        cb = upd.get("callback_query") or {}
+        msg = upd.get("message") or cb.get("message") or {}
+        chat_id = (msg.get("chat") or {}).get("id") or (cb.get("from") or {}).get("id")
+        return str(chat_id) if chat_id is not None else f"update:{upd.get('update_id')}"
+
+    def _run_update(self, uid: int, upd: dict, stop: threading.Event):
+        if stop.is_set():
+            return  # leadership lost while queued; still unfinished in the log, the next leader replays it
+        try:
+            self._handle_update(upd)
+        except Exception as e:
+            self.last_error = str(e)
+            self._log(f"handle update failed: {e}")
+        finally:
+            self._mark_update_done(uid)
+            with self._updates_lock:
+                self._updates_in_flight.discard(uid)
+
+    def _updates_loop(self, stop: threading.Event):
+        """Poll getUpdates and hand each update to the handler pool, keyed by chat.
+
+        Updates of one chat are handled in order; different chats run in parallel.
+        Each poll confirms everything dispatched so far, so a slow handler only
+        delays its own chat. Dispatched updates are written to `updates_log` first
+        and marked done when handled: a new leader resumes polling after the newest
+        logged update and replays the unfinished ones.
+        """
+        resumed = False
+        while not stop.is_set():
+            try:
+                if not resumed:
+                    for upd in self._resume_updates():
+                        self._dispatch_update(upd, stop)
+                    resumed = True
+                self._handlers.wait_below(self.UPDATES_MAX_PENDING, timeout=5)
                 resp = self._tg_api("getUpdates", {"timeout": 25, "offset": self._offset, "allowed_updates": ["message", "callback_query"]}, timeout=35)
+                if stop.is_set():
+                    break  # lost the lease mid-poll; these stay unconfirmed for the next leader
                 if not resp.get("ok"):
                     time.sleep(2)
                     continue
-                for upd in resp.get("result") or []:
-                    try:
-                        uid = int(upd.get("update_id") or 0)
-                        self._offset = max(self._offset, uid + 1)
-                        self._handle_update(upd)
-                    except Exception as e:
-                        self.last_error = str(e)
-                        self._log(f"handle update failed: {e}")
+                with self._updates_lock:
+                    fresh = [u for u in resp.get("result") or [] if int(u.get("update_id") or 0) >= self._offset]
+                if not fresh:
+                    continue
+                self._log_updates(fresh)
+                with self._updates_lock:
+                    self._offset = max(int(u["update_id"]) for u in fresh) + 1
+                    self._updates_in_flight.update(int(u["update_id"]) for u in fresh)
+                for upd in fresh:
+                    self._dispatch_update(upd, stop)
             except Exception as e:
                 self.last_error = str(e)
                 self._log(f"getUpdates failed: {e}")
@@ -526,6 +756,7 @@ class TelegramBotBridge:
                     "• <code>/tasks</code> — активные\n"
                     "• <code>/next7</code> — на 7 дней\n"
                     "• <code>/inbox</code> — входящие\n"
+                    "  (откроется страница, где ты остановился; <code>/tasks 1</code> — с начала)\n"
                     "• <code>/compact</code> — компактный режим\n"
                     "• <code>/expanded</code> — расширенный режим\n\n"
                     "<b>Быстрые действия</b>\n"
@@ -547,19 +778,14 @@ class TelegramBotBridge:
                 self._send_message(chat_id, f"🎛️ <b>Режим сообщений:</b> {label}\nПопробуй <code>/tasks</code> или <code>/today</code>.")
                 return
 
-            user = self._user_by_chat(chat_id)
+            user = self._user_by_chat(chat_id, verify=cmd in self.WRITE_COMMANDS)
             if not user:
                 self._send_message(chat_id, "🔗 <b>Аккаунт не подключён</b>\n\nОтправь <code>/link КОД</code> (код возьми в настройках ClockTime).")
                 return
 
-            if cmd == "/tasks":
-                return self._send_task_list_view(chat_id, user["id"], mode="tasks", page=1)
-            if cmd == "/today":
-                return self._send_task_list_view(chat_id, user["id"], mode="today", page=1)
-            if cmd == "/next7":
-                return self._send_task_list_view(chat_id, user["id"], mode="next7", page=1)
-            if cmd == "/inbox":
-                return self._send_task_list_view(chat_id, user["id"], mode="inbox", page=1)
+            if cmd in {"/tasks", "/today", "/next7", "/inbox"}:
+                mode = cmd[1:]
+                return self._send_task_list_view(chat_id, user["id"], mode=mode, page=self._list_page_arg(chat_id, mode, arg))
             if cmd == "/add":
                 title = (arg or "").strip()
                 if not title:
@@ -587,14 +813,14 @@ class TelegramBotBridge:
                 self._answer_callback(cbid)
             return
 
-        user = self._user_by_chat(chat_id)
+        parts = data.split("|")
+        act = parts[1] if len(parts) > 1 else ""
+        user = self._user_by_chat(chat_id, verify=act in self.WRITE_CALLBACKS)
         if not user:
             if cbid:
                 self._answer_callback(cbid, "Сначала привяжи аккаунт через /link", show_alert=True)
             return
 
-        parts = data.split("|")
-        act = parts[1] if len(parts) > 1 else ""
         if act == "n" and len(parts) >= 4:
             mode = parts[2]
             try:
@@ -669,6 +895,9 @@ class TelegramBotBridge:
                     telegram_link_code_created_at=None,
                 )
             )
+        self.forget_chat(chat_id)
+        self.forget_user(u["id"])
+        self._user_changed(u["id"])
         self._send_message(chat_id,\
             "✅ <b>ClockTime подключён</b>\n\n"\
             "Теперь доступны команды:\n"\
@@ -680,23 +909,27 @@ class TelegramBotBridge:
 
     def _cmd_unlink(self, chat_id: str):
         with self.engine.begin() as conn:
-            res = conn.execute(
+            unlinked = conn.execute(
                 update(self.users)
                 .where(self.users.c.telegram_chat_id == str(chat_id))
                 .values(telegram_chat_id=None, telegram_username=None, telegram_notify_enabled=False)
-            )
-        if res.rowcount:
+                .returning(self.users.c.id)
+            ).scalars().all()
+        self.forget_chat(chat_id)
+        for uid in unlinked:
+            self._user_changed(uid)
+        if unlinked:
             self._send_message(chat_id, "🔌 <b>Чат отвязан</b> от ClockTime. Уведомления больше не будут приходить.")
         else:
             self._send_message(chat_id, "ℹ️ Этот чат сейчас не привязан к аккаунту ClockTime.")
 
     def _cmd_add(self, user_id: str, chat_id: str, title: str):
-        inbox_id = self._inbox_list_id(user_id)
+        inbox_id = self._inbox_list_id(user_id, chat_id)
         if not inbox_id:
             self._send_message(chat_id, "⚠️ Не удалось найти список <b>«Входящие»</b>. Проверь системные списки в приложении.")
             return
 
-        parsed = _parse_quick_add_text(title)
+        parsed = parse_quick_add(title)
         final_title = (parsed.get("title") or "").strip() or title.strip()
         ts = self.now_ts()
         tid = self.gen_id()
@@ -717,7 +950,6 @@ class TelegramBotBridge:
             "repeat_rule": parsed.get("repeat_rule"),
             "duration_minutes": parsed.get("duration_minutes"),
             "pinned": False,
-            "order_index": ts * 1000,
             "priority": int(parsed.get("priority") or 0),
             "notes": None,
             "tags_json": json.dumps(parsed.get("tags") or [], ensure_ascii=False),
@@ -725,9 +957,17 @@ class TelegramBotBridge:
             "trashed": False,
             "trashed_at": None,
             "tg_reminder_sent_at": None,
+            "reminder_fire_at": reminder_fire_ts(parsed.get("due_date"), parsed.get("due_time"), parsed.get("reminder_minutes")),
         }
         with self.engine.begin() as conn:
+            values["order_index"] = self.task_rank_fn(conn, user_id, inbox_id) if self.task_rank_fn else ts * 1000
             conn.execute(self.tasks.insert().values(**values))
+            self._journal_tasks(conn, user_id, [tid])
+            if self.task_tags is not None and parsed.get("tags"):
+                conn.execute(self.task_tags.insert(), [{"task_id": tid, "tag": t, "user_id": user_id} for t in parsed["tags"]])
+        self._tasks_changed(user_id)
+        if values["reminder_fire_at"] is not None:
+            self.reminders_changed()
 
         extras = []
         if values.get("due_date"):
@@ -806,25 +1046,67 @@ class TelegramBotBridge:
                 .where(and_(self.tasks.c.id == r.id, self.tasks.c.user_id == user_id))
                 .values(completed=True, completed_at=ts, updated_at=ts, tg_reminder_sent_at=None)
             )
+            self._journal_tasks(conn, user_id, [r.id])
+        self._tasks_changed(user_id)
         self._send_message(chat_id, f"✅ <b>Задача выполнена</b>\n<b>{self._h(r.title)}</b>\n🆔 <code>{self._h(r.id)}</code>")
 
-    def _user_by_chat(self, chat_id: str):
+    # Linked chat -> (user id, inbox list id). Only linked chats are cached, so a fresh
+    # /link is seen at once; link/unlink here and in main.py's settings endpoints drop
+    # entries, and the TTL bounds staleness for changes made by other processes.
+    # Commands that write re-check the link first: an unlink in another worker must
+    # stop them at once, not after the TTL.
+    CHAT_CACHE_TTL = 30
+    CHAT_CACHE_SIZE = 20000
+    WRITE_COMMANDS = frozenset({"/add", "/done"})
+    WRITE_CALLBACKS = frozenset({"d", "s"})
+
+    def _user_by_chat(self, chat_id: str, *, verify: bool = False) -> Optional[dict]:
+        """{"id", "inbox_list_id"} of the user linked to a chat, or None.
+
+        With verify=True a cached entry is confirmed by a primary-key lookup.
+        """
+        key = str(chat_id)
+        hit = self._chat_cache.get(key)
+        if hit is not None and verify:
+            with self.engine.connect() as conn:
+                linked = conn.execute(select(self.users.c.telegram_chat_id).where(self.users.c.id == hit[0])).scalar()
+            if linked != key:
+                self._chat_cache.pop(key)
+                hit = None
+        if hit is None:
+            with self.engine.connect() as conn:
+                user_id = conn.execute(select(self.users.c.id).where(self.users.c.telegram_chat_id == key)).scalar()
+                if user_id is None:
+                    return None
+                hit = (user_id, self._query_inbox_list_id(conn, user_id))
+            self._chat_cache.set(key, hit)
+        return {"id": hit[0], "inbox_list_id": hit[1]}
+
+    def forget_chat(self, chat_id: str):
+        self._chat_cache.pop(str(chat_id))
+
+    def forget_user(self, user_id: str):
+        """Drop cached chat lookups of a user (its link or settings changed)."""
+        self._chat_cache.discard_where(lambda _chat, v: v[0] == user_id)
+
+    def _inbox_list_id(self, user_id: str, chat_id: Optional[str] = None) -> Optional[str]:
+        if chat_id is not None:
+            hit = self._chat_cache.get(str(chat_id))
+            if hit is not None and hit[0] == user_id:
+                return hit[1]
         with self.engine.connect() as conn:
-            return conn.execute(
-                select(self.users).where(self.users.c.telegram_chat_id == str(chat_id))
-            ).mappings().first()
+            return self._query_inbox_list_id(conn, user_id)
 
-    def _inbox_list_id(self, user_id: str) -> Optional[str]:
-        with self.engine.connect() as conn:
-            row = conn.execute(
-                select(self.lists.c.id).where(and_(self.lists.c.user_id == user_id, self.lists.c.system_key == "inbox"))
-            ).first()
-            if row:
-                return row[0]
-            row2 = conn.execute(
-                select(self.lists.c.id).where(and_(self.lists.c.user_id == user_id, self.lists.c.title == "Входящие"))
-            ).first()
-            return row2[0] if row2 else None
+    def _query_inbox_list_id(self, conn, user_id: str) -> Optional[str]:
+        row = conn.execute(
+            select(self.lists.c.id).where(and_(self.lists.c.user_id == user_id, self.lists.c.system_key == "inbox"))
+        ).first()
+        if row:
+            return row[0]
+        row2 = conn.execute(
+            select(self.lists.c.id).where(and_(self.lists.c.user_id == user_id, self.lists.c.title == "Входящие"))
+        ).first()
+        return row2[0] if row2 else None
 
 
     def _done_by_task_id(self, user_id: str, task_id: str) -> tuple[bool, str]:
@@ -846,6 +1128,8 @@ class TelegramBotBridge:
                 .where(and_(self.tasks.c.user_id == user_id, self.tasks.c.id == tid))
                 .values(completed=True, completed_at=ts, updated_at=ts, tg_reminder_sent_at=None)
             )
+            self._journal_tasks(conn, user_id, [tid])
+        self._tasks_changed(user_id)
         return True, "✅ Выполнено"
 
     def _set_task_due_date(self, user_id: str, task_id: str, due_date: str) -> tuple[bool, str]:
@@ -855,30 +1139,65 @@ class TelegramBotBridge:
         ts = self.now_ts()
         with self.engine.begin() as conn:
             row = conn.execute(
-                select(self.tasks.c.id, self.tasks.c.completed, self.tasks.c.trashed)
+                select(self.tasks.c.id, self.tasks.c.completed, self.tasks.c.trashed, self.tasks.c.due_time, self.tasks.c.reminder_minutes)
                 .where(and_(self.tasks.c.user_id == user_id, self.tasks.c.id == tid))
             ).first()
             if not row or bool(row.trashed):
                 return False, "Задача не найдена"
             if bool(row.completed):
                 return False, "Задача уже выполнена"
+            fire_at = reminder_fire_ts(due_date, row.due_time, row.reminder_minutes)
             conn.execute(
                 update(self.tasks)
                 .where(and_(self.tasks.c.user_id == user_id, self.tasks.c.id == tid))
-                .values(due_date=due_date, updated_at=ts)
+                .values(due_date=due_date, updated_at=ts, reminder_fire_at=fire_at, tg_reminder_sent_at=None)
             )
+            self._journal_tasks(conn, user_id, [tid])
+        self._tasks_changed(user_id)
+        if fire_at is not None:
+            self.reminders_changed()
         return True, "Дата обновлена"
 
     def _send_task_list_view(self, chat_id: str, user_id: str, mode: str = "tasks", page: int = 1, edit_message_id: Optional[int] = None):
         payload = self._task_list_payload(chat_id, user_id, mode=mode, page=page)
+        if self.chat_state is not None:
+            # no-op (no write) unless the chat moved to another list or page
+            self.chat_state.update(chat_id, last_mode=mode, last_page=payload["page"])
         if edit_message_id:
             ok = self._edit_message(chat_id, int(edit_message_id), payload["text"], reply_markup=payload.get("reply_markup"))
             if ok:
                 return True
         return self._send_message(chat_id, payload["text"], reply_markup=payload.get("reply_markup"))
 
+    # Rendered /tasks pages per (chat, user, mode, page, view mode, day), valid while the
+    # user's data version (bumped by every task write, from any process) is unchanged.
+    PAGE_CACHE_TTL = 60
+    PAGE_CACHE_SIZE = 5000
+
+    def _tasks_version(self, conn, user_id: str) -> Optional[int]:
+        if self.sync_versions is None:
+            return None
+        v = conn.execute(select(self.sync_versions.c.version).where(self.sync_versions.c.user_id == user_id)).scalar()
+        return int(v or 0)
+
     def _task_list_payload(self, chat_id: str, user_id: str, mode: str = "tasks", page: int = 1) -> dict:
         today = date.today()
+        view_mode = self._get_view_mode(chat_id)
+        per_page = 12 if view_mode == "compact" else 6
+        page = max(1, int(page or 1))
+        cache_key = (str(chat_id), user_id, mode, page, view_mode, today.isoformat())
+
+        with self.engine.connect() as conn:
+            version = self._tasks_version(conn, user_id)
+        cached = self._page_cache.get(cache_key)
+        if cached is not None and version is not None and cached[0] == version:
+            return cached[1]
+        payload = self._render_task_list(chat_id, user_id, mode, page, view_mode, per_page, today)
+        if version is not None:
+            self._page_cache.set(cache_key, (version, payload))
+        return payload
+
+    def _render_task_list(self, chat_id: str, user_id: str, mode: str, page: int, view_mode: str, per_page: int, today: date) -> dict:
         conds = [self.tasks.c.user_id == user_id, self.tasks.c.completed.is_(False), self.tasks.c.trashed.is_(False)]
         header = "Активные задачи"; header_icon = "📋"
         if mode == "today":
@@ -893,7 +1212,7 @@ class TelegramBotBridge:
             conds.append(self.tasks.c.due_date <= (today + timedelta(days=6)).isoformat())
             header = "Следующие 7 дней"; header_icon = "🗓️"
         elif mode == "inbox":
-            inbox_id = self._inbox_list_id(user_id)
+            inbox_id = self._inbox_list_id(user_id, chat_id)
             if inbox_id:
                 conds.append(self.tasks.c.list_id == inbox_id)
             header = "Входящие"; header_icon = "📥"
@@ -901,55 +1220,46 @@ class TelegramBotBridge:
         pin_first = case((self.tasks.c.pinned.is_(True), 0), else_=1)
         nulls_date = case((self.tasks.c.due_date.is_(None), 1), else_=0)
         nulls_time = case((self.tasks.c.due_time.is_(None), 1), else_=0)
-
-        view_mode = self._get_view_mode(chat_id)
-        per_page = 12 if view_mode == "compact" else 6
-        page = max(1, int(page or 1))
+        # One query per page; the total rides along as an uncorrelated scalar subquery
+        # (evaluated once). COUNT(*) OVER () would do too, but it makes the database
+        # materialize every match and drops the top-N sort: twice as slow on SQLite.
+        total_count = select(func.count()).select_from(self.tasks).where(and_(*conds)).scalar_subquery()
+        page_query = (
+            select(
+                self.tasks.c.id,
+                self.tasks.c.title,
+                self.tasks.c.due_date,
+                self.tasks.c.due_time,
+                self.tasks.c.priority,
+                self.tasks.c.pinned,
+                self.tasks.c.duration_minutes,
+                total_count.label("total"),
+            )
+            .where(and_(*conds))
+            .order_by(pin_first.asc(), nulls_date.asc(), self.tasks.c.due_date.asc(), nulls_time.asc(), self.tasks.c.due_time.asc(), self.tasks.c.created_at.desc())
+            .limit(per_page)
+        )
         offset = (page - 1) * per_page
 
         with self.engine.connect() as conn:
-            total = int(conn.execute(select(self.tasks.c.id).where(and_(*conds))).fetchall().__len__())
-            rows = conn.execute(
-                select(
-                    self.tasks.c.id,
-                    self.tasks.c.title,
-                    self.tasks.c.due_date,
-                    self.tasks.c.due_time,
-                    self.tasks.c.priority,
-                    self.tasks.c.pinned,
-                    self.tasks.c.duration_minutes,
-                )
-                .where(and_(*conds))
-                .order_by(pin_first.asc(), nulls_date.asc(), self.tasks.c.due_date.asc(), nulls_time.asc(), self.tasks.c.due_time.asc(), self.tasks.c.created_at.desc())
-                .limit(per_page)
-                .offset(offset)
-            ).all()
+            rows = conn.execute(page_query.offset(offset)).all()
+            if rows:
+                total = int(rows[0].total)
+            else:
+                # Empty page: either no tasks at all or the page is past the end
+                # (tasks got completed since the keyboard was sent); clamp to the last one.
+                total = int(conn.execute(select(func.count()).select_from(self.tasks).where(and_(*conds))).scalar() or 0)
+                if total and page > 1:
+                    page = (total + per_page - 1) // per_page
+                    offset = (page - 1) * per_page
+                    rows = conn.execute(page_query.offset(offset)).all()
 
         total_pages = max(1, (total + per_page - 1) // per_page)
-        if page > total_pages:
-            page = total_pages
-            offset = (page - 1) * per_page
-            with self.engine.connect() as conn:
-                rows = conn.execute(
-                    select(
-                        self.tasks.c.id,
-                        self.tasks.c.title,
-                        self.tasks.c.due_date,
-                        self.tasks.c.due_time,
-                        self.tasks.c.priority,
-                        self.tasks.c.pinned,
-                        self.tasks.c.duration_minutes,
-                    )
-                    .where(and_(*conds))
-                    .order_by(pin_first.asc(), nulls_date.asc(), self.tasks.c.due_date.asc(), nulls_time.asc(), self.tasks.c.due_time.asc(), self.tasks.c.created_at.desc())
-                    .limit(per_page)
-                    .offset(offset)
-                ).all()
 
         if not rows:
             text = f"{header_icon} <b>{self._h(header)}</b>\n\nПока пусто ✨"
             kb = self._list_keyboard(mode, 1, 1, 0, view_mode, [])
-            return {"text": text, "reply_markup": kb}
+            return {"text": text, "reply_markup": kb, "page": 1}
 
         lines = [f"{header_icon} <b>{self._h(header)}</b> <i>({total})</i>", f"<i>Режим:</i> {'Компактный' if view_mode == 'compact' else 'Расширенный'} • <i>Стр.</i> {page}/{total_pages}", ""]
         for idx, r in enumerate(rows, start=1+offset):
@@ -963,7 +1273,7 @@ class TelegramBotBridge:
         lines.append("💡 <i>Можно нажать кнопки ниже или использовать</i> <code>/done ID_ПРЕФИКС</code>")
 
         kb = self._list_keyboard(mode, page, total_pages, total, view_mode, rows)
-        return {"text": "\n".join(lines).strip(), "reply_markup": kb}
+        return {"text": "\n".join(lines).strip(), "reply_markup": kb, "page": page}
 
     def _list_keyboard(self, mode: str, page: int, total_pages: int, total: int, view_mode: str, rows) -> dict:
         rows_kb: list[list[dict]] = []
@@ -1059,75 +1369,120 @@ class TelegramBotBridge:
 
     # ---------- reminders ----------
 
-    def _reminder_loop(self):
+    # Reminders whose fire time passed more than this many seconds ago are skipped.
+    REMINDER_GRACE_SECONDS = 90
+    # The scheduler keeps reminders due within this window in memory and reloads
+    # it at least every REMINDER_REFRESH_SECONDS (picks up writes from other workers).
+    REMINDER_HORIZON_SECONDS = 3600
+    REMINDER_REFRESH_SECONDS = 60
+    REMINDER_BATCH = 1000
+
+    def _reminder_loop(self, stop: threading.Event):
+        """Sleep until the next reminder_fire_at, send what is due, repeat.
+
+        Upcoming fire times live in a min-heap loaded from the indexed
+        reminder_fire_at column; reminders_changed() (task writes) or the
+        refresh interval reload it.
+        """
         # small delay on startup to let app finish init
-        time.sleep(2)
-        while not self._stop.is_set():
+        if stop.wait(2):
+            return
+        heap: list[tuple[int, str]] = []
+        reload_at = 0.0
+        while not stop.is_set():
             try:
-                self._send_due_reminders_once()
+                if self._reminders_wake.is_set() or time.monotonic() >= reload_at:
+                    self._reminders_wake.clear()
+                    heap = self._load_upcoming_reminders()
+                    reload_at = time.monotonic() + self.REMINDER_REFRESH_SECONDS
+                now = self.now_ts()
+                due = []
+                while heap and heap[0][0] <= now:
+                    due.append(heapq.heappop(heap))
+                if due:
+                    self._send_reminders(due, now)
+                    if len(due) >= self.REMINDER_BATCH:
+                        reload_at = 0.0  # window was full; fetch the next batch right away
+                        continue
             except Exception as e:
                 self.last_error = str(e)
                 self._log(f"reminder loop error: {e}")
-            # responsive sleep
-            for _ in range(20):
-                if self._stop.is_set():
-                    return
-                time.sleep(1)
+                heap, reload_at = [], time.monotonic() + 5
+            wait = reload_at - time.monotonic()
+            if heap:
+                wait = min(wait, heap[0][0] - time.time())
+            self._reminders_wake.wait(max(0.0, wait))
+
+    def _pending_reminders_query(self, now: int):
+        return (
+            select(
+                self.tasks.c.id,
+                self.tasks.c.user_id,
+                self.tasks.c.title,
+                self.tasks.c.due_date,
+                self.tasks.c.due_time,
+                self.tasks.c.reminder_fire_at,
+                self.users.c.telegram_chat_id,
+            )
+            .select_from(self.tasks.join(self.users, self.users.c.id == self.tasks.c.user_id))
+            .where(
+                and_(
+                    self.tasks.c.reminder_fire_at >= now - self.REMINDER_GRACE_SECONDS,
+                    self.tasks.c.tg_reminder_sent_at.is_(None),
+                    self.tasks.c.completed.is_(False),
+                    self.tasks.c.trashed.is_(False),
+                    self.users.c.telegram_chat_id.is_not(None),
+                    or_(self.users.c.telegram_notify_enabled.is_(True), self.users.c.telegram_notify_enabled.is_(None)),
+                )
+            )
+            .order_by(self.tasks.c.reminder_fire_at.asc())
+        )
 
-    def _send_due_reminders_once(self):
+    def _load_upcoming_reminders(self) -> list[tuple[int, str]]:
         now = self.now_ts()
-        # Look a bit around current time to be tolerant to loop delays.
+        stmt = (
+            self._pending_reminders_query(now)
+            .with_only_columns(self.tasks.c.reminder_fire_at, self.tasks.c.id)
+            .where(self.tasks.c.reminder_fire_at <= now + self.REMINDER_HORIZON_SECONDS)
+            .limit(self.REMINDER_BATCH)
+        )
+        with self.engine.connect() as conn:
+            heap = [(int(fire_at), tid) for fire_at, tid in conn.execute(stmt).all()]
+        heapq.heapify(heap)
+        return heap
+
+    def _send_reminders(self, due: list[tuple[int, str]], now: int):
+        """Re-check and deliver reminders popped from the heap (fire_at, task_id)."""
+        expected = {tid: fire_at for fire_at, tid in due}
         with self.engine.connect() as conn:
             rows = conn.execute(
-                select(
-                    self.tasks.c.id,
-                    self.tasks.c.user_id,
-                    self.tasks.c.title,
-                    self.tasks.c.due_date,
-                    self.tasks.c.due_time,
-                    self.tasks.c.reminder_minutes,
-                    self.tasks.c.tg_reminder_sent_at,
-                    self.users.c.telegram_chat_id,
-                    self.users.c.telegram_notify_enabled,
-                )
-                .select_from(self.tasks.join(self.users, self.users.c.id == self.tasks.c.user_id))
-                .where(
-                    and_(
-                        self.tasks.c.completed.is_(False),
-                        self.tasks.c.trashed.is_(False),
-                        self.tasks.c.due_date.is_not(None),
-                        self.tasks.c.reminder_minutes.is_not(None),
-                        self.tasks.c.tg_reminder_sent_at.is_(None),
-                        self.users.c.telegram_chat_id.is_not(None),
-                        or_(self.users.c.telegram_notify_enabled.is_(True), self.users.c.telegram_notify_enabled.is_(None)),
-                    )
-                )
-                .limit(300)
+                self._pending_reminders_query(now).where(self.tasks.c.id.in_(list(expected)))
             ).mappings().all()
 
+        # Skip tasks rescheduled since the heap was loaded (they are in the next load).
+        rows = [r for r in rows if r["reminder_fire_at"] == expected.get(r["id"]) and r["reminder_fire_at"] <= now]
+        if not rows:
+            return
+
+        # reserve all of them in one statement (avoids duplicate sends if multiple loops/workers race)
+        with self.engine.begin() as conn:
+            reserved = set(conn.execute(
+                update(self.tasks)
+                .where(and_(self.tasks.c.id.in_([r["id"] for r in rows]), self.tasks.c.tg_reminder_sent_at.is_(None)))
+                .values(tg_reminder_sent_at=now, updated_at=now)
+                .returning(self.tasks.c.id)
+            ).scalars().all())
+            by_user: dict[str, list[str]] = {}
+            for r in rows:
+                if r["id"] in reserved:
+                    by_user.setdefault(r["user_id"], []).append(r["id"])
+            for user_id, ids in by_user.items():
+                self._journal_tasks(conn, user_id, ids)
+
+        rejected = []
         for r in rows:
-            due_ts = self._task_due_ts(r.get("due_date"), r.get("due_time"))
-            if due_ts is None:
-                continue
-            rm = int(r.get("reminder_minutes") or 0)
-            fire_at = due_ts - rm * 60
-            # Trigger within [fire_at, fire_at+90s], and only if task not too stale.
-            if now < fire_at or now > fire_at + 90:
+            if r["id"] not in reserved:
                 continue
-
-            # reserve (avoid duplicate sends if multiple loops/workers race)
-            with self.engine.begin() as conn:
-                upd = conn.execute(
-                    update(self.tasks)
-                    .where(and_(self.tasks.c.id == r["id"], self.tasks.c.tg_reminder_sent_at.is_(None)))
-                    .values(tg_reminder_sent_at=now, updated_at=now)
-                )
-                if not upd.rowcount:
-                    continue
-
-            due_text = str(r["due_date"])
-            if r.get("due_time"):
-                due_text += f" {r['due_time']}"
             txt = (
                 "🔔 <b>Напоминание ClockTime</b>\n"
                 f"<b>{self._h(r['title'])}</b>\n"
@@ -1135,19 +1490,41 @@ class TelegramBotBridge:
                 f"🆔 <code>{self._h(r['id'])}</code>\n\n"
                 "✅ <i>Завершить:</i> <code>/done ID_ПРЕФИКС</code>"
             )
-            self._send_message(str(r["telegram_chat_id"]), txt, reply_markup=self._kb([[{"text":"✅ Выполнить","callback_data":f"ct|d|{r['id']}"},{"text":"📅 Сегодня","callback_data":f"ct|s|{r['id']}|t0"},{"text":"⏭ Завтра","callback_data":f"ct|s|{r['id']}|t1"}]]))
-
-    def _task_due_ts(self, due_date: Optional[str], due_time: Optional[str]) -> Optional[int]:
-        if not due_date:
-            return None
+            on_done = functools.partial(self._reminder_done, r["user_id"], r["id"], now)
+            if not self._queue_message(str(r["telegram_chat_id"]), txt, reply_markup=self._kb([[{"text":"✅ Выполнить","callback_data":f"ct|d|{r['id']}"},{"text":"📅 Сегодня","callback_data":f"ct|s|{r['id']}|t0"},{"text":"⏭ Завтра","callback_data":f"ct|s|{r['id']}|t1"}]]), on_done=on_done):
+                rejected.append(r["id"])
+
+        if rejected:
+            # Queue is full: release the reservation so a later pass (within the grace window) retries.
+            self._log(f"delivery queue full, postponing {len(rejected)} reminders")
+            self._release_reminders(rejected, now)
+
+    def _reminder_done(self, user_id: str, task_id: str, reserved_at: int, ok: bool, error: Optional[Exception]):
+        """Delivery callback: a reminder that could not be sent gives its reservation back."""
+        if ok:
+            return
+        if isinstance(error, TelegramApiError) and not error.retryable:
+            # Bot blocked, chat gone, bad markup: resending would fail the same way.
+            return
         try:
-            if due_time:
-                dt = datetime.strptime(f"{due_date} {due_time}", "%Y-%m-%d %H:%M")
-            else:
-                # no task timezone in app yet -> use a conventional morning reminder time (09:00 server local/UTC naive)
-                dt = datetime.strptime(f"{due_date} 09:00", "%Y-%m-%d %H:%M")
-            # treat as UTC to keep behaviour deterministic across Railway restarts/regions
-            dt = dt.replace(tzinfo=timezone.utc)
-            return int(dt.timestamp())
-        except Exception:
-            return None
+            with self.engine.begin() as conn:
+                released = self._release_reminders([task_id], reserved_at, conn=conn)
+                if released:
+                    self._journal_tasks(conn, user_id, [task_id])
+        except Exception as e:
+            self._log(f"releasing reminder {task_id} failed: {e}")
+            return
+        if released:
+            self.reminders_changed()
+
+    def _release_reminders(self, task_ids: list[str], reserved_at: int, *, conn=None) -> int:
+        """Clear tg_reminder_sent_at for reservations made at `reserved_at` (not re-reserved since)."""
+        stmt = (
+            update(self.tasks)
+            .where(and_(self.tasks.c.id.in_(task_ids), self.tasks.c.tg_reminder_sent_at == reserved_at))
+            .values(tg_reminder_sent_at=None)
+        )
+        if conn is not None:
+            return conn.execute(stmt).rowcount
+        with self.engine.begin() as c:
+            return c.execute(stmt).rowcount
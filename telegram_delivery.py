@@ -0,0 +1,312 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+
+class TelegramApiError(RuntimeError):
+    """Bot API call failed; carries Telegram's error_code and retry_after (seconds) when given."""
+
+    def __init__(self, description: str, error_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(description)
+        self.error_code = error_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        # 429 flood control and server-side errors are worth retrying; other 4xx
+        # (bot blocked, chat not found, bad markup) will fail the same way again.
+        return self.error_code is None or self.error_code == 429 or self.error_code >= 500
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take one token; returns how long the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1.0
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def pause(self, seconds: float) -> None:
+        """Drain the bucket so nobody gets a token for `seconds` (used on a global 429)."""
+        with self._lock:
+            self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+            self._updated = time.monotonic()
+
+
+@dataclass(order=True)
+class _Job:
+    ready_at: float
+    seq: int
+    chat_id: str = field(compare=False)
+    payload: dict = field(compare=False)
+    on_done: Optional[Callable[[bool, Optional[Exception]], None]] = field(compare=False, default=None)
+    attempts: int = field(compare=False, default=0)
+    chat_was_idle: bool = field(compare=False, default=True)
+    urgent: bool = field(compare=False, default=False)
+    chat_slot: bool = field(compare=False, default=False)
+
+
+class DeliveryQueue:
+    """Bounded worker pool that delivers Bot API messages under Telegram's rate limits.
+
+    - global limit: `global_rate` messages/second across the bot (Telegram: ~30/s)
+    - per-chat limit: one message every `chat_interval` seconds (Telegram: ~1/s),
+      `group_interval` for groups and channels (negative chat ids; ~20/min)
+    - a 429 postpones that chat by retry_after; if the chat had been idle the
+      flood limit must be the bot-wide one, so all sending pauses. 429s, 5xx and
+      errors that say they are `retryable` (a request that never left, see
+      telegram_http.RequestNotSent) are retried, the latter two with exponential
+      backoff, up to `max_attempts` in total. Anything else, like a read timeout
+      after the request went out, is final: a resend could show the message twice
+    A chat that is not ready yet never blocks a worker: its job is re-queued for
+    the chat's next slot and the worker moves on to other chats. Urgent jobs
+    (replies to users) are taken before any ready background job (reminders).
+    on_done(ok, error) runs once per accepted job, also for jobs still queued at stop().
+
+    These limits are per process. With several processes sending (webhook mode
+    behind more than one worker) pass a `shared_limiter` (db_rate_limit.DbRateLimiter):
+    every send then also takes its chat's and the bot's slot from the shared
+    table, and 429 pauses are written there. If the table can't be reached the
+    queue falls back to its local limits.
+    """
+
+    def __init__(
+        self,
+        send_fn: Callable[[dict], object],
+        *,
+        workers: int = 8,
+        global_rate: float = 30.0,
+        chat_interval: float = 1.0,
+        group_interval: float = 3.0,
+        max_queue: int = 10000,
+        max_attempts: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        shared_limiter=None,
+        logger: Optional[Callable[[str], None]] = None,
+    ):
+        self.send_fn = send_fn
+        self.shared_limiter = shared_limiter
+        self.workers = max(1, int(workers))
+        # capacity 1: spread sends evenly instead of bursting a second's worth at once
+        self.global_bucket = TokenBucket(global_rate, capacity=1)
+        self.chat_interval = float(chat_interval)
+        self.group_interval = float(group_interval)
+        self.max_queue = max(1, int(max_queue))
+        self.max_attempts = max(1, int(max_attempts))
+        self.backoff_base = float(backoff_base)
+        self.backoff_max = float(backoff_max)
+        self.log = logger or (lambda _m: None)
+
+        self._heap: list[_Job] = []
+        self._urgent: list[_Job] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._chat_next: dict[str, float] = {}
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._in_flight = 0
+        self.stats = {"queued": 0, "sent": 0, "failed": 0, "retried": 0, "rateLimited": 0, "dropped": 0, "sharedErrors": 0}
+
+    # ---------- lifecycle ----------
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"ct-telegram-send-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout=timeout)
+        self._threads = []
+        with self._cond:
+            left, self._heap, self._urgent = self._heap + self._urgent, [], []
+        for job in left:
+            self._finish(job, False)
+
+    # ---------- API ----------
+    def submit(
+        self,
+        chat_id: str,
+        payload: dict,
+        on_done: Optional[Callable[[bool, Optional[Exception]], None]] = None,
+        *,
+        urgent: bool = False,
+    ) -> bool:
+        """Queue a sendMessage payload; False (and on_done is not called) when the queue is full."""
+        with self._cond:
+            if len(self._heap) + len(self._urgent) >= self.max_queue:
+                self.stats["dropped"] += 1
+                return False
+            job = _Job(time.monotonic(), next(self._seq), str(chat_id), payload, on_done, urgent=urgent)
+            heapq.heappush(self._urgent if urgent else self._heap, job)
+            self.stats["queued"] += 1
+            self._cond.notify()
+        return True
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._heap) + len(self._urgent) + self._in_flight
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the queue is empty and nothing is in flight (tests and benchmarks)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            snap = {**self.stats, "pending": len(self._heap) + len(self._urgent), "inFlight": self._in_flight, "workers": self.workers}
+        if self.shared_limiter is not None:
+            snap["shared"] = self.shared_limiter.snapshot()
+        return snap
+
+    # ---------- internals ----------
+    def _interval(self, chat_id: str) -> float:
+        return self.group_interval if chat_id.startswith("-") else self.chat_interval
+
+    def _next_job(self) -> Optional[_Job]:
+        with self._cond:
+            while not self._stop.is_set():
+                now = time.monotonic()
+                heap = next((h for h in (self._urgent, self._heap) if h and h[0].ready_at <= now), None)
+                if heap is not None:
+                    job = heapq.heappop(heap)
+                    chat_at = self._chat_next.get(job.chat_id, 0.0)
+                    if chat_at > now:
+                        job.ready_at = chat_at
+                        heapq.heappush(heap, job)
+                        continue
+                    interval = self._interval(job.chat_id)
+                    job.chat_was_idle = chat_at <= now - interval
+                    self._chat_next[job.chat_id] = now + interval
+                    if len(self._chat_next) > 4 * self.max_queue:
+                        self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+                    self._in_flight += 1
+                    return job
+                tops = [h[0].ready_at for h in (self._urgent, self._heap) if h]
+                self._cond.wait((min(tops) - now) if tops else None)
+        return None
+
+    def _requeue(self, job: _Job, delay: float, *, retry: bool = True) -> None:
+        job.ready_at = time.monotonic() + delay
+        if retry:
+            job.chat_slot = False  # a resend needs a new slot
+        with self._cond:
+            heapq.heappush(self._urgent if job.urgent else self._heap, job)
+            if retry:
+                self.stats["retried"] += 1
+            self._cond.notify()
+
+    def _shared(self, call, *args) -> Optional[float]:
+        """Run a shared limiter call; None (use local limits) when there is none or it failed."""
+        if self.shared_limiter is None:
+            return None
+        try:
+            return call(*args) or 0.0
+        except Exception as e:
+            with self._cond:
+                self.stats["sharedErrors"] += 1
+            self.log(f"shared rate limit unavailable, using local limits: {e}")
+            return None
+
+    def _global_wait(self, job: _Job) -> Optional[float]:
+        """Seconds until `job` may be sent, or None if it was re-queued for its chat's shared slot."""
+        if self.shared_limiter is None:
+            return self.global_bucket.reserve()
+        if not job.chat_slot:
+            job.chat_slot = True
+            delay = self._shared(self.shared_limiter.reserve, f"chat:{job.chat_id}", self._interval(job.chat_id))
+            if delay:
+                self._requeue(job, delay, retry=False)
+                return None
+        wait = self._shared(self.shared_limiter.reserve, "global", 1.0 / self.global_bucket.rate)
+        if wait is None:
+            return self.global_bucket.reserve()
+        if wait > 0:
+            # sending later than the chat slot taken above: keep the chat's next message an interval behind
+            self._shared(self.shared_limiter.hold, f"chat:{job.chat_id}", wait + self._interval(job.chat_id))
+        return wait
+
+    def _finish(self, job: _Job, ok: bool, error: Optional[Exception] = None) -> None:
+        with self._cond:
+            self.stats["sent" if ok else "failed"] += 1
+        if job.on_done is not None:
+            try:
+                job.on_done(ok, error)
+            except Exception as e:
+                self.log(f"delivery callback failed: {e}")
+
+    def _worker(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                wait = self._global_wait(job)
+                if wait is None:
+                    continue
+                if wait > 0:
+                    time.sleep(wait)
+                job.attempts += 1
+                try:
+                    self.send_fn(job.payload)
+                    self._finish(job, True)
+                except TelegramApiError as e:
+                    if e.error_code == 429 and job.attempts < self.max_attempts:
+                        with self._cond:
+                            self.stats["rateLimited"] += 1
+                        retry_after = float(e.retry_after or 1.0)
+                        if job.chat_was_idle:
+                            self.global_bucket.pause(retry_after)
+                            self._shared(getattr(self.shared_limiter, "hold", None), "global", retry_after)
+                        self._shared(getattr(self.shared_limiter, "hold", None), f"chat:{job.chat_id}", retry_after)
+                        with self._cond:
+                            until = time.monotonic() + retry_after
+                            self._chat_next[job.chat_id] = max(self._chat_next.get(job.chat_id, 0.0), until)
+                        self._requeue(job, retry_after)
+                    elif e.retryable and job.attempts < self.max_attempts:
+                        self._requeue(job, self._backoff(job.attempts))
+                    else:
+                        self.log(f"sendMessage to {job.chat_id} failed after {job.attempts} attempts: {e}")
+                        self._finish(job, False, e)
+                except Exception as e:
+                    if getattr(e, "retryable", False) and job.attempts < self.max_attempts:
+                        self._requeue(job, self._backoff(job.attempts))
+                    else:
+                        # e.g. a read timeout: Telegram may already have shown the message, don't send it twice
+                        self.log(f"sendMessage to {job.chat_id} failed after {job.attempts} attempts, not retrying: {e}")
+                        self._finish(job, False, e)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.5, 1.0)
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import http.client
+import queue
+import select
+import ssl
+import threading
+import urllib.parse
+import urllib.request
+from typing import Optional
+
+# Errors that mean a reused keep-alive connection was already closed by the
+# server. Raised while writing the request, the server can't have acted on it
+# and it's safe to resend on a new connection. Raised while waiting for the
+# response, the request may already have been processed, so only idempotent
+# calls are resent.
+_STALE_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine, BrokenPipeError, ConnectionResetError, ConnectionAbortedError)
+
+
+class RequestNotSent(ConnectionError):
+    """The request never fully left this process (connect failed or the write did), so resending can't duplicate it."""
+
+    retryable = True
+
+
+class KeepAliveClient:
+    """Minimal thread-safe HTTP/1.1 client that reuses connections to one origin.
+
+    Up to `pool_size` idle connections are kept; callers beyond that get a new
+    connection that is closed after use, so nobody waits on the pool. Idle
+    connections the server has already closed are discarded before reuse.
+    `connect_timeout` bounds TCP+TLS setup, the per-request `timeout` bounds
+    each read. Honours HTTPS_PROXY/HTTP_PROXY (via CONNECT) like urllib does.
+    """
+
+    def __init__(self, base_url: str, *, pool_size: int = 16, connect_timeout: float = 10.0, ssl_context: Optional[ssl.SSLContext] = None):
+        u = urllib.parse.urlsplit(base_url)
+        if u.scheme not in ("http", "https") or not u.hostname:
+            raise ValueError(f"unsupported base URL: {base_url!r}")
+        self.scheme = u.scheme
+        self.host = u.hostname
+        self.port = u.port or (443 if u.scheme == "https" else 80)
+        self.base_path = u.path.rstrip("/")
+        self.pool_size = max(0, int(pool_size))
+        self.connect_timeout = float(connect_timeout)
+        self.ssl_context = ssl_context if ssl_context is not None else (ssl.create_default_context() if u.scheme == "https" else None)
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.stats = {"connects": 0, "reused": 0, "dropped": 0, "staleRetries": 0}
+
+        self._proxy = None
+        proxy = urllib.request.getproxies().get(u.scheme)
+        if proxy and not urllib.request.proxy_bypass(self.host):
+            p = urllib.parse.urlsplit(proxy if "://" in proxy else f"http://{proxy}")
+            self._proxy = (p.hostname, p.port or 80)
+
+    def _new_conn(self) -> http.client.HTTPConnection:
+        host, port = self._proxy or (self.host, self.port)
+        if self.scheme == "https":
+            conn = http.client.HTTPSConnection(host, port, timeout=self.connect_timeout, context=self.ssl_context)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=self.connect_timeout)
+        if self._proxy:
+            conn.set_tunnel(self.host, self.port)
+        conn.connect()
+        with self._lock:
+            self.stats["connects"] += 1
+        return conn
+
+    @staticmethod
+    def _dropped(conn: http.client.HTTPConnection) -> bool:
+        """An idle connection is readable only if the server closed it (or sent junk)."""
+        if conn.sock is None:
+            return True
+        try:
+            return bool(select.select([conn.sock], [], [], 0)[0])
+        except (OSError, ValueError):
+            return True
+
+    def _get_conn(self) -> tuple[http.client.HTTPConnection, bool]:
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return self._new_conn(), False
+            if self._dropped(conn):
+                conn.close()
+                with self._lock:
+                    self.stats["dropped"] += 1
+                continue
+            with self._lock:
+                self.stats["reused"] += 1
+            return conn, True
+
+    def _put_conn(self, conn: http.client.HTTPConnection) -> None:
+        if self._idle.qsize() < self.pool_size:
+            self._idle.put(conn)
+        else:
+            conn.close()
+
+    def post(self, path: str, body: bytes, *, headers: Optional[dict] = None, timeout: float = 30.0, idempotent: bool = False) -> tuple[int, bytes]:
+        """POST `body` to base_path + `path`; returns (status, response body).
+
+        A stale reused connection is retried on a fresh one when it failed
+        before the request was sent, or at any point when `idempotent` is set.
+        Other failures before the request was written raise RequestNotSent;
+        anything raised after it (a read timeout, a reset) means the server
+        may have acted on it.
+        """
+        hdrs = {"Content-Type": "application/json", "Connection": "keep-alive", **(headers or {})}
+        url = self.base_path + path
+        while True:
+            try:
+                conn, reused = self._get_conn()
+            except OSError as e:
+                raise RequestNotSent(f"connect failed: {e}") from e
+            sent = False
+            try:
+                conn.sock.settimeout(timeout)
+                conn.request("POST", url, body=body, headers=hdrs)
+                sent = True
+                resp = conn.getresponse()
+                data = resp.read()
+            except _STALE_ERRORS as e:
+                conn.close()
+                if not reused or (sent and not idempotent):
+                    if not sent:
+                        raise RequestNotSent(f"send failed: {e}") from e
+                    raise
+                with self._lock:
+                    self.stats["staleRetries"] += 1
+                continue
+            except OSError as e:
+                conn.close()
+                if not sent:
+                    raise RequestNotSent(f"send failed: {e}") from e
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self._put_conn(conn)
+            return resp.status, data
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "idle": self._idle.qsize(), "poolSize": self.pool_size}
@@ -0,0 +1,191 @@
+"""Backend checks against a fresh SQLite database (no Telegram token, guest workspace).
+
+    python -m pytest -q tests
+"""
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+_DB_DIR = tempfile.mkdtemp(prefix="ct-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'tasks.db')}"
+for _var in ("TELEGRAM_BOT_TOKEN", "CLOCKTIME_TELEGRAM_BOT_TOKEN", "TELEGRAM_WEBHOOK_URL", "DB_ASYNC"):
+    os.environ.pop(_var, None)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import main  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(main.app)
+
+
+# ---------- boot / default lists ----------
+def test_fresh_db_guest_gets_system_lists(client):
+    rows = client.get("/api/lists").json()
+    assert [r["systemKey"] for r in rows] == ["inbox", "welcome", "work", "personal"]
+    assert [r["sortOrder"] for r in rows] == [main.RANK_STEP * k for k in (1, 2, 3, 4)]
+
+
+# ---------- migrations ----------
+def test_fresh_db_reaches_latest_schema_version():
+    with main.engine.connect() as conn:
+        assert main.current_schema_version(conn) == main.MIGRATIONS[-1][0]
+
+
+def test_failed_migration_step_is_not_recorded(monkeypatch):
+    latest = main.MIGRATIONS[-1][0]
+
+    def broken():
+        raise RuntimeError("step failed")
+
+    monkeypatch.setattr(main, "MIGRATIONS", main.MIGRATIONS + [(latest + 1, "broken step", broken)])
+    with pytest.raises(RuntimeError):
+        main.apply_migrations()
+    with main.engine.connect() as conn:
+        assert main.current_schema_version(conn) == latest
+
+
+# ---------- rank keys ----------
+def _sort_orders(user_id: str) -> dict:
+    with main.engine.connect() as conn:
+        return dict(conn.execute(select(main.lists.c.id, main.lists.c.sort_order).where(main.lists.c.user_id == user_id)).all())
+
+
+def test_move_between_neighbours_writes_only_the_moved_row(client):
+    a, b, c = (client.post("/api/lists", json={"title": t}).json()["id"] for t in ("A", "B", "C"))
+    before = _sort_orders(main.PUBLIC_UID)
+    assert before[a] < before[b] < before[c]
+
+    res = client.post(f"/api/lists/{c}/move", json={"afterId": a, "beforeId": b})
+    assert res.status_code == 200
+
+    after = _sort_orders(main.PUBLIC_UID)
+    assert {k for k in after if after[k] != before[k]} == {c}
+    assert before[a] < after[c] < before[b]
+
+
+# ---------- Telegram test message ----------
+@pytest.fixture
+def linked_client(monkeypatch):
+    """A registered user whose account is linked to chat 555, with the delivery queue running."""
+    c = TestClient(main.app)
+    res = c.post("/api/auth/register", json={"email": f"tg-{os.urandom(3).hex()}@example.org", "password": "secret1"})
+    c.cookies.set(main.AUTH_COOKIE, res.json()["token"])
+    with main.engine.begin() as conn:
+        conn.execute(main.users.update().where(main.users.c.id == res.json()["user"]["id"]).values(telegram_chat_id="555"))
+    bridge = main.tg_bridge
+    monkeypatch.setattr(bridge, "is_configured", lambda: True)
+    monkeypatch.setattr(bridge.delivery, "chat_interval", 0.0)
+    bridge.delivery.start()
+    yield c
+    bridge.delivery.stop()
+
+
+def test_telegram_test_message_reports_api_error(linked_client, monkeypatch):
+    from telegram_delivery import TelegramApiError
+
+    def rejected(payload):
+        raise TelegramApiError("sendMessage: Bad Request: chat not found", error_code=400)
+
+    monkeypatch.setattr(main.tg_bridge.delivery, "send_fn", rejected)
+    res = linked_client.post("/api/settings/telegram/test")
+    assert res.status_code == 502
+    assert "chat not found" in res.json()["detail"]
+
+
+def test_telegram_test_message_ok(linked_client, monkeypatch):
+    sent = []
+    monkeypatch.setattr(main.tg_bridge.delivery, "send_fn", sent.append)
+    assert linked_client.post("/api/settings/telegram/test").status_code == 200
+    assert [p["chat_id"] for p in sent] == ["555"]
+
+
+# ---------- Telegram chat state ----------
+def _chat_state_store(**kw):
+    from chat_state import ChatStateStore
+
+    return ChatStateStore(main.engine, main.telegram_chat_state, **kw)
+
+
+def test_chat_state_round_trips_view_mode_and_last_page():
+    store = _chat_state_store()
+    store.update("1001", view_mode="compact", last_mode="tasks", last_page=3)
+    assert store.flush() == 1
+
+    fresh = _chat_state_store()  # another worker / a restart
+    assert fresh.get("1001") == {"view_mode": "compact", "last_mode": "tasks", "last_page": 3}
+    assert fresh.get("1002") == {"view_mode": "expanded", "last_mode": None, "last_page": None}
+
+
+def test_bare_list_command_reopens_last_page(monkeypatch):
+    bridge = main.tg_bridge
+    monkeypatch.setattr(bridge, "chat_state", _chat_state_store())
+    bridge.chat_state.update("1003", last_mode="tasks", last_page=4)
+    assert bridge._list_page_arg("1003", "tasks", "") == 4
+    assert bridge._list_page_arg("1003", "tasks", "2") == 2
+    assert bridge._list_page_arg("1003", "today", "") == 1
+
+
+def test_chat_state_caps_unwritten_changes():
+    store = _chat_state_store(max_dirty=2)
+    for chat in ("2001", "2002", "2003"):
+        store.update(chat, last_page=1)
+    snap = store.snapshot()
+    assert snap["dirty"] == 2 and snap["droppedDirty"] == 1
+
+
+# ---------- webhook mode, several workers ----------
+def test_webhook_update_is_handled_by_one_worker_only(monkeypatch):
+    from ttl_cache import TTLCache
+
+    bridge = main.tg_bridge
+    handled = []
+    monkeypatch.setattr(bridge, "_handle_update", handled.append)
+    upd = {"update_id": 90001, "message": {"chat": {"id": 1}, "text": "/help"}}
+    assert bridge.process_webhook_update(upd) is True
+    # a second worker has its own (empty) in-process cache
+    monkeypatch.setattr(bridge, "_seen_updates", TTLCache(maxsize=100, ttl=60))
+    assert bridge.process_webhook_update(upd) is False
+    assert handled == [upd]
+
+
+def test_shared_rate_limit_spaces_slots_across_limiters():
+    from db_rate_limit import DbRateLimiter
+
+    a = DbRateLimiter(main.engine, main.telegram_rate)
+    b = DbRateLimiter(main.engine, main.telegram_rate)  # another worker
+    waits = [a.reserve("chat:3001", 1.0), b.reserve("chat:3001", 1.0), a.reserve("chat:3001", 1.0)]
+    assert waits[0] == 0.0
+    assert 0.9 < waits[1] <= 1.0 and 1.9 < waits[2] <= 2.0
+
+
+# ---------- session cache ----------
+def test_reading_telegram_settings_keeps_cached_sessions(linked_client):
+    linked_client.get("/api/settings/telegram")  # may issue the first link code
+    revoked = dict(main._session_revoked)
+    for _ in range(3):
+        assert linked_client.get("/api/settings/telegram").status_code == 200
+    assert dict(main._session_revoked) == revoked
+
+
+def test_session_revocation_is_not_evicted_by_other_users():
+    main.invalidate_user_sessions("revoked-user")
+    stamp = main._session_revoked_stamp("revoked-user")
+    for i in range(main._session_cache.maxsize + 10):
+        main.invalidate_user_sessions(f"other-{i}")
+    assert main._session_revoked_stamp("revoked-user") == stamp
+
+
+# ---------- pools ----------
+def test_async_mode_splits_the_pool_budget(monkeypatch):
+    monkeypatch.setattr(main, "DB_ASYNC", True)
+    sync, async_ = main.pool_sizes("sync"), main.pool_sizes("async")
+    assert sync[0] + async_[0] == main.DB_POOL_SIZE
+    assert sync[1] + async_[1] == main.DB_MAX_OVERFLOW